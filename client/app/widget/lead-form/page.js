@@ -20,6 +20,8 @@ export default function LeadFormPage() {
 	const [conversationId, setConversationId] = useState(null);
 	const scrollRef = useRef(null);
 	const socketRef = useRef(null);
+	// Streaming auto-replies (message-delta): stream_id -> { chunks: { seq: text }, replaced }
+	const streamsRef = useRef({});
 	const fileInputRef = useRef(null);
 	const [orgId, setOrgId] = useState(null);
 	const [accountId, setAccountId] = useState(null);
@@ -97,18 +99,25 @@ export default function LeadFormPage() {
 			if (!messageText && !imageUrl) return;
 
 			const newId = payload.message_doc?._id || payload.id || Date.now();
+			// A streamed reply's final message takes the place of its draft
+			const draftId = payload.stream_id ? `stream:${payload.stream_id}` : null;
+			if (payload.stream_id) {
+				streamsRef.current[payload.stream_id] = { chunks: {}, replaced: true };
+			}
 			setMessages(prev => {
-				if (prev.find(m => m.id === newId)) return prev;
-				return [
-					...prev,
-					{
-						id: newId,
-						text: imageUrl ? (messageText || 'Tệp đính kèm') : messageText,
-						image: imageUrl || null,
-						sender: 'bot',
-						time: new Date().toLocaleTimeString('vi-VN', { hour: '2-digit', minute: '2-digit' }),
-					},
-				];
+				if (prev.find(m => m.id === newId)) return draftId ? prev.filter(m => m.id !== draftId) : prev;
+				const message = {
+					id: newId,
+					text: imageUrl ? (messageText || 'Tệp đính kèm') : messageText,
+					image: imageUrl || null,
+					sender: 'bot',
+					time: new Date().toLocaleTimeString('vi-VN', { hour: '2-digit', minute: '2-digit' }),
+				};
+				const draftIndex = draftId ? prev.findIndex(m => m.id === draftId) : -1;
+				if (draftIndex === -1) return [...prev, message];
+				const next = prev.slice();
+				next[draftIndex] = message;
+				return next;
 			});
 
 			window.parent.postMessage(
@@ -117,9 +126,65 @@ export default function LeadFormPage() {
 			);
 		};
 
+		const handleMessageDelta = (payload) => {
+			if (payload.conv_id !== conversationId || !payload.stream_id) return;
+
+			const draftId = `stream:${payload.stream_id}`;
+			const streams = streamsRef.current;
+			const stream = streams[payload.stream_id] || (streams[payload.stream_id] = { chunks: {}, replaced: false });
+			if (payload.done) delete streams[payload.stream_id];
+			// The final new-message is already shown
+			if (stream.replaced) return;
+
+			if (payload.aborted) {
+				setMessages(prev => prev.filter(m => m.id !== draftId));
+				return;
+			}
+			if (payload.delta) stream.chunks[payload.seq] = payload.delta;
+			// Chunks are keyed by seq, so repeated or reordered events do not garble the text
+			const text = Object.keys(stream.chunks)
+				.map(Number)
+				.sort((a, b) => a - b)
+				.map(seq => stream.chunks[seq])
+				.join('');
+			if (!text) return;
+
+			setMessages(prev => {
+				const draftIndex = prev.findIndex(m => m.id === draftId);
+				if (draftIndex === -1) {
+					return [
+						...prev,
+						{
+							id: draftId,
+							text,
+							image: null,
+							sender: 'bot',
+							draft: true,
+							time: new Date().toLocaleTimeString('vi-VN', { hour: '2-digit', minute: '2-digit' }),
+						},
+					];
+				}
+				const next = prev.slice();
+				next[draftIndex] = { ...prev[draftIndex], text };
+				return next;
+			});
+		};
+
+		// Streamed replies go to this conversation's room only; rooms are lost on reconnect
+		const joinConversation = () => {
+			socketRef.current?.emit('join-conversation', { conv_id: conversationId });
+		};
+
 		socketRef.current.on('new-message', handleNewMessage);
+		socketRef.current.on('message-delta', handleMessageDelta);
+		socketRef.current.on('connect', joinConversation);
+		joinConversation();
 		return () => {
-			if (socketRef.current) socketRef.current.off('new-message', handleNewMessage);
+			if (socketRef.current) {
+				socketRef.current.off('new-message', handleNewMessage);
+				socketRef.current.off('message-delta', handleMessageDelta);
+				socketRef.current.off('connect', joinConversation);
+			}
 		};
 	}, [conversationId]);
 
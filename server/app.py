@@ -5,7 +5,7 @@ Test Authentication Backend - Flask Application
 import eventlet
 eventlet.monkey_patch()
 
-from flask import Flask, jsonify, send_from_directory
+from flask import Flask, jsonify, send_from_directory, request, g
 from flask_cors import CORS
 from flask_pymongo import PyMongo
 from pymongo import MongoClient
@@ -19,7 +19,15 @@ from flask_login import LoginManager
 from flask_socketio import SocketIO
 from flask_apscheduler import APScheduler
 from datetime import timedelta
+from utils import metrics, socket_replay
+from utils.compression import init_compression
+from utils.message_dedup import init_message_dedup
+from utils.password_hashing import PasswordHasherBusy, busy_response
+from utils.serialization import AppJSONProvider
+from utils.mongo_monitor import MongoCommandListener, with_job_context
+from utils.leader import LeaderElector, leader_job
 import os
+import time
 import logging
 
 # Configure logging
@@ -33,13 +41,16 @@ def create_app(env=None):
         env = os.getenv('FLASK_ENV', 'development')
     
     app = Flask(__name__)
+    # Encode ObjectId/datetime in responses (orjson-backed when installed)
+    app.json = AppJSONProvider(app)
     
     # Load configuration
     app.config.from_object(config[env])
     
     # Setup MongoDB connection
     try:
-        mongo_client = MongoClient(app.config['MONGO_URI'])
+        # Command listener attributes every query to the current route/job (see /metrics)
+        mongo_client = MongoClient(app.config['MONGO_URI'], event_listeners=[MongoCommandListener()])
         # Verify connection
         mongo_client.admin.command('ping')
         logger.info(f"Connected to MongoDB: {app.config['MONGO_URI']}")
@@ -102,11 +113,73 @@ def create_app(env=None):
     except Exception as e:
         logger.info(f"File routes not available: {e}")
 
+    # Register blob store endpoints (chat image uploads)
+    from routes.blobs import blobs_bp
+    app.register_blueprint(blobs_bp)
+
     # Attach mongo client to app for other modules
     app.mongo_client = mongo_client
 
+    # Verification / reset emails are queued and sent in the background (see utils/email_outbox.py)
+    if Config.EMAIL_OUTBOX_ENABLED:
+        from utils.email_outbox import init_email_outbox
+        app.email_outbox = init_email_outbox(mongo_client)
+
+    # Optionally record sanitized webhook bodies for local replay (tools/replay_webhooks.py)
+    if Config.WEBHOOK_RECORD_DIR:
+        from utils.webhook_recorder import record_webhook
+
+        recorded_endpoints = {
+            'zalo.webhook_event': 'zalo',
+            'facebook.webhook_event': 'facebook',
+            'widget.send_conversation_message': 'widget',
+        }
+
+        @app.before_request
+        def _record_webhook():
+            platform = recorded_endpoints.get(request.endpoint)
+            if platform and request.method == 'POST':
+                record_webhook(platform, request.path, request.headers, request.get_json(silent=True))
+
+    # Request timing metrics (exposed on /metrics)
+    @app.before_request
+    def _metrics_start():
+        g._metrics_start = time.perf_counter()
+        metrics.http_requests_in_flight.inc()
+
+    @app.after_request
+    def _metrics_status(response):
+        g._metrics_status = response.status_code
+        return response
+
+    # Webhook dedup claims are released when the request fails before the message is stored
+    init_message_dedup(app)
+
+    # Negotiated gzip/brotli for large JSON responses (utils/compression.py)
+    init_compression(app)
+
+    @app.teardown_request
+    def _metrics_end(exc):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return
+        metrics.http_requests_in_flight.dec()
+        endpoint = request.endpoint or 'unmatched'
+        blueprint = request.blueprint or 'app'
+        status = g.pop('_metrics_status', 500)
+        metrics.http_request_duration.observe(time.perf_counter() - start, (blueprint, endpoint, request.method))
+        metrics.http_requests_total.inc((blueprint, endpoint, request.method, str(status)))
+
     # Initialize Socket.IO
-    app.socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet', manage_middleware=False)
+    app.socketio = SocketIO(
+        app, cors_allowed_origins="*", async_mode='eventlet', manage_middleware=False,
+        # Compresses long-polling payloads (e.g. large new-message batches) above the threshold
+        http_compression=app.config['SOCKETIO_HTTP_COMPRESSION'],
+        compression_threshold=app.config['SOCKETIO_COMPRESSION_THRESHOLD'],
+    )
+    metrics.instrument_socketio(app.socketio)
+    # Org-room new-message/update-conversation emits are kept for `resume` (utils/socket_replay.py)
+    replay_emit = socket_replay.install(app.socketio)
 
     # SECURITY FIX: Register WebSocket connection handler to join account-specific rooms
     @app.socketio.on('connect')
@@ -178,6 +251,68 @@ def create_app(env=None):
             logger.error(f"Error in WebSocket connect handler: {e}", exc_info=True)
             return False  # Reject connection on error
 
+    @app.socketio.on('resume')
+    def socket_resume(data):
+        """Replay this organization's new-message/update-conversation events after `last_seq`.
+
+        Emits `resume-gap` when they cannot all be replayed; the client then
+        catches up with GET /api/integrations/conversations/changes.
+        """
+        try:
+            from flask_socketio import rooms
+            last_seq = (data or {}).get('last_seq') if isinstance(data, dict) else None
+            org_rooms = [r for r in rooms() if r.startswith('organization:')]
+            events = socket_replay.events_since(org_rooms[0].split(':', 1)[1], last_seq) if org_rooms else None
+            if events is None:
+                socket_replay.socket_resume_total.inc(('gap',))
+                replay_emit('resume-gap', {'last_seq': socket_replay.latest_seq()}, room=request.sid)
+                return {'replayed': 0, 'gap': True}
+            for event, payload in events:
+                replay_emit(event, payload, room=request.sid)
+            socket_replay.socket_resume_total.inc(('replayed',))
+            replay_emit('resume-complete', {'replayed': len(events), 'last_seq': socket_replay.latest_seq()}, room=request.sid)
+            return {'replayed': len(events), 'gap': False}
+        except Exception as e:
+            logger.error(f"Error in socket resume handler: {e}")
+            # Still tell the client, so it falls back to GET .../conversations/changes
+            socket_replay.socket_resume_total.inc(('gap',))
+            try:
+                replay_emit('resume-gap', {'last_seq': socket_replay.latest_seq()}, room=request.sid)
+            except Exception as emit_error:
+                logger.error(f"Error emitting resume-gap: {emit_error}")
+            return {'replayed': 0, 'gap': True}
+
+    @app.socketio.on('join-conversation')
+    def socket_join_conversation(data):
+        """Join `conversation:<conv_id>` for per-conversation events (streamed widget replies).
+
+        Only conversations of the socket's organization can be joined, and a
+        socket follows one conversation at a time.
+        """
+        try:
+            from flask_socketio import rooms, join_room, leave_room
+            from models.conversation import ConversationModel
+            conv_id = (data or {}).get('conv_id') if isinstance(data, dict) else None
+            parts = str(conv_id or '').split(':')
+            org_rooms = [r for r in rooms() if r.startswith('organization:')]
+            if len(parts) != 3 or not org_rooms:
+                return {'joined': False}
+            platform, oa_id, sender_id = parts
+            conv = ConversationModel(app.mongo_client).find_by_oa_and_customer(
+                oa_id, f"{platform}:{sender_id}", organization_id=org_rooms[0].split(':', 1)[1],
+            )
+            if not conv:
+                return {'joined': False}
+            room = f"conversation:{conv_id}"
+            for r in rooms():
+                if r.startswith('conversation:') and r != room:
+                    leave_room(r)
+            join_room(room)
+            return {'joined': True}
+        except Exception as e:
+            logger.error(f"Error in socket join-conversation handler: {e}")
+            return {'joined': False}
+
     @app.socketio.on('complete-conversation')
     def socket_complete_conversation(data):
         try:
@@ -291,16 +426,23 @@ def create_app(env=None):
     scheduler.init_app(app)
     scheduler.start()
 
+    # Every process schedules the jobs, but only the lease holder runs them
+    elector = LeaderElector(mongo_client).start() if Config.SCHEDULER_LEADER_ELECTION else None
+    app.scheduler_elector = elector
+
+    def _job(name, func):
+        return with_job_context(name, leader_job(name, func, elector))
+
     # Schedule Zalo token refresh every 30 minutes
     try:
-        scheduler.add_job(id='zalo_token_refresh', func=lambda: refresh_expiring_tokens(app.mongo_client), trigger='interval', minutes=30)
+        scheduler.add_job(id='zalo_token_refresh', func=_job('zalo_token_refresh', lambda: refresh_expiring_tokens(app.mongo_client)), trigger='interval', minutes=30)
     except Exception:
         # If job exists or cannot be added, ignore
         pass
         
     # Schedule Facebook token refresh every 30 minutes (if available)
     try:
-        scheduler.add_job(id='facebook_token_refresh', func=lambda: facebook_refresh(app.mongo_client), trigger='interval', minutes=30)
+        scheduler.add_job(id='facebook_token_refresh', func=_job('facebook_token_refresh', lambda: facebook_refresh(app.mongo_client)), trigger='interval', minutes=30)
     except Exception:
         # If job exists or cannot be added, ignore
         pass
@@ -333,16 +475,32 @@ def create_app(env=None):
             logger.error(f"Error in lock expiration job: {e}")
 
     try:
-        scheduler.add_job(id='expire_conversation_locks', func=_expire_and_broadcast_locks, trigger='interval', seconds=60)
+        scheduler.add_job(id='expire_conversation_locks', func=_job('expire_conversation_locks', _expire_and_broadcast_locks), trigger='interval', seconds=60)
     except Exception:
         pass
 
     # Serve uploaded files
     @app.route('/uploads/avatars/<filename>')
     def serve_upload(filename):
-        """Serve uploaded avatar files"""
+        """Serve uploaded avatar files (?size=sm|md|lg for a thumbnail, see utils/thumbnails.py)"""
         try:
-            return send_from_directory(Config.UPLOAD_FOLDER, filename)
+            size = request.args.get('size')
+            if size:
+                from werkzeug.utils import safe_join
+                from utils import thumbnails
+                fmt = thumbnails.pick_format(request.args.get('format'), request.headers.get('Accept'))
+                src = safe_join(Config.UPLOAD_FOLDER, filename)
+                thumb = thumbnails.ensure_thumbnail(src, filename, size, fmt) if src else None
+                if thumb:
+                    response = send_from_directory(
+                        os.path.dirname(thumb), os.path.basename(thumb),
+                        mimetype=thumbnails.FORMATS[fmt], max_age=Config.AVATAR_CACHE_MAX_AGE,
+                    )
+                    if not request.args.get('format'):
+                        response.vary.add('Accept')
+                    return response
+            # Avatar filenames are unique per upload, so they can be cached for long
+            return send_from_directory(Config.UPLOAD_FOLDER, filename, max_age=Config.AVATAR_CACHE_MAX_AGE)
         except:
             logger.error(f"Failed to serve file: {filename}")
             return jsonify({'success': False, 'message': 'File not found'}), 404
@@ -356,11 +514,21 @@ def create_app(env=None):
             'environment': env
         }), 200
     
+    # Prometheus scrape endpoint
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        return metrics.render_prometheus(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+    
     # Error handlers
     @app.errorhandler(404)
     def not_found(error):
         return jsonify({'success': False, 'message': 'Not found'}), 404
     
+    # bcrypt queue full (utils/password_hashing.py) in a route that doesn't catch it itself
+    @app.errorhandler(PasswordHasherBusy)
+    def password_hasher_busy(error):
+        return busy_response()
+    
     @app.errorhandler(500)
     def internal_error(error):
         logger.error(f"Internal server error: {str(error)}")
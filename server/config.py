@@ -14,6 +14,8 @@ class Config:
     SMTP_PORT = int(os.getenv('SMTP_PORT'))
     SMTP_EMAIL = os.getenv('SMTP_EMAIL')
     SMTP_PASSWORD = os.getenv('SMTP_PASSWORD')
+    SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'True').lower() in ('1', 'true', 'yes')  # off for tools/debug_smtp_server.py
+    SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', 15))
     
     # Token configuration
     VERIFICATION_TOKEN_EXPIRY = int(os.getenv('VERIFICATION_TOKEN_EXPIRY', 86400))  # 24 hours
@@ -23,6 +25,8 @@ class Config:
     
     # Frontend URL
     FRONTEND_URL = os.getenv('FRONTEND_URL')
+    # Public origin of this API (e.g. https://api.example.com), for absolute links built outside a request
+    PUBLIC_BASE_URL = os.getenv('PUBLIC_BASE_URL', '')
     
     # CORS configuration
     CORS_ORIGINS = [
@@ -70,6 +74,110 @@ class Config:
     # When false, inbound messages will not trigger bot auto-replies by default.
     USE_BOT = os.getenv('USE_BOT', 'True').lower() in ('1', 'true', 'yes', 'y', 'on')
 
+    # Platform user profile cache (Facebook Graph / Zalo user detail)
+    PROFILE_CACHE_TTL_SECONDS = int(os.getenv('PROFILE_CACHE_TTL_SECONDS', 3600))  # serve without refetch
+    PROFILE_CACHE_STALE_SECONDS = int(os.getenv('PROFILE_CACHE_STALE_SECONDS', 86400))  # serve stale while refreshing
+    PROFILE_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv('PROFILE_CACHE_NEGATIVE_TTL_SECONDS', 300))  # cache failed fetches
+    PROFILE_CACHE_MAX_ENTRIES = int(os.getenv('PROFILE_CACHE_MAX_ENTRIES', 20000))
+
+    # Per-process caches of stored customers and of staff-linked Zalo ids; changes
+    # made by another process are only seen once these expire
+    CUSTOMER_CACHE_TTL_SECONDS = int(os.getenv('CUSTOMER_CACHE_TTL_SECONDS', 300))
+    CUSTOMER_CACHE_MAX_ENTRIES = int(os.getenv('CUSTOMER_CACHE_MAX_ENTRIES', 10000))
+    STAFF_ZALO_IDS_TTL_SECONDS = int(os.getenv('STAFF_ZALO_IDS_TTL_SECONDS', 60))
+
+    # Webhook de-duplication by platform message id (mid / msg_id)
+    MESSAGE_DEDUP_TTL_SECONDS = int(os.getenv('MESSAGE_DEDUP_TTL_SECONDS', 600))
+
+    # When set, sanitized webhook bodies are appended to <dir>/<platform>.jsonl
+    # for replay with tools/replay_webhooks.py
+    WEBHOOK_RECORD_DIR = os.getenv('WEBHOOK_RECORD_DIR')
+
+    # MongoDB commands slower than this are logged with their route and filter shape (0 disables)
+    MONGO_SLOW_QUERY_MS = int(os.getenv('MONGO_SLOW_QUERY_MS', 100))
+
+    # Message metadata: inline data URLs larger than this move to the blob store (BLOB_STORE_DIR)
+    MESSAGE_INLINE_IMAGE_MAX_BYTES = int(os.getenv('MESSAGE_INLINE_IMAGE_MAX_BYTES', 2048))
+
+    # Content-addressed blob store for chat images (files named by SHA-256)
+    BLOB_STORE_DIR = os.getenv('BLOB_STORE_DIR', os.path.join(os.path.dirname(__file__), 'uploads', 'blobs'))
+    BLOB_MAX_BYTES = int(os.getenv('BLOB_MAX_BYTES', 1024 * 1024))  # same limit as platform image uploads
+    BLOB_CACHE_MAX_AGE = int(os.getenv('BLOB_CACHE_MAX_AGE', 31536000))
+    AVATAR_CACHE_MAX_AGE = int(os.getenv('AVATAR_CACHE_MAX_AGE', 86400 * 30))  # avatar filenames are unique
+
+    # Avatar / chat image thumbnails (requires Pillow; originals are served without it)
+    THUMBNAIL_DIR = os.getenv('THUMBNAIL_DIR', os.path.join(os.path.dirname(__file__), 'uploads', 'thumbs'))
+    THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 2))
+    THUMBNAIL_JPEG_QUALITY = int(os.getenv('THUMBNAIL_JPEG_QUALITY', 82))
+
+    # Token refresh engine: integrations are claimed with a Mongo lease, refreshed concurrently
+    TOKEN_REFRESH_CONCURRENCY = int(os.getenv('TOKEN_REFRESH_CONCURRENCY', 4))
+    TOKEN_REFRESH_JITTER_SECONDS = float(os.getenv('TOKEN_REFRESH_JITTER_SECONDS', 3))
+    TOKEN_REFRESH_LEASE_SECONDS = int(os.getenv('TOKEN_REFRESH_LEASE_SECONDS', 120))  # > jitter + request timeout
+    TOKEN_REFRESH_MAX_BACKOFF_SECONDS = int(os.getenv('TOKEN_REFRESH_MAX_BACKOFF_SECONDS', 1800))
+
+    # Scheduled jobs run only on the process holding the Mongo scheduler lease
+    SCHEDULER_LEADER_ELECTION = os.getenv('SCHEDULER_LEADER_ELECTION', 'True').lower() in ('1', 'true', 'yes')
+    SCHEDULER_LEASE_SECONDS = int(os.getenv('SCHEDULER_LEASE_SECONDS', 30))  # fail-over time if the leader dies
+
+    # bcrypt runs on native threads (eventlet.tpool); at most this many hashes queued/running
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 16))
+    PASSWORD_HASH_QUEUE_TIMEOUT = float(os.getenv('PASSWORD_HASH_QUEUE_TIMEOUT', 10))
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 10))
+
+    # Customer/staff search: candidates fetched via the search-key indexes before ranking
+    SEARCH_MAX_CANDIDATES = int(os.getenv('SEARCH_MAX_CANDIDATES', 200))
+
+    # Email outbox: emails are queued in Mongo and sent by a background sender over a reused SMTP session
+    EMAIL_OUTBOX_ENABLED = os.getenv('EMAIL_OUTBOX_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+    EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', 20))
+    EMAIL_OUTBOX_POLL_SECONDS = float(os.getenv('EMAIL_OUTBOX_POLL_SECONDS', 5))
+    EMAIL_OUTBOX_LEASE_SECONDS = int(os.getenv('EMAIL_OUTBOX_LEASE_SECONDS', 120))  # a crashed sender's claim is retried after this
+    EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', 8))
+    EMAIL_OUTBOX_MAX_BACKOFF_SECONDS = int(os.getenv('EMAIL_OUTBOX_MAX_BACKOFF_SECONDS', 1800))
+    EMAIL_OUTBOX_RETENTION_DAYS = int(os.getenv('EMAIL_OUTBOX_RETENTION_DAYS', 7))  # sent emails are then removed (TTL)
+    EMAIL_SMTP_IDLE_SECONDS = int(os.getenv('EMAIL_SMTP_IDLE_SECONDS', 60))  # close the session after this long unused
+
+    # Per-organization inbox cache; a per-org version in Redis invalidates other processes' copies
+    INBOX_CACHE_ENABLED = os.getenv('INBOX_CACHE_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+    INBOX_CACHE_TTL_SECONDS = int(os.getenv('INBOX_CACHE_TTL_SECONDS', 300))  # safety net for writes outside ConversationModel
+    INBOX_CACHE_MAX_ORGS = int(os.getenv('INBOX_CACHE_MAX_ORGS', 500))
+    INBOX_CACHE_MAX_ROWS = int(os.getenv('INBOX_CACHE_MAX_ROWS', 5000))  # larger inboxes are not cached
+
+    # Reconnect catch-up: socket `resume` replays from a per-org ring buffer, else clients use /conversations/changes
+    SOCKET_REPLAY_BUFFER_SIZE = int(os.getenv('SOCKET_REPLAY_BUFFER_SIZE', 200))  # events kept per organization
+    SOCKET_REPLAY_MAX_AGE_SECONDS = int(os.getenv('SOCKET_REPLAY_MAX_AGE_SECONDS', 300))
+    SOCKET_REPLAY_MAX_ORGS = int(os.getenv('SOCKET_REPLAY_MAX_ORGS', 1000))
+    CHANGES_MAX_ROWS = int(os.getenv('CHANGES_MAX_ROWS', 500))  # per stream (conversations, messages) per call
+    CHANGES_SAFETY_SECONDS = int(os.getenv('CHANGES_SAFETY_SECONDS', 5))  # cursor lags "now" by this to cover in-flight writes
+
+    # Negotiated gzip/brotli for JSON/text responses (utils/compression.py); brotli needs the optional `brotli` package
+    COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'True').lower() in ('1', 'true', 'yes')
+    COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', 1024))
+    COMPRESSION_STREAM_MIN_BYTES = int(os.getenv('COMPRESSION_STREAM_MIN_BYTES', 256 * 1024))  # larger bodies are compressed while sent
+    COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 5))
+    COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 4))
+    SOCKETIO_HTTP_COMPRESSION = os.getenv('SOCKETIO_HTTP_COMPRESSION', 'True').lower() in ('1', 'true', 'yes')
+    SOCKETIO_COMPRESSION_THRESHOLD = int(os.getenv('SOCKETIO_COMPRESSION_THRESHOLD', 1024))  # smaller Socket.IO payloads are sent as-is
+
+    # Auto-reply waits for a conversation to go quiet, then answers all pending fragments at once
+    # (the window is shared through Redis, so workers behind one load balancer batch together)
+    AUTO_REPLY_DEBOUNCE_SECONDS = float(os.getenv('AUTO_REPLY_DEBOUNCE_SECONDS', 3))  # restarted by each new message
+    AUTO_REPLY_DEBOUNCE_MAX_SECONDS = float(os.getenv('AUTO_REPLY_DEBOUNCE_MAX_SECONDS', 10))  # longest wait after the first message
+
+    # External chat API used by auto-reply: whole-call deadline and circuit breaker (utils/chat_api.py)
+    CHAT_API_URL = os.getenv('CHAT_API_URL', 'https://microtunchat-app-1012095270393.us-central1.run.app/chat')
+    CHAT_API_CONNECT_TIMEOUT = float(os.getenv('CHAT_API_CONNECT_TIMEOUT', 5))
+    CHAT_API_DEADLINE_SECONDS = float(os.getenv('CHAT_API_DEADLINE_SECONDS', 45))
+    CHAT_API_BREAKER_FAILURE_RATE = float(os.getenv('CHAT_API_BREAKER_FAILURE_RATE', 0.5))
+    CHAT_API_BREAKER_WINDOW_SECONDS = int(os.getenv('CHAT_API_BREAKER_WINDOW_SECONDS', 60))
+    CHAT_API_BREAKER_MIN_CALLS = int(os.getenv('CHAT_API_BREAKER_MIN_CALLS', 5))  # fewer calls in the window never trip it
+    CHAT_API_BREAKER_OPEN_SECONDS = int(os.getenv('CHAT_API_BREAKER_OPEN_SECONDS', 30))  # then one probe call is let through
+
+    # Streaming widget replies: partial text is emitted as `message-delta`; empty URL keeps whole-answer replies
+    CHAT_API_STREAM_URL = os.getenv('CHAT_API_STREAM_URL', '')  # SSE or NDJSON variant of CHAT_API_URL
+    CHAT_STREAM_EMIT_INTERVAL_MS = int(os.getenv('CHAT_STREAM_EMIT_INTERVAL_MS', 100))  # deltas arriving faster are batched
+
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
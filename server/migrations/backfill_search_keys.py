@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Migration script to backfill search keys on customers and staff accounts
+
+Usage:
+    python migrations/backfill_search_keys.py [--batch-size 500] [--dry-run]
+
+This script:
+1. Sets search.tokens / search.phone / search.phone_rev on every customer
+   from its name and phone
+2. Sets search.tokens on every staff account from its name and username
+
+Customer and staff search only match documents that carry these keys. New and
+updated documents get them on write; this covers documents written before
+the search indexes existed. Documents are processed in _id order in batches
+and keys are recomputed, so the script can be stopped and re-run safely.
+"""
+
+import sys
+import os
+import logging
+import argparse
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from pymongo import MongoClient, UpdateOne
+from utils import search
+
+
+def _customer_keys(doc):
+    keys = {'tokens': search.tokenize(doc.get('name'))}
+    digits = search.normalize_phone(doc.get('phone'))
+    keys['phone'] = digits or None
+    keys['phone_rev'] = digits[::-1] or None
+    return keys
+
+
+def _staff_keys(doc):
+    return {'tokens': search.tokenize(doc.get('name'), doc.get('username'))}
+
+
+def _backfill(collection, query, projection, keys_for, batch_size, dry_run):
+    last_id = None
+    scanned = 0
+    updated = 0
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query['_id'] = {'$gt': last_id}
+        docs = list(collection.find(batch_query, projection).sort('_id', 1).limit(batch_size))
+        if not docs:
+            break
+        ops = []
+        for doc in docs:
+            keys = keys_for(doc)
+            if doc.get('search') != keys:
+                ops.append(UpdateOne({'_id': doc['_id']}, {'$set': {'search': keys}}))
+        if ops and not dry_run:
+            result = collection.bulk_write(ops, ordered=False)
+            updated += result.modified_count
+        elif dry_run:
+            updated += len(ops)
+        scanned += len(docs)
+        last_id = docs[-1]['_id']
+        logger.info(f"  {collection.name}: scanned {scanned}, updated {updated}")
+    return scanned, updated
+
+
+def backfill_search_keys(batch_size=500, dry_run=False):
+    """Run the migration"""
+    mongo_client = MongoClient(Config.MONGO_URI)
+    db = mongo_client.test_db
+    logger.info(f"Connected to MongoDB: {Config.MONGO_URI}")
+
+    # Instantiating the models creates the search indexes
+    from models.customer import CustomerModel
+    from models.user import UserModel
+    if not dry_run:
+        CustomerModel(mongo_client)
+        UserModel(mongo_client)
+
+    scanned, updated = _backfill(
+        db.customers, {}, {'name': 1, 'phone': 1, 'search': 1}, _customer_keys, batch_size, dry_run,
+    )
+    logger.info(f"✓ Customers: scanned {scanned}, updated {updated}{' (dry run)' if dry_run else ''}")
+
+    scanned, updated = _backfill(
+        db.users, {'role': 'staff'}, {'name': 1, 'username': 1, 'search': 1}, _staff_keys, batch_size, dry_run,
+    )
+    logger.info(f"✓ Staff accounts: scanned {scanned}, updated {updated}{' (dry run)' if dry_run else ''}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill customer/staff search keys')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help='report how many documents would change without writing')
+    args = parser.parse_args()
+    backfill_search_keys(batch_size=args.batch_size, dry_run=args.dry_run)
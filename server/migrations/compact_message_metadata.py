@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Migration script to compact message metadata in existing documents
+
+Usage:
+    python migrations/compact_message_metadata.py [--batch-size 500] [--dry-run]
+
+This script:
+1. Copies blobs from the old message_blobs collection into the blob store
+   (BLOB_STORE_DIR); ids are the same SHA-256, so existing
+   metadata.image_blob_id values keep resolving at /api/blobs/<id>
+2. Trims metadata.api_response / metadata.send_response to delivery status and ids
+3. Moves inline data-URL images (metadata.image) larger than
+   MESSAGE_INLINE_IMAGE_MAX_BYTES to the blob store, leaving
+   metadata.image_blob_id on the message
+
+Once it has run, the message_blobs collection is no longer read and can be dropped.
+
+Messages are processed in _id order in batches, so the script can be stopped
+and re-run; already-compacted documents are left unchanged.
+"""
+
+import sys
+import os
+import hashlib
+import logging
+import argparse
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from pymongo import MongoClient, UpdateOne
+
+
+def _dry_run_blob(data):
+    """Stands in for the blob store during --dry-run: computes the id, writes nothing."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def copy_legacy_blobs(db, dry_run=False):
+    """Copy message_blobs documents into the blob store; returns the number copied."""
+    from utils.blob_store import BlobError, put_blob, blob_info
+
+    copied = 0
+    for doc in db.message_blobs.find({}, {'data': 1}):
+        if blob_info(doc['_id']):
+            continue
+        if not dry_run:
+            try:
+                blob_id, _ = put_blob(bytes(doc['data']))
+            except BlobError as e:
+                logger.warning(f"  Blob {doc['_id']} not copied: {e}")
+                continue
+            if blob_id != doc['_id']:
+                logger.warning(f"  Blob {doc['_id']} content does not match its id; stored as {blob_id}")
+                continue
+        copied += 1
+    logger.info(f"  Copied {copied} blobs from message_blobs{' (dry run)' if dry_run else ''}")
+    return copied
+
+
+def compact_message_metadata(batch_size=500, dry_run=False):
+    """Run the migration"""
+    from utils.message_compaction import compact_metadata
+
+    mongo_client = MongoClient(Config.MONGO_URI)
+    db = mongo_client.test_db
+    logger.info(f"Connected to MongoDB: {Config.MONGO_URI}")
+    copy_legacy_blobs(db, dry_run=dry_run)
+
+    query = {'$or': [
+        {'metadata.api_response': {'$exists': True}},
+        {'metadata.send_response': {'$exists': True}},
+        {'metadata.image': {'$regex': '^data:'}},
+    ]}
+    last_id = None
+    scanned = 0
+    updated = 0
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query['_id'] = {'$gt': last_id}
+        docs = list(db.messages.find(batch_query, {'metadata': 1}).sort('_id', 1).limit(batch_size))
+        if not docs:
+            break
+        ops = []
+        for doc in docs:
+            metadata = doc.get('metadata')
+            compacted = compact_metadata(metadata, _dry_run_blob) if dry_run else compact_metadata(metadata)
+            if compacted != metadata:
+                ops.append(UpdateOne({'_id': doc['_id']}, {'$set': {'metadata': compacted}}))
+        if ops and not dry_run:
+            result = db.messages.bulk_write(ops, ordered=False)
+            updated += result.modified_count
+        elif dry_run:
+            updated += len(ops)
+        scanned += len(docs)
+        last_id = docs[-1]['_id']
+        logger.info(f"  Scanned {scanned} messages, compacted {updated}")
+
+    logger.info(f"✓ Done: scanned {scanned} messages, compacted {updated}{' (dry run)' if dry_run else ''}")
+    return updated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compact message metadata')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--dry-run', action='store_true', help='report how many messages would change without writing')
+    args = parser.parse_args()
+    compact_message_metadata(batch_size=args.batch_size, dry_run=args.dry_run)
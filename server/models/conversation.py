@@ -4,9 +4,68 @@ from pymongo import MongoClient
 from bson.objectid import ObjectId
 from flask import current_app
 from config import Config
+from utils.serialization import serialize_doc
+from utils import inbox_cache
 
 logger = logging.getLogger(__name__)
 
+# Field projections per use case. Methods take `profile=` and fall back to the
+# full document when it is None, so existing callers are unaffected.
+PROJECTIONS = {
+    # Conversation list / inbox: what the list endpoints render per row
+    'inbox': {
+        '_id': 1, 'oa_id': 1, 'customer_id': 1, 'platform': 1,
+        'chatbot_id': 1, 'chatbot_info': 1, 'accountId': 1, 'organizationId': 1,
+        'customer_info.name': 1, 'customer_info.avatar': 1,
+        'customer_info.phone': 1, 'customer_info.note': 1,
+        'last_message.text': 1, 'last_message.created_at': 1,
+        'unread_count': 1, 'bot_reply': 1, 'bot-reply': 1, 'tags': 1,
+        'current_handler': 1, 'lock_expires_at': 1, 'updated_at': 1, 'version': 1,
+    },
+}
+
+
+def _projection(profile, nickname_key=None):
+    """Resolve a projection profile; the inbox only needs the viewer's nickname."""
+    if profile is None:
+        return None
+    projection = dict(PROJECTIONS[profile])
+    if nickname_key:
+        projection[f'nicknames.{nickname_key}'] = 1
+    return projection
+
+
+def _versioned(update):
+    """Add the conversation version bump to a Mongo update document.
+
+    Every write to a conversation increments `version`, which the list and
+    message endpoints fold into their ETags.
+    """
+    update = dict(update)
+    inc = dict(update.get('$inc') or {})
+    inc['version'] = 1
+    update['$inc'] = inc
+    return update
+
+
+def _project(doc, projection):
+    """Apply a Mongo-style inclusion projection to an in-memory document."""
+    out = {}
+    for path in projection:
+        parts = path.split('.')
+        src = doc
+        for part in parts:
+            if not isinstance(src, dict) or part not in src:
+                break
+            src = src[part]
+        else:
+            dest = out
+            for part in parts[:-1]:
+                dest = dest.setdefault(part, {})
+            dest[parts[-1]] = src
+    return out
+
+
 class ConversationModel:
     def __init__(self, mongo_client):
         self.client = mongo_client
@@ -98,50 +157,95 @@ class ConversationModel:
         except Exception as e:
             logger.warning(f"Error creating organizationId+customer_id index: {e}")
 
+        # Delta sync (/conversations/changes) scans an organization by (updated_at, _id)
+        try:
+            self.collection.create_index([('organizationId', 1), ('updated_at', 1), ('_id', 1)])
+        except Exception as e:
+            logger.warning(f"Error creating organizationId+updated_at index: {e}")
+
     def _serialize(self, doc, current_user_id=None):
         if not doc:
             return None
-        out = dict(doc)
+        out = serialize_doc(doc)
 
-        nickname = out.get('nicknames', {})
-        default_name = out.get('customer_info', {}).get('name', 'Khách hàng')
+        nickname = out.get('nicknames') or {}
+        default_name = (out.get('customer_info') or {}).get('name', 'Khách hàng')
 
         if current_user_id and current_user_id in nickname:
             out['display_name'] = nickname[current_user_id]
         else:
             out['display_name'] = default_name
-        
-        if out.get('_id') is not None:
-            try:
-                out['_id'] = str(out['_id'])
-            except Exception:
-                pass
-        for k, v in list(out.items()):
-            try:
-                if hasattr(v, 'isoformat') and callable(getattr(v, 'isoformat')):
-                    out[k] = v.isoformat() + 'Z'
-                elif isinstance(v, dict):
-                    # Recursively serialize nested dicts (e.g., last_message)
-                    for nested_k, nested_v in v.items():
-                        if hasattr(nested_v, 'isoformat') and callable(getattr(nested_v, 'isoformat')):
-                            v[nested_k] = nested_v.isoformat() + 'Z'
-            except Exception:
-                pass
-
-        # Ensure current_handler presence and serialize lock_expires_at
-        if out.get('current_handler') and isinstance(out.get('current_handler'), dict):
-            # keep as-is; name/accountId should be present
-            pass
-        if out.get('lock_expires_at'):
-            try:
-                le = out.get('lock_expires_at')
-                if hasattr(le, 'isoformat') and callable(getattr(le, 'isoformat')):
-                    out['lock_expires_at'] = le.isoformat() + 'Z'
-            except Exception:
-                pass
 
         return out
 
+    # ---- Inbox cache (see utils/inbox_cache.py) ----
+
+    def _sync_inbox(self, doc):
+        """Push a freshly written raw document into its organization's cached inbox."""
+        if not doc or not Config.INBOX_CACHE_ENABLED:
+            return
+        org_id = doc.get('organizationId')
+        if not org_id:
+            return
+        try:
+            row = self._serialize(_project(doc, _projection('inbox', str(org_id))))
+            inbox_cache.apply(org_id, row)
+        except Exception as e:
+            logger.warning(f"Inbox cache update failed for conversation {doc.get('_id')}: {e}")
+
+    def refresh_inbox_row(self, conversation_id):
+        """Re-read one conversation into the inbox cache after a direct collection write."""
+        if not Config.INBOX_CACHE_ENABLED:
+            return
+        try:
+            conv_obj_id = ObjectId(conversation_id)
+        except Exception:
+            conv_obj_id = conversation_id
+        self._sync_inbox(self.collection.find_one({'_id': conv_obj_id}))
+
+    def list_inbox(self, organization_id):
+        """
+        All conversations of an organization in the 'inbox' projection, newest
+        first, served from the inbox cache. Returns (rows, complete); complete
+        is False when the organization has more than INBOX_CACHE_MAX_ROWS
+        conversations, in which case only the newest are returned.
+        """
+        max_rows = Config.INBOX_CACHE_MAX_ROWS
+
+        def load():
+            cursor = self.collection.find(
+                {'organizationId': organization_id}, _projection('inbox', str(organization_id)),
+            ).sort('updated_at', -1).limit(max_rows + 1)
+            docs = [self._serialize(d) for d in cursor]
+            return docs[:max_rows], len(docs) <= max_rows
+
+        if not Config.INBOX_CACHE_ENABLED:
+            return load()
+        return inbox_cache.get_rows(organization_id, load)
+
+    def _cached_inbox(self, organization_id, profile, nickname_key):
+        """Cached inbox rows when a query can be answered from them, else None."""
+        if profile != 'inbox' or not organization_id or not Config.INBOX_CACHE_ENABLED:
+            return None
+        if nickname_key and nickname_key != str(organization_id):
+            return None
+        rows, complete = self.list_inbox(organization_id)
+        return rows if complete else None
+
+    def set_tags_by_id(self, conversation_id, tags):
+        """Set the conversation tag (e.g. 'bot-failed') and keep the inbox cache current."""
+        try:
+            conv_obj_id = ObjectId(conversation_id)
+        except Exception:
+            conv_obj_id = conversation_id
+        result = self.collection.find_one_and_update(
+            {'_id': conv_obj_id},
+            _versioned({'$set': {'tags': tags, 'updated_at': datetime.utcnow()}}),
+            return_document=True
+        )
+        self._sync_inbox(result)
+        return self._serialize(result)
+
     def upsert_conversation(self, oa_id, customer_id, last_message_text=None, last_message_created_at=None, 
                            direction='in', customer_info=None, increment_unread=False, chatbot_id=None, chatbot_info=None, account_id=None, organization_id=None):
         """
@@ -230,7 +334,7 @@ class ConversationModel:
         # Upsert conversation with account isolation
         result = self.collection.find_one_and_update(
             query,
-            update_op,
+            _versioned(update_op),
             upsert=True,
             return_document=True
         )
@@ -249,12 +353,13 @@ class ConversationModel:
             # Compare and update if needed
             existing_tag = result.get('tags')
             if existing_tag == 'bot-failed':
+                self._sync_inbox(result)
                 return self._serialize(result)  # preserve it as-is
             if desired_tag != existing_tag:
                 if desired_tag:
-                    self.collection.update_one({'_id': result.get('_id')}, {'$set': {'tags': desired_tag, 'updated_at': now}})
+                    self.collection.update_one({'_id': result.get('_id')}, _versioned({'$set': {'tags': desired_tag, 'updated_at': now}}))
                 else:
-                    self.collection.update_one({'_id': result.get('_id')}, {'$unset': {'tags': ''}, '$set': {'updated_at': now}})
+                    self.collection.update_one({'_id': result.get('_id')}, _versioned({'$unset': {'tags': ''}, '$set': {'updated_at': now}}))
                 # refresh
                 result = self.collection.find_one({'_id': result.get('_id')})
         except Exception:
@@ -264,6 +369,7 @@ class ConversationModel:
             except Exception:
                 pass
 
+        self._sync_inbox(result)
         return self._serialize(result)
 
     def find_by_oa_and_customer(self, oa_id, customer_id, account_id=None, organization_id=None):
@@ -287,15 +393,23 @@ class ConversationModel:
         
         return self._serialize(doc)
 
-    def find_by_oa(self, oa_id, limit=100, skip=0, account_id=None):
+    def find_by_oa(self, oa_id, limit=100, skip=0, account_id=None, profile=None, nickname_key=None, organization_id=None):
         """Find all conversations for an OA, sorted by updated_at descending
         
         SECURITY FIX: If account_id is provided, filter by it to ensure account isolation.
+        profile: optional key of PROJECTIONS (e.g. 'inbox') to fetch only listed fields.
+        organization_id: restrict to one organization; with profile='inbox' this
+        is served from the inbox cache.
         """
+        cached = self._cached_inbox(organization_id, profile, nickname_key) if not account_id else None
+        if cached is not None:
+            return [c for c in cached if c.get('oa_id') == oa_id][skip:skip + limit]
         query = {'oa_id': oa_id}
+        if organization_id:
+            query['organizationId'] = organization_id
         if account_id:
             query['accountId'] = account_id
-        cursor = self.collection.find(query).sort('updated_at', -1).skip(skip).limit(limit)
+        cursor = self.collection.find(query, _projection(profile, nickname_key)).sort('updated_at', -1).skip(skip).limit(limit)
         docs = [self._serialize(d) for d in list(cursor)]
         return docs
 
@@ -312,14 +426,15 @@ class ConversationModel:
             query['accountId'] = account_id
         result = self.collection.find_one_and_update(
             query,
-            {
+            _versioned({
                 '$set': {
                     'unread_count': 0,
                     'updated_at': datetime.utcnow(),
                 }
-            },
+            }),
             return_document=True
         )
+        self._sync_inbox(result)
         return self._serialize(result)
 
     def get_conversation_id(self, oa_id, customer_id):
@@ -342,25 +457,88 @@ class ConversationModel:
         docs = [self._serialize(d) for d in list(cursor)]
         return docs
 
-    def find_by_chatbot_id(self, chatbot_id, limit=2000, skip=0, account_id=None, organization_id=None):
+    def find_by_chatbot_id(self, chatbot_id, limit=2000, skip=0, account_id=None, organization_id=None, profile=None, nickname_key=None):
         """Find all conversations for a chatbot_id, sorted by updated_at descending
         
         NEW: If organization_id is provided, filter by it (primary).
         If account_id is provided (legacy), filter by it (fallback).
+        profile: optional key of PROJECTIONS (e.g. 'inbox') to fetch only listed fields.
         """
         if not chatbot_id:
             return []
+        cached = self._cached_inbox(organization_id, profile, nickname_key)
+        if cached is not None:
+            return [c for c in cached if c.get('chatbot_id') == chatbot_id][skip:skip + limit]
         query = {'chatbot_id': chatbot_id}
         if organization_id:
             query['organizationId'] = organization_id
         elif account_id:
             query['accountId'] = account_id
-        cursor = self.collection.find(query).sort('updated_at', -1).skip(skip).limit(limit)
+        cursor = self.collection.find(query, _projection(profile, nickname_key)).sort('updated_at', -1).skip(skip).limit(limit)
         logger.info(query)
         docs = [self._serialize(d) for d in list(cursor)]
         return docs
 
+    def set_oa_id(self, conversation_id, oa_id):
+        """Fill in the oa_id of a conversation stored without one (earlier bug).
+
+        Returns the updated raw document, or None.
+        """
+        try:
+            conv_obj_id = ObjectId(conversation_id)
+        except Exception:
+            conv_obj_id = conversation_id
+        result = self.collection.find_one_and_update(
+            {'_id': conv_obj_id},
+            _versioned({'$set': {'oa_id': oa_id, 'updated_at': datetime.utcnow()}}),
+            return_document=True,
+        )
+        self._sync_inbox(result)
+        return result
+
     # Locking API
+    def set_handler_staff_zalo_id(self, conversation_id, staff_zalo_id):
+        """Record the handling staff member's personal Zalo id, used to forward customer messages."""
+        try:
+            conv_obj_id = ObjectId(conversation_id)
+        except Exception:
+            conv_obj_id = conversation_id
+        result = self.collection.find_one_and_update(
+            {'_id': conv_obj_id},
+            _versioned({'$set': {'current_handler.staff_zalo_id': str(staff_zalo_id)}}),
+            return_document=True,
+        )
+        self._sync_inbox(result)
+        return self._serialize(result)
+
+    def pseudo_lock(self, conversation_id, handler_name, staff_zalo_id, handler_account_id=None, ttl_seconds=300):
+        """Lock a conversation for a staff member known only by their Zalo id.
+
+        Unlike lock_by_id, an existing handler is overwritten. Returns the serialized document.
+        """
+        try:
+            conv_obj_id = ObjectId(conversation_id)
+        except Exception:
+            conv_obj_id = conversation_id
+        now = datetime.utcnow()
+        result = self.collection.find_one_and_update(
+            {'_id': conv_obj_id},
+            _versioned({'$set': {
+                'current_handler': {
+                    'accountId': handler_account_id,
+                    'name': handler_name,
+                    'started_at': now,
+                    'staff_zalo_id': str(staff_zalo_id),  # Store staff zalo id for forwarding
+                },
+                'lock_expires_at': now + timedelta(seconds=int(ttl_seconds)),
+                'updated_at': now,
+                'tags': 'staff-interacting',
+            }}),
+            return_document=True,
+        )
+        self._sync_inbox(result)
+        return self._serialize(result)
+
     def lock_by_id(self, conversation_id, handler_account_id, handler_name, ttl_seconds=300):
         """Acquire a lock for a conversation by conversation _id (string or ObjectId).
         Returns the serialized updated document or None if failed.
@@ -388,7 +566,7 @@ class ConversationModel:
         
         result = self.collection.find_one_and_update(
             {'_id': conv_obj_id, '$or': [{'current_handler': None}, {'lock_expires_at': {'$lte': now}}]},
-            {
+            _versioned({
                 '$set': {
                     'current_handler': {
                         'accountId': handler_account_id,
@@ -399,9 +577,10 @@ class ConversationModel:
                     'updated_at': now,
                     'tags': 'staff-interacting',
                 }
-            },
+            }),
             return_document=True
         )
+        self._sync_inbox(result)
         return self._serialize(result)
 
     def set_handler_if_unset(self, conversation_id, handler_account_id, handler_name):
@@ -436,7 +615,7 @@ class ConversationModel:
                     {'current_handler': {'$exists': False}}
                 ]
             },
-            {
+            _versioned({
                 '$set': {
                     'current_handler': {
                         'accountId': handler_account_id,
@@ -446,9 +625,10 @@ class ConversationModel:
                     'updated_at': now,
                     'tags': 'staff-interacting',
                 }
-            },
+            }),
             return_document=True
         )
+        self._sync_inbox(result)
         return self._serialize(result)
 
     def unlock_by_id(self, conversation_id, requester_account_id=None, force=False):
@@ -468,10 +648,10 @@ class ConversationModel:
         if not force and requester_account_id:
             res = self.collection.find_one_and_update(
                 {'_id': conv_obj_id, 'current_handler.accountId': requester_account_id},
-                {
+                _versioned({
                     '$set': {'updated_at': datetime.utcnow()},
                     '$unset': {'current_handler': '', 'lock_expires_at': ''}
-                },
+                }),
                 return_document=True
             )
             # After unlocking, adjust tags: if bot_reply is enabled, set bot-interacting, otherwise remove tags
@@ -479,32 +659,34 @@ class ConversationModel:
                 if res:
                     bot_flag = res.get('bot_reply') if 'bot_reply' in res else res.get('bot-reply')
                     if bot_flag:
-                        self.collection.update_one({'_id': res.get('_id')}, {'$set': {'tags': 'bot-interacting', 'updated_at': datetime.utcnow()}})
+                        self.collection.update_one({'_id': res.get('_id')}, _versioned({'$set': {'tags': 'bot-interacting', 'updated_at': datetime.utcnow()}}))
                     else:
-                        self.collection.update_one({'_id': res.get('_id')}, {'$unset': {'tags': ''}, '$set': {'updated_at': datetime.utcnow()}})
+                        self.collection.update_one({'_id': res.get('_id')}, _versioned({'$unset': {'tags': ''}, '$set': {'updated_at': datetime.utcnow()}}))
                     res = self.collection.find_one({'_id': res.get('_id')})
             except Exception:
                 pass
+            self._sync_inbox(res)
             return self._serialize(res)
         else:
             res = self.collection.find_one_and_update(
                 {'_id': conv_obj_id},
-                {
+                _versioned({
                     '$set': {'updated_at': datetime.utcnow()},
                     '$unset': {'current_handler': '', 'lock_expires_at': ''}
-                },
+                }),
                 return_document=True
             )
             try:
                 if res:
                     bot_flag = res.get('bot_reply') if 'bot_reply' in res else res.get('bot-reply')
                     if bot_flag:
-                        self.collection.update_one({'_id': res.get('_id')}, {'$set': {'tags': 'bot-interacting', 'updated_at': datetime.utcnow()}})
+                        self.collection.update_one({'_id': res.get('_id')}, _versioned({'$set': {'tags': 'bot-interacting', 'updated_at': datetime.utcnow()}}))
                     else:
-                        self.collection.update_one({'_id': res.get('_id')}, {'$unset': {'tags': ''}, '$set': {'updated_at': datetime.utcnow()}})
+                        self.collection.update_one({'_id': res.get('_id')}, _versioned({'$unset': {'tags': ''}, '$set': {'updated_at': datetime.utcnow()}}))
                     res = self.collection.find_one({'_id': res.get('_id')})
             except Exception:
                 pass
+            self._sync_inbox(res)
             return self._serialize(res)
 
     def expire_locks(self):
@@ -515,18 +697,20 @@ class ConversationModel:
             return []
         updated_ids = [r.get('_id') for r in res if r.get('_id')]
         # unset fields for these docs
-        self.collection.update_many({'_id': {'$in': updated_ids}}, {'$set': {'updated_at': now}, '$unset': {'current_handler': '', 'lock_expires_at': ''}})
+        self.collection.update_many({'_id': {'$in': updated_ids}}, _versioned({'$set': {'updated_at': now}, '$unset': {'current_handler': '', 'lock_expires_at': ''}}))
 
         # After expiring locks, set/remove tags according to bot_reply
         try:
             # For docs with bot_reply True -> set bot-interacting
-            self.collection.update_many({'_id': {'$in': updated_ids}, 'bot_reply': True}, {'$set': {'tags': 'bot-interacting', 'updated_at': now}})
+            self.collection.update_many({'_id': {'$in': updated_ids}, 'bot_reply': True}, _versioned({'$set': {'tags': 'bot-interacting', 'updated_at': now}}))
             # For docs without bot_reply -> remove tags
-            self.collection.update_many({'_id': {'$in': updated_ids}, '$or': [{'bot_reply': False}, {'bot_reply': {'$exists': False}}, {'bot-reply': False}]}, {'$unset': {'tags': ''}, '$set': {'updated_at': now}})
+            self.collection.update_many({'_id': {'$in': updated_ids}, '$or': [{'bot_reply': False}, {'bot_reply': {'$exists': False}}, {'bot-reply': False}]}, _versioned({'$unset': {'tags': ''}, '$set': {'updated_at': now}}))
         except Exception:
             pass
 
         docs = list(self.collection.find({'_id': {'$in': updated_ids}}))
+        for d in docs:
+            self._sync_inbox(d)
         return [self._serialize(d) for d in docs]
 
     def update_nickname(self, oa_id, customer_id, user_id, nick_name, account_id=None, organization_id=None):
@@ -542,14 +726,15 @@ class ConversationModel:
             query['accountId'] = account_id
         result = self.collection.find_one_and_update(
             query,
-            {
+            _versioned({
                 '$set': {
                     f'nicknames.{organization_id}': nick_name,
                     'updated_at': datetime.utcnow(),
                 }
-            },
+            }),
             return_document=True
         )
+        self._sync_inbox(result)
         return self._serialize(result)
 
     def update_phone_note(self, oa_id, customer_id, user_id, phone, note, account_id=None, organization_id=None):
@@ -560,15 +745,16 @@ class ConversationModel:
             query['accountId'] = account_id
         result = self.collection.find_one_and_update(
             query,
-            {
+            _versioned({
                 '$set': {
                     'customer_info.phone': phone,
                     'customer_info.note': note,
                     'updated_at': datetime.utcnow(),                    
                 }
-            },
+            }),
             return_document=True
         )
+        self._sync_inbox(result)
         return self._serialize(result)
 
     def set_bot_reply_by_id(self, conversation_id, enabled, account_id=None, organization_id=None):
@@ -622,38 +808,102 @@ class ConversationModel:
             }
 
             # Update all matching documents so all staff see the change (org/account scoped)
-            self.collection.update_many(match, update)
+            self.collection.update_many(match, _versioned(update))
 
             # Update tags for documents that are not currently handled by staff
             if bool(enabled):
                 # Set tag to bot-interacting for docs without a handler
                 no_handler_filter = {**match, '$or': [{'current_handler': None}, {'current_handler': {'$exists': False}}]}
                 try:
-                    self.collection.update_many(no_handler_filter, {'$set': {'tags': 'bot-interacting', 'updated_at': now}})
+                    self.collection.update_many(no_handler_filter, _versioned({'$set': {'tags': 'bot-interacting', 'updated_at': now}}))
                 except Exception:
                     pass
             else:
                 # Disable: remove tag for docs without a handler
                 no_handler_filter = {**match, '$or': [{'current_handler': None}, {'current_handler': {'$exists': False}}]}
                 try:
-                    self.collection.update_many(no_handler_filter, {'$unset': {'tags': ''}, '$set': {'updated_at': now}})
+                    self.collection.update_many(no_handler_filter, _versioned({'$unset': {'tags': ''}, '$set': {'updated_at': now}}))
                 except Exception:
                     pass
 
-            # Return the primary document (refreshed)
-            refreshed = self.collection.find_one({'_id': primary.get('_id')})
+            # Every matched document changed, not just the primary: refresh each cached inbox row
+            refreshed = None
+            for doc in self.collection.find(match):
+                self._sync_inbox(doc)
+                if doc.get('_id') == primary.get('_id'):
+                    refreshed = doc
+            if refreshed is None:
+                refreshed = self.collection.find_one({'_id': primary.get('_id')})
             return self._serialize(refreshed)
         except Exception as e:
             logger.error(f"Failed to set bot reply flag: {e}")
             return None
     
-    def list_by_organization(self, organization_id, limit=100, skip=0):
+    def auto_reply_allowed(self, conversation_id):
+        """True while the bot may still answer: bot_reply is on and no staff handler holds the lock.
+
+        Auto-replies run seconds after the message that queued them
+        (utils/reply_debounce.py), so workers re-check rather than trusting
+        what the webhook saw. Unknown ids are allowed, as before.
+        """
+        if not conversation_id:
+            return True
+        try:
+            conv_obj_id = ObjectId(conversation_id)
+        except Exception:
+            conv_obj_id = conversation_id
+        doc = self.collection.find_one(
+            {'_id': conv_obj_id},
+            {'bot_reply': 1, 'bot-reply': 1, 'current_handler': 1, 'lock_expires_at': 1},
+        )
+        if not doc:
+            return True
+        bot_flag = doc.get('bot_reply') if 'bot_reply' in doc else doc.get('bot-reply')
+        if not bot_flag:
+            return False
+        if doc.get('current_handler'):
+            expires = doc.get('lock_expires_at')
+            if not expires or expires > datetime.utcnow():
+                return False
+        return True
+
+    def find_changed_since(self, since, organization_id=None, account_id=None, limit=500, after_id=None):
+        """Conversations (inbox projection) with updated_at >= since, oldest change first.
+
+        Ordered by (updated_at, _id); with `after_id`, rows at exactly `since`
+        are only returned past that _id, so a page can end inside one timestamp.
+        Scoped by organization_id (primary) or account_id (legacy).
+        """
+        if after_id:
+            query = {'$or': [
+                {'updated_at': {'$gt': since}},
+                {'updated_at': since, '_id': {'$gt': ObjectId(after_id)}},
+            ]}
+        else:
+            query = {'updated_at': {'$gte': since}}
+        if organization_id:
+            query['organizationId'] = organization_id
+        elif account_id:
+            query['accountId'] = account_id
+        else:
+            return []
+        projection = _projection('inbox', str(organization_id) if organization_id else None)
+        cursor = self.collection.find(query, projection).sort([('updated_at', 1), ('_id', 1)]).limit(limit)
+        return [self._serialize(d) for d in cursor]
+
+    def list_by_organization(self, organization_id, limit=100, skip=0, profile=None):
         """List all conversations for an organization, sorted by updated_at descending
         
         NEW: Primary query method using organizationId for org-level isolation.
+        profile: optional key of PROJECTIONS (e.g. 'inbox'); the organization's own
+        nickname is kept, other organizations' nicknames are not fetched.
         """
         if not organization_id:
             return []
-        cursor = self.collection.find({'organizationId': organization_id}).sort('updated_at', -1).skip(skip).limit(limit)
+        cached = self._cached_inbox(organization_id, profile, str(organization_id))
+        if cached is not None:
+            return cached[skip:skip + limit]
+        projection = _projection(profile, str(organization_id))
+        cursor = self.collection.find({'organizationId': organization_id}, projection).sort('updated_at', -1).skip(skip).limit(limit)
         docs = [self._serialize(d) for d in list(cursor)]
         return docs
\ No newline at end of file
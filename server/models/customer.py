@@ -1,10 +1,68 @@
 import logging
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 from pymongo import MongoClient
 from bson.objectid import ObjectId
+from config import Config
+from utils.serialization import serialize_doc
+from utils import search
 
 logger = logging.getLogger(__name__)
 
+# Process-local cache of the last profile written per customer, keyed by
+# "platform:platform_specific_id". Webhooks re-upsert the same customer on
+# every message, so an unchanged profile lets us skip the write entirely.
+_profile_cache = OrderedDict()
+_profile_cache_lock = threading.Lock()
+
+
+def _profile_hash(is_staff, name, avatar, phone):
+    raw = '\x1f'.join(str(v) if v is not None else '' for v in (bool(is_staff), name, avatar, phone))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _cache_get(customer_id):
+    with _profile_cache_lock:
+        entry = _profile_cache.get(customer_id)
+        if not entry:
+            return None
+        if time.time() - entry['at'] > Config.CUSTOMER_CACHE_TTL_SECONDS:
+            _profile_cache.pop(customer_id, None)
+            return None
+        _profile_cache.move_to_end(customer_id)
+        return entry
+
+
+def _cache_put(doc):
+    if not doc or not doc.get('_id'):
+        return
+    entry = {
+        'hash': _profile_hash(doc.get('is_staff'), doc.get('name'), doc.get('avatar'), doc.get('phone')),
+        'doc': doc,
+        'at': time.time(),
+    }
+    with _profile_cache_lock:
+        _profile_cache[doc['_id']] = entry
+        _profile_cache.move_to_end(doc['_id'])
+        while len(_profile_cache) > Config.CUSTOMER_CACHE_MAX_ENTRIES:
+            _profile_cache.popitem(last=False)
+
+
+def invalidate_customer_cache(customer_id=None):
+    """Drop one cached customer profile (or all of them).
+
+    Called by UserModel.refresh_staff_zalo_ids for every Zalo id whose staff
+    link changed, since `is_staff` is part of the cached profile.
+    """
+    with _profile_cache_lock:
+        if customer_id is None:
+            _profile_cache.clear()
+        else:
+            _profile_cache.pop(customer_id, None)
+
 class CustomerModel:
     def __init__(self, mongo_client):
         self.client = mongo_client
@@ -17,33 +75,43 @@ class CustomerModel:
         # This ensures one customer per platform-specific ID
         self.collection.create_index([('platform', 1), ('platform_specific_id', 1)], unique=True)
         self.collection.create_index([('platform', 1)])
+        self.collection.create_index([('phone', 1)], sparse=True)
+        # Prefix search on folded name tokens and phone digits (see utils/search.py)
+        self.collection.create_index([('is_staff', 1), ('platform', 1), ('search.tokens', 1)])
+        self.collection.create_index([('is_staff', 1), ('platform', 1), ('search.phone', 1)])
+        self.collection.create_index([('is_staff', 1), ('platform', 1), ('search.phone_rev', 1)])
 
     def _serialize(self, doc):
-        if not doc:
-            return None
-        out = dict(doc)
-        if out.get('_id') is not None:
-            try:
-                out['_id'] = str(out['_id'])
-            except Exception:
-                pass
-        for k, v in list(out.items()):
-            try:
-                if hasattr(v, 'isoformat') and callable(getattr(v, 'isoformat')):
-                    out[k] = v.isoformat() + 'Z'
-            except Exception:
-                pass
-        return out
+        doc = serialize_doc(doc)
+        if doc:
+            # Search keys are an index detail, not part of the customer payload
+            doc.pop('search', None)
+        return doc
 
     def upsert_customer(self, platform, platform_specific_id, name=None, avatar=None, phone=None, is_staff=False):
         """
         Upsert a customer. platform_specific_id becomes the _id.
         Returns the customer document.
+
+        The write is skipped when the resulting profile (is_staff, name,
+        avatar, phone) matches the one we last wrote for this customer.
         """
         now = datetime.utcnow()
         
         # Use platform_specific_id as _id for easy lookup
         customer_id = f"{platform}:{platform_specific_id}"
+
+        cached = _cache_get(customer_id)
+        if cached:
+            prev = cached['doc']
+            merged_hash = _profile_hash(
+                is_staff,
+                name if name is not None else prev.get('name'),
+                avatar if avatar is not None else prev.get('avatar'),
+                phone if phone is not None else prev.get('phone'),
+            )
+            if merged_hash == cached['hash']:
+                return dict(prev)
         
         update_doc = {
             'platform': platform,
@@ -54,10 +122,12 @@ class CustomerModel:
         
         if name is not None:
             update_doc['name'] = name
+            update_doc.update(search.name_keys(name))
         if avatar is not None:
             update_doc['avatar'] = avatar
         if phone is not None:
             update_doc['phone'] = phone
+            update_doc.update(search.phone_keys(phone))
         
         # Upsert: update if exists, insert if not
         result = self.collection.find_one_and_update(
@@ -72,13 +142,30 @@ class CustomerModel:
             return_document=True
         )
         
-        return self._serialize(result)
+        doc = self._serialize(result)
+        _cache_put(doc)
+        return dict(doc) if doc else doc
 
     def find_by_id(self, customer_id):
         """Find customer by _id (which is platform:platform_specific_id)"""
         doc = self.collection.find_one({'_id': customer_id})
         return self._serialize(doc)
 
+    def find_cached_by_id(self, customer_id):
+        """Like find_by_id, but served from the upsert cache when warm.
+
+        The cache is per process. Staff-link changes made in this process
+        invalidate it at once; one made by another process is only seen when
+        this process next reloads its staff ids (STAFF_ZALO_IDS_TTL_SECONDS)
+        or the cached entry expires (CUSTOMER_CACHE_TTL_SECONDS).
+        """
+        cached = _cache_get(customer_id)
+        if cached:
+            return dict(cached['doc'])
+        doc = self.find_by_id(customer_id)
+        _cache_put(doc)
+        return doc
+
     def find_by_platform_and_id(self, platform, platform_specific_id):
         """Find customer by platform and platform_specific_id"""
         customer_id = f"{platform}:{platform_specific_id}"
@@ -88,21 +175,30 @@ class CustomerModel:
         doc = self.collection.find_one({'phone': phone})
         return self._serialize(doc)
 
-    def find_by_name_or_phone(self, platform=None, query=None):
-        """Find customers by name or phone"""
+    def find_by_name_or_phone(self, platform=None, query=None, skip=0, limit=20):
+        """
+        Find non-staff customers whose name tokens or phone match `query`.
+
+        Uses the search-key indexes (prefix match on folded name tokens, phone
+        prefix or suffix); up to SEARCH_MAX_CANDIDATES matches are ranked by
+        relevance and the requested page is returned.
+        Returns (customers, total) where total counts the ranked candidates.
+        """
         mongo_query = {
             'is_staff': False
-        }   
+        }
         # Filter by platform if provided
         if platform:
             mongo_query['platform'] = platform
-        
-        # Search by name OR phone
+
         if query:
-            mongo_query['$or'] = [
-                {'name': {'$regex': query, '$options': 'i'}},
-                {'phone': {'$regex': query, '$options': 'i'}},
-            ]
+            match = search.build_query(query)
+            if match is None:
+                return [], 0
+            mongo_query.update(match)
+            cursor = self.collection.find(mongo_query).limit(Config.SEARCH_MAX_CANDIDATES)
+            ranked = search.rank(list(cursor), query)
+            return [self._serialize(doc) for doc in ranked[skip:skip + limit]], len(ranked)
 
-        cursor = self.collection.find(mongo_query).limit(20)
-        return [self._serialize(doc) for doc in cursor]
+        cursor = self.collection.find(mongo_query).sort('_id', 1).skip(skip).limit(limit)
+        return [self._serialize(doc) for doc in cursor], self.collection.count_documents(mongo_query)
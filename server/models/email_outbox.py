@@ -0,0 +1,80 @@
+import logging
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class EmailOutboxModel:
+    """Mongo-backed queue of outgoing emails.
+
+    A message is `pending` until it is sent (`sent`) or runs out of attempts
+    (`failed`). `available_at` doubles as the claim lease and the retry time:
+    claiming pushes it forward by the lease, so a message whose sender died
+    becomes claimable again, and a failed attempt sets it to the backoff time.
+    """
+
+    def __init__(self, mongo_client):
+        self.client = mongo_client
+        self.db = mongo_client.test_db
+        self.collection = self.db.email_outbox
+        self._create_indexes()
+
+    def _create_indexes(self):
+        self.collection.create_index([('status', 1), ('available_at', 1)])
+        # Sent emails are only kept for inspection for a while
+        self.collection.create_index(
+            'sent_at', expireAfterSeconds=Config.EMAIL_OUTBOX_RETENTION_DAYS * 86400, sparse=True,
+        )
+
+    def enqueue(self, recipient, subject, plain_text, html=None, kind=None):
+        """Queue an email; returns the outbox id."""
+        now = datetime.utcnow()
+        doc = {
+            'to': recipient,
+            'subject': subject,
+            'plain_text': plain_text,
+            'html': html,
+            'kind': kind,
+            'status': 'pending',
+            'attempts': 0,
+            'available_at': now,
+            'created_at': now,
+        }
+        return self.collection.insert_one(doc).inserted_id
+
+    def claim(self, lease_seconds, owner):
+        """Atomically lease the oldest due pending email, or return None."""
+        now = datetime.utcnow()
+        return self.collection.find_one_and_update(
+            {'status': 'pending', 'available_at': {'$lte': now}},
+            {
+                '$set': {'available_at': now + timedelta(seconds=lease_seconds), 'claimed_by': owner},
+                '$inc': {'attempts': 1},
+            },
+            sort=[('available_at', 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def mark_sent(self, outbox_id):
+        self.collection.update_one(
+            {'_id': outbox_id},
+            {'$set': {'status': 'sent', 'sent_at': datetime.utcnow(), 'last_error': None}},
+        )
+
+    def mark_retry(self, outbox_id, error, retry_at):
+        self.collection.update_one(
+            {'_id': outbox_id},
+            {'$set': {'available_at': retry_at, 'last_error': str(error)[:500]}},
+        )
+
+    def mark_failed(self, outbox_id, error):
+        self.collection.update_one(
+            {'_id': outbox_id},
+            {'$set': {'status': 'failed', 'failed_at': datetime.utcnow(), 'last_error': str(error)[:500]}},
+        )
+
+    def depth(self):
+        """Number of emails waiting to be sent (including ones backing off)."""
+        return self.collection.count_documents({'status': 'pending'})
@@ -1,6 +1,17 @@
 from datetime import datetime, timedelta
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
 from bson.objectid import ObjectId
+from utils.serialization import serialize_doc
+
+# Projections for integration lookups (see PROJECTIONS in models/conversation.py)
+PROJECTIONS = {
+    # Webhook / status lookups: routing, ownership and the token used to reply
+    'webhook': {
+        '_id': 1, 'platform': 1, 'oa_id': 1, 'accountId': 1, 'organizationId': 1,
+        'chatbotId': 1, 'access_token': 1, 'expires_at': 1, 'is_active': 1,
+        'name': 1, 'avatar_url': 1, 'updated_at': 1, 'meta.profile.oa_id': 1,
+    },
+}
 
 class IntegrationModel:
     def __init__(self, mongo_client):
@@ -20,30 +31,12 @@ class IntegrationModel:
         self.collection.create_index([('organizationId', 1)])
         self.collection.create_index([('organizationId', 1), ('platform', 1), ('oa_id', 1)])
         self.collection.create_index([('organizationId', 1), ('chatbotId', 1), ('platform', 1)])
+        # Token refresh scans
+        self.collection.create_index([('platform', 1), ('is_active', 1), ('expires_at', 1)])
 
     def _serialize(self, doc):
-        if not doc:
-            return None
-        out = dict(doc)
-        # Convert ObjectId to string
-        if out.get('_id') is not None:
-            try:
-                out['_id'] = str(out['_id'])
-            except Exception:
-                pass
-        # Convert datetimes to ISO strings (as UTC 'Z')
-        from datetime import datetime as _dt
-        for k, v in list(out.items()):
-            try:
-                if isinstance(v, _dt):
-                    # Store as UTC ISO string with 'Z' to make parsing consistent on client
-                    out[k] = v.replace(microsecond=0).isoformat() + 'Z'
-                elif hasattr(v, 'isoformat') and callable(getattr(v, 'isoformat')):
-                    # Fallback for other date-like objects
-                    out[k] = v.isoformat()
-            except Exception:
-                pass
-        return out
+        # ObjectId -> str, datetimes -> UTC ISO strings with 'Z'
+        return serialize_doc(doc)
 
     def create_or_update(self, account_id, platform, oa_id, access_token, refresh_token=None, expires_in=None, meta=None, is_active=True, name=None, avatar_url=None, chatbot_id=None, organization_id=None):
         expires_at = None
@@ -85,8 +78,9 @@ class IntegrationModel:
             res_doc = self.collection.find_one({'_id': res_doc.get('_id')})
         return self._serialize(res_doc)
 
-    def find_by_platform_and_oa(self, platform, oa_id):
-        res = self.collection.find_one({'platform': platform, 'oa_id': oa_id})
+    def find_by_platform_and_oa(self, platform, oa_id, profile=None):
+        projection = PROJECTIONS[profile] if profile else None
+        res = self.collection.find_one({'platform': platform, 'oa_id': oa_id}, projection)
         return self._serialize(res)
 
     def find_by_organization_id(self, platform, org_id):
@@ -113,6 +107,71 @@ class IntegrationModel:
         res = self.collection.find_one_and_update({'_id': ObjectId(integration_id)}, {'$set': update}, return_document=True)
         return self._serialize(res)
 
+    def claim_for_refresh(self, platform, cutoff_datetime, lease_seconds, owner, exclude_ids=None):
+        """Atomically lease one expiring integration for refresh.
+
+        Sets `refresh_lock_until` so other processes skip it until the lease ends;
+        returns the raw document (with refresh_token) or None when nothing is due.
+        exclude_ids: integrations already handled in this run.
+        """
+        now = datetime.utcnow()
+        query = {
+            'platform': platform,
+            'is_active': True,
+            'expires_at': {'$lt': cutoff_datetime},
+            'refresh_token': {'$nin': [None, '']},
+            '$or': [
+                {'refresh_lock_until': {'$exists': False}},
+                {'refresh_lock_until': None},
+                {'refresh_lock_until': {'$lt': now}},
+            ],
+        }
+        if exclude_ids:
+            query['_id'] = {'$nin': list(exclude_ids)}
+        return self.collection.find_one_and_update(
+            query,
+            {'$set': {'refresh_lock_until': now + timedelta(seconds=lease_seconds), 'refresh_lock_owner': owner}},
+            sort=[('expires_at', 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def record_refresh_success(self, integration_id, access_token, refresh_token=None, expires_in=None, latency_ms=None):
+        """Store refreshed tokens, release the lease and reset the failure streak."""
+        now = datetime.utcnow()
+        update = {
+            'access_token': access_token,
+            'updated_at': now,
+            'refresh_lock_until': None,
+            'token_refresh.last_success_at': now,
+            'token_refresh.last_latency_ms': latency_ms,
+            'token_refresh.consecutive_failures': 0,
+            'token_refresh.last_error': None,
+        }
+        if refresh_token is not None:
+            update['refresh_token'] = refresh_token
+        if expires_in is not None:
+            update['expires_at'] = now + timedelta(seconds=int(expires_in))
+        self.collection.update_one(
+            {'_id': ObjectId(integration_id)},
+            {'$set': update, '$inc': {'token_refresh.success_count': 1}},
+        )
+
+    def record_refresh_failure(self, integration_id, error, latency_ms=None, retry_at=None):
+        """Record a failed refresh; the lease is kept until `retry_at` as backoff."""
+        now = datetime.utcnow()
+        self.collection.update_one(
+            {'_id': ObjectId(integration_id)},
+            {
+                '$set': {
+                    'refresh_lock_until': retry_at,
+                    'token_refresh.last_failure_at': now,
+                    'token_refresh.last_latency_ms': latency_ms,
+                    'token_refresh.last_error': str(error)[:500],
+                },
+                '$inc': {'token_refresh.failure_count': 1, 'token_refresh.consecutive_failures': 1},
+            },
+        )
+
     def integrations_needing_refresh(self, cutoff_datetime):
         # Return integrations whose expires_at is not None and <= cutoff
         docs = list(self.collection.find({'expires_at': {'$lte': cutoff_datetime}, 'is_active': True}))
@@ -2,10 +2,30 @@ import logging
 from datetime import datetime
 from pydoc import doc
 from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
 from bson.objectid import ObjectId
+from utils.serialization import serialize_doc
+from utils.message_compaction import compact_metadata, expand_blob_refs
 
 logger = logging.getLogger(__name__)
 
+# Projections for message reads (see PROJECTIONS in models/conversation.py)
+PROJECTIONS = {
+    # Message pane / history: text, sender and renderable attachments only;
+    # raw platform responses (metadata.api_response, send_response, ...) stay in Mongo
+    'pane': {
+        '_id': 1, 'platform': 1, 'oa_id': 1, 'sender_id': 1, 'conversation_id': 1,
+        'direction': 1, 'text': 1, 'sender_profile': 1, 'is_read': 1,
+        'bot_reply': 1, 'tags': 1, 'created_at': 1,
+        'metadata.image': 1, 'metadata.image_blob_id': 1, 'metadata.image_url': 1,
+        'metadata.attachment': 1, 'metadata.attachments': 1,
+        'metadata.has_attachment': 1, 'metadata.attachment_type': 1, 'metadata.attachment_id': 1,
+        'metadata.source': 1, 'metadata.type': 1, 'metadata.staff_name': 1,
+        'metadata.auto_reply': 1, 'metadata.bridge': 1,
+    },
+}
+
+
 class MessageModel:
     def __init__(self, mongo_client):
         self.client = mongo_client
@@ -28,6 +48,19 @@ class MessageModel:
         self.collection.create_index([('organizationId', 1), ('conversation_id', 1), ('created_at', -1)])
         self.collection.create_index([('organizationId', 1), ('platform', 1), ('oa_id', 1), ('created_at', -1)])
         self.collection.create_index([('organizationId', 1), ('created_at', -1)])
+        # Delta sync (/conversations/changes) pages by (created_at, _id)
+        self.collection.create_index([('organizationId', 1), ('created_at', 1), ('_id', 1)])
+        # Platform message id (Messenger mid / Zalo msg_id) for webhook de-duplication.
+        # Partial rather than sparse: 'platform' is always present, so a sparse
+        # compound index would still index (platform, null) and collide.
+        try:
+            self.collection.create_index(
+                [('platform', 1), ('platform_message_id', 1)],
+                unique=True,
+                partialFilterExpression={'platform_message_id': {'$type': 'string'}},
+            )
+        except Exception as e:
+            logger.warning(f"Failed to create platform_message_id index: {e}")
         # index to quickly count/filter bot replies
         try:
             self.collection.create_index([('organizationId', 1), ('bot_reply', 1)])
@@ -36,55 +69,22 @@ class MessageModel:
             pass
 
     def _serialize(self, doc):
-        """Return a fully JSON-serializable representation of a message document.
-        This normalizes ObjectId -> str, datetimes -> ISO strings, and recursively
-        handles nested dicts and lists (e.g., metadata, sender_profile).
+        """Return a fully JSON-serializable representation of a message document
+        (ObjectId -> str, datetimes -> ISO strings, nested metadata included).
         """
-        if not doc:
-            return None
-        out = dict(doc)
-
-        def _normalize(value):
-            try:
-                # ObjectId -> string
-                if isinstance(value, ObjectId):
-                    return str(value)
-
-                # datetime -> ISO string
-                if hasattr(value, 'isoformat') and callable(getattr(value, 'isoformat')):
-                    try:
-                        return value.isoformat() + 'Z'
-                    except Exception:
-                        return str(value)
-
-                # dict -> normalize items
-                if isinstance(value, dict):
-                    return {k: _normalize(v) for k, v in value.items()}
-
-                # list/tuple -> normalize elements
-                if isinstance(value, (list, tuple)):
-                    return [_normalize(v) for v in value]
-
-                # fallback: leave as-is
-                return value
-            except Exception:
-                # Best-effort fallback
-                try:
-                    return str(value)
-                except Exception:
-                    return None
-
-        for k, v in list(out.items()):
-            out[k] = _normalize(v)
-
+        out = serialize_doc(doc)
+        if out and out.get('metadata'):
+            out['metadata'] = expand_blob_refs(out['metadata'])
         return out
 
-    def add_message(self, platform, oa_id, sender_id, direction, text=None, metadata=None, sender_profile=None, is_read=False, conversation_id=None, account_id=None, organization_id=None, bot_reply=False, tags=None):
+    def add_message(self, platform, oa_id, sender_id, direction, text=None, metadata=None, sender_profile=None, is_read=False, conversation_id=None, account_id=None, organization_id=None, bot_reply=False, tags=None, platform_message_id=None):
         """
         Add a message. 
         - conversation_id: Optional ObjectId string of conversation. If provided, this is the new way.
         - sender_profile: Optional dict like {name, avatar} describing the sender.
         - account_id: SECURITY FIX - The account that owns this message (for isolation when integration transfers)
+        - platform_message_id: Optional platform id (mid / msg_id). If a message with the same
+          platform id already exists, the existing document is returned with 'duplicate': True.
         """
         now = datetime.utcnow()
         doc = {
@@ -93,7 +93,8 @@ class MessageModel:
             'sender_id': sender_id,  # Keep for backward compatibility
             'direction': direction,  # 'in' or 'out'
             'text': text,
-            'metadata': metadata or {},
+            # Platform responses are trimmed and large inline images stored as blobs
+            'metadata': compact_metadata(metadata or {}),
             'sender_profile': sender_profile or {},
             'is_read': bool(is_read),
             'bot_reply': bool(bot_reply),
@@ -131,7 +132,20 @@ class MessageModel:
                 doc['tags'] = str(tags)
             except Exception:
                 doc['tags'] = tags
-        res = self.collection.insert_one(doc)
+
+        if platform_message_id:
+            doc['platform_message_id'] = str(platform_message_id)
+
+        try:
+            res = self.collection.insert_one(doc)
+        except DuplicateKeyError:
+            if not platform_message_id:
+                raise
+            existing = self.find_by_platform_message_id(platform, platform_message_id)
+            if existing:
+                existing['duplicate'] = True
+                return existing
+            raise
         doc['_id'] = res.inserted_id
         try:
             logger.info(f"Added message: platform={platform}, oa_id={oa_id}, sender_id={sender_id}, direction={direction}, conversation_id={doc.get('conversation_id')}, account_id={account_id}, _id={doc['_id']}")
@@ -139,6 +153,13 @@ class MessageModel:
             pass
         return self._serialize(doc)
 
+    def find_by_platform_message_id(self, platform, platform_message_id):
+        """Find a message by its platform message id (Messenger mid / Zalo msg_id)."""
+        if not platform_message_id:
+            return None
+        doc = self.collection.find_one({'platform': platform, 'platform_message_id': str(platform_message_id)})
+        return self._serialize(doc) if doc else None
+
     def find_recent_similar(self, platform=None, oa_id=None, sender_id=None, conversation_id=None, direction=None, text=None, within_seconds=10):
         """
         Find a recent similar message that matches the provided criteria within a time window.
@@ -169,9 +190,10 @@ class MessageModel:
         doc = self.collection.find_one(q, sort=[('created_at', -1)])
         return self._serialize(doc) if doc else None
 
-    def get_messages(self, platform, oa_id, sender_id, limit=50, skip=0, conversation_id=None, account_id=None, bot_reply=None):
+    def get_messages(self, platform, oa_id, sender_id, limit=50, skip=0, conversation_id=None, account_id=None, bot_reply=None, profile=None):
         """
         Get messages. If conversation_id is provided, use it; otherwise use legacy sender_id.
+        profile: optional key of PROJECTIONS (e.g. 'pane') to fetch only listed fields.
         """
 
         try:
@@ -207,7 +229,8 @@ class MessageModel:
         if bot_reply is not None:
             q['bot_reply'] = bool(bot_reply)
 
-        cursor = self.collection.find(q).sort('created_at', -1).skip(skip).limit(limit)
+        projection = PROJECTIONS[profile] if profile else None
+        cursor = self.collection.find(q, projection).sort('created_at', -1).skip(skip).limit(limit)
         docs = [self._serialize(d) for d in list(cursor)]
         
         logger.info(f"Found {len(docs)} messages for query: {q}")
@@ -264,10 +287,47 @@ class MessageModel:
             })
         return out
 
-    def get_by_organization_and_conversation(self, organization_id, conversation_id, limit=50, skip=0):
+    def find_created_since(self, since, organization_id=None, account_id=None, limit=500, profile=None, after_id=None):
+        """Messages with created_at >= since, oldest first, scoped by organization (or legacy account).
+
+        Ordered by (created_at, _id); with `after_id`, messages at exactly
+        `since` are only returned past that _id.
+        """
+        if after_id:
+            query = {'$or': [
+                {'created_at': {'$gt': since}},
+                {'created_at': since, '_id': {'$gt': ObjectId(after_id)}},
+            ]}
+        else:
+            query = {'created_at': {'$gte': since}}
+        if organization_id:
+            query['organizationId'] = organization_id
+        elif account_id:
+            query['accountId'] = account_id
+        else:
+            return []
+        projection = PROJECTIONS[profile] if profile else None
+        cursor = self.collection.find(query, projection).sort([('created_at', 1), ('_id', 1)]).limit(limit)
+        return [self._serialize(d) for d in cursor]
+
+    def latest_message_id(self, conversation_id):
+        """_id of the newest message in a conversation (as a string), or None.
+
+        Cheap change marker for the message pane ETag: served from the
+        (conversation_id, created_at) index.
+        """
+        try:
+            conv_id_obj = conversation_id if isinstance(conversation_id, ObjectId) else ObjectId(conversation_id)
+        except Exception:
+            conv_id_obj = conversation_id
+        doc = self.collection.find_one({'conversation_id': conv_id_obj}, {'_id': 1}, sort=[('created_at', -1)])
+        return str(doc['_id']) if doc else None
+
+    def get_by_organization_and_conversation(self, organization_id, conversation_id, limit=50, skip=0, profile=None):
         """Get messages by organization and conversation ID
         
         NEW: Query messages using organizationId for org-level isolation.
+        profile: optional key of PROJECTIONS (e.g. 'pane') to fetch only listed fields.
         """
         if not organization_id or not conversation_id:
             return []
@@ -291,7 +351,8 @@ class MessageModel:
         except Exception:
             skip = 0
         
-        cursor = self.collection.find(query).sort('created_at', -1).skip(skip).limit(limit)
+        projection = PROJECTIONS[profile] if profile else None
+        cursor = self.collection.find(query, projection).sort('created_at', -1).skip(skip).limit(limit)
         docs = [self._serialize(d) for d in list(cursor)]
         docs.reverse()
         return docs
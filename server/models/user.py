@@ -1,11 +1,14 @@
 from datetime import datetime, timedelta
 from pymongo import MongoClient
 from pymongo.errors import DuplicateKeyError
-import bcrypt
+from utils.password_hashing import hash_password, check_password
+from utils import search as search_keys
 import uuid
 import secrets
 import base64
 import jwt
+import threading
+import time
 from config import Config
 from flask_login import UserMixin
 
@@ -26,6 +29,14 @@ class FlaskUser(UserMixin):
         except Exception:
             return True
 
+# In-memory set of Zalo user ids linked to staff accounts. Webhooks check it
+# on every message instead of querying users; it is rebuilt whenever staff
+# are created/updated/deleted and periodically to pick up other processes.
+_staff_zalo_ids = None
+_staff_zalo_ids_loaded_at = 0.0
+_staff_zalo_ids_lock = threading.Lock()
+
+
 class UserModel:
     """User model for MongoDB operations"""
     
@@ -42,6 +53,9 @@ class UserModel:
         self.collection.create_index('accountId', unique=True)
         self.collection.create_index('verification_token', sparse=True)
         self.collection.create_index('organizationId')
+        self.collection.create_index('zalo_user_id', sparse=True)
+        # Staff list filter/search (see utils/search.py)
+        self.collection.create_index([('parent_account_id', 1), ('role', 1), ('search.tokens', 1)])
     
     def create_user(self, email, password, name=None, phone=None, role='admin', parent_account_id=None, created_by=None):
         """
@@ -67,7 +81,7 @@ class UserModel:
             raise ValueError('Email already registered')
         
         # Hash password
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(10))
+        hashed_password = hash_password(password)
         
         # Generate verification token and accountId
         verification_token = secrets.token_urlsafe(32)
@@ -116,6 +130,41 @@ class UserModel:
         if not zalo_user_id:
             return None
         return self.collection.find_one({'zalo_user_id': str(zalo_user_id)})
+
+    def refresh_staff_zalo_ids(self):
+        """Reload the in-memory set of staff-linked Zalo user ids.
+
+        Customers whose staff link appeared or disappeared since the last load
+        are dropped from the customer profile cache, so a promoted/demoted
+        user's cached `is_staff` is not served in any process past this reload.
+        """
+        global _staff_zalo_ids, _staff_zalo_ids_loaded_at
+        try:
+            cursor = self.collection.find(
+                {'zalo_user_id': {'$nin': [None, '']}},
+                {'zalo_user_id': 1, '_id': 0}
+            )
+            ids = {str(doc['zalo_user_id']) for doc in cursor if doc.get('zalo_user_id')}
+        except Exception:
+            return _staff_zalo_ids or set()
+        with _staff_zalo_ids_lock:
+            previous = _staff_zalo_ids
+            _staff_zalo_ids = ids
+            _staff_zalo_ids_loaded_at = time.time()
+        if previous is not None:
+            from models.customer import invalidate_customer_cache
+            for zalo_user_id in previous ^ ids:
+                invalidate_customer_cache(f"zalo:{zalo_user_id}")
+        return ids
+
+    def is_staff_zalo_id(self, zalo_user_id):
+        """Return True if a staff account is linked to this Zalo user id."""
+        if not zalo_user_id:
+            return False
+        ids = _staff_zalo_ids
+        if ids is None or time.time() - _staff_zalo_ids_loaded_at > Config.STAFF_ZALO_IDS_TTL_SECONDS:
+            ids = self.refresh_staff_zalo_ids()
+        return str(zalo_user_id) in ids
     
     def verify_password(self, user, password, role='admin'):
         """
@@ -134,7 +183,7 @@ class UserModel:
         if role == 'staff' and 'username' in user:
             # Staff users may have passwords stored as plain text (legacy support)
             return user['password'] == password
-        return bcrypt.checkpw(password.encode('utf-8'), user['password'])
+        return check_password(password, user['password'])
     
     def verify_email(self, email, account_id, token):
         """
@@ -300,7 +349,7 @@ class UserModel:
             return None
         
         # Hash new password
-        hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt(10))
+        hashed_password = hash_password(new_password)
         
         # Update password and clear reset token
         result = self.collection.find_one_and_update(
@@ -399,7 +448,7 @@ class UserModel:
             return {'error': 'Current password is incorrect'}
         
         # Hash new password
-        hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt(10))
+        hashed_password = hash_password(new_password)
         
         # Update password
         result = self.collection.find_one_and_update(
@@ -438,6 +487,7 @@ class UserModel:
                 '$set': {
                     'name': new_name,
                     'updated_at': datetime.utcnow(),
+                    **search_keys.name_keys(new_name, user.get('username')),
                 }
             },
             return_document=True
@@ -506,7 +556,8 @@ class UserModel:
             'updated_at': datetime.utcnow(),
             'verification_token': None,
             'verification_token_expires_at': None,
-            'zalo_user_id': zalo_user_id
+            'zalo_user_id': zalo_user_id,
+            'search': {'tokens': search_keys.tokenize(name, username)},
         }
 
         from models.customer import CustomerModel
@@ -521,6 +572,7 @@ class UserModel:
         try:
             result = self.collection.insert_one(staff_data)
             staff_data['_id'] = result.inserted_id
+            self.refresh_staff_zalo_ids()
             return staff_data
         except DuplicateKeyError:
             raise ValueError('Username already exists')
@@ -533,7 +585,8 @@ class UserModel:
             parent_account_id (str): Admin's accountId
             skip (int): Skip count for pagination
             limit (int): Limit for pagination
-            search (str): Search string for name/username filter
+            search (str): Search string for name/username filter; results are
+                ranked by relevance (prefix match on folded name/username words)
             
         Returns:
             tuple: (staff list, total count)
@@ -544,10 +597,13 @@ class UserModel:
         }
         
         if search:
-            query['$or'] = [
-                {'name': {'$regex': search, '$options': 'i'}},
-                {'username': {'$regex': search, '$options': 'i'}}
-            ]
+            match = search_keys.build_query(search, phone=False)
+            if match is None:
+                return [], 0
+            query.update(match)
+            cursor = self.collection.find(query).limit(Config.SEARCH_MAX_CANDIDATES)
+            ranked = search_keys.rank(list(cursor), search)
+            return ranked[skip:skip + limit], len(ranked)
         
         cursor = self.collection.find(query).skip(skip).limit(limit)
         staff = list(cursor)
@@ -607,6 +663,12 @@ class UserModel:
         if 'new_password' in updates and updates['new_password']:
             update_fields['password'] = updates['new_password']
         
+        if 'name' in update_fields or 'username' in update_fields:
+            update_fields.update(search_keys.name_keys(
+                update_fields.get('name', staff.get('name')),
+                update_fields.get('username', staff.get('username')),
+            ))
+
         if 'avatar_url' in updates:
             update_fields['avatar_url'] = updates['avatar_url']
         
@@ -637,6 +699,9 @@ class UserModel:
             {'$set': update_fields},
             return_document=True
         )
+
+        if 'zalo_user_id' in update_fields:
+            self.refresh_staff_zalo_ids()
         
         return result
 
@@ -665,6 +730,8 @@ class UserModel:
         
         # Delete
         self.collection.delete_one({'_id': staff['_id']})
+        if staff.get('zalo_user_id'):
+            self.refresh_staff_zalo_ids()
         return True
 
     def verify_admin_password(self, admin_account_id, password):
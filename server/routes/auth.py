@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from models.user import UserModel
 from models.chatbot import ChatbotModel
 from utils.email_service import EmailService
+from utils.password_hashing import PasswordHasherBusy, busy_response
 from config import Config
 import logging
 
@@ -65,6 +66,9 @@ def init_auth_routes(mongo_client):
         
         except ValueError as e:
             return jsonify({'success': False, 'message': str(e)}), 400
+        except PasswordHasherBusy:
+            logger.warning("Registration rejected: password hashing queue is full")
+            return busy_response()
         except Exception as e:
             logger.error(f"Registration error: {str(e)}")
             return jsonify({'success': False, 'message': 'Registration failed'}), 500
@@ -141,6 +145,9 @@ def init_auth_routes(mongo_client):
                 'session_expires_at': session_expires_at
             }), 200
         
+        except PasswordHasherBusy:
+            logger.warning("Login rejected: password hashing queue is full")
+            return busy_response()
         except Exception as e:
             logger.error(f"Login error: {str(e)}")
             return jsonify({'success': False, 'message': 'Login failed'}), 500
@@ -334,6 +341,9 @@ def init_auth_routes(mongo_client):
                 'message': 'Password reset successful. Please login with your new password.'
             }), 200
         
+        except PasswordHasherBusy:
+            logger.warning("Password reset rejected: password hashing queue is full")
+            return busy_response()
         except Exception as e:
             logger.error(f"Reset password error: {str(e)}")
             return jsonify({'success': False, 'message': 'Password reset failed'}), 500
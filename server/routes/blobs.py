@@ -0,0 +1,96 @@
+from flask import Blueprint, request, jsonify, send_file
+from config import Config
+from utils.blob_store import BlobError, put_blob, blob_info, blob_url, is_blob_id
+from utils import thumbnails
+from utils.request_helpers import get_account_id_from_request, get_chatbot_id_from_request
+import base64
+import binascii
+import logging
+
+blobs_bp = Blueprint('blobs', __name__, url_prefix='/api/blobs')
+logger = logging.getLogger(__name__)
+
+
+@blobs_bp.route('', methods=['POST'])
+def upload_blob():
+    """
+    Upload an image and get back a blob id/URL to reference in send requests.
+
+    Accepts multipart form data with a `file` field, or JSON {"image": "<data URL>"}.
+    Staff (X-Account-Id) and widget visitors (X-Chatbot-ID) may upload.
+    """
+    if not get_account_id_from_request() and not get_chatbot_id_from_request():
+        return jsonify({'success': False, 'message': 'Account ID or Chatbot ID required'}), 400
+
+    if request.content_length and request.content_length > Config.BLOB_MAX_BYTES * 2:
+        return jsonify({'success': False, 'error_code': 'BLOB_TOO_LARGE', 'message': 'File too large'}), 413
+
+    try:
+        if 'file' in request.files:
+            data = request.files['file'].read(Config.BLOB_MAX_BYTES + 1)
+        else:
+            image = (request.get_json(silent=True) or {}).get('image') or ''
+            if ',' in image:
+                image = image.split(',', 1)[1]
+            data = base64.b64decode(image) if image else b''
+    except (binascii.Error, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid image data'}), 400
+
+    if not data:
+        return jsonify({'success': False, 'message': 'file or image is required'}), 400
+
+    try:
+        blob_id, content_type = put_blob(data)
+    except BlobError as e:
+        status = 413 if e.code == 'BLOB_TOO_LARGE' else 400
+        return jsonify({'success': False, 'error_code': e.code, 'message': str(e)}), status
+    except Exception as e:
+        logger.error(f"Failed to store blob: {e}")
+        return jsonify({'success': False, 'message': 'Upload failed'}), 500
+
+    info = blob_info(blob_id)
+    if info:
+        thumbnails.schedule_thumbnails(info['path'], blob_id)
+
+    return jsonify({
+        'success': True,
+        'data': {
+            'id': blob_id,
+            'url': blob_url(blob_id),
+            'size': len(data),
+            'content_type': content_type,
+        }
+    }), 201
+
+
+@blobs_bp.route('/<blob_id>', methods=['GET'])
+def get_blob(blob_id):
+    """Serve a blob. Content never changes for an id, so it is cached as immutable;
+    conditional (ETag) and Range requests are handled by send_file.
+    ?size=sm|md|lg serves a square thumbnail (WebP when accepted, or ?format=jpeg|webp)."""
+    info = blob_info(blob_id) if is_blob_id(blob_id) else None
+    if not info:
+        return jsonify({'success': False, 'message': 'File not found'}), 404
+
+    path, mimetype, etag = info['path'], info['content_type'], blob_id
+    size = request.args.get('size')
+    vary_accept = False
+    if size:
+        fmt = thumbnails.pick_format(request.args.get('format'), request.headers.get('Accept'))
+        thumb = thumbnails.ensure_thumbnail(info['path'], blob_id, size, fmt)
+        if thumb:
+            path, mimetype, etag = thumb, thumbnails.FORMATS[fmt], f"{blob_id}-{size}.{fmt}"
+            vary_accept = not request.args.get('format')
+
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        conditional=True,
+        etag=etag,
+        max_age=Config.BLOB_CACHE_MAX_AGE,
+    )
+    if vary_accept:
+        response.vary.add('Accept')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
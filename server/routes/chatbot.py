@@ -5,6 +5,7 @@ from config import Config
 import logging
 import os
 from werkzeug.utils import secure_filename
+from utils.thumbnails import schedule_thumbnails
 from datetime import datetime
 import uuid
 
@@ -143,6 +144,7 @@ def init_chatbot_routes(mongo_client):
             unique_filename = f"{uuid.uuid4().hex}_{datetime.utcnow().timestamp()}.{file_ext}"
             file_path = os.path.join(Config.UPLOAD_FOLDER, unique_filename)
             file.save(file_path)
+            schedule_thumbnails(file_path, unique_filename)
 
             avatar_url = f"/uploads/avatars/{unique_filename}"
 
@@ -1,15 +1,20 @@
 from flask import Blueprint, request, jsonify, current_app, redirect
 from models.integration import IntegrationModel
 from utils.redis_client import set_key, get_key, del_key
+from utils.message_dedup import claim_for_request, release_message_id, settle_claim, remember_sent
+from utils.blob_store import BlobError, resolve_image_ref
+from utils.conditional import make_etag, not_modified_or_none, with_etag
+from utils import reply_debounce, chat_api
+from utils.support_workflow import hand_over_to_staff
 from config import Config
 import logging
 import secrets
 import requests
+import functools
 import json
 from datetime import datetime, timedelta
 import base64
 from io import BytesIO
-import threading
 from routes.zalo import _send_message_to_zalo
 
 facebook_bp = Blueprint('facebook', __name__)
@@ -73,10 +78,6 @@ def _emit_socket(event, payload, account_id=None, to_room=None, organization_id=
         return False
 
 
-# External auto-reply chat API
-EXTERNAL_CHAT_API = 'https://microtunchat-app-1012095270393.us-central1.run.app/chat'
-
-
 def _auto_reply_worker(mongo_client, integration, oa_id, customer_platform_id, conversation_id, question, account_id_owner, organization_id, socketio=None):
     """Background worker: call external chat API and send reply back to customer.
 
@@ -88,14 +89,23 @@ def _auto_reply_worker(mongo_client, integration, oa_id, customer_platform_id, c
         if not question:
             logger.debug("Auto-reply: empty question, skipping")
             return
-        
-        auth = (Config.AI_API_USERNAME, Config.AI_API_PASSWORD)
 
+        # The message waited out the debounce window: re-read state the webhook saw
+        from models.conversation import ConversationModel
+        if not ConversationModel(mongo_client).auto_reply_allowed(conversation_id):
+            logger.info(f"Auto-reply: bot turned off or staff took over conversation {conversation_id}, skipping")
+            return
+        integration = IntegrationModel(mongo_client).find_by_platform_and_oa('facebook', oa_id, profile='webhook') or integration
+        if not integration.get('is_active'):
+            logger.info(f"Auto-reply: integration {oa_id} no longer active, skipping")
+            return
+        
         try:
-            resp = requests.post(EXTERNAL_CHAT_API, json={'question': question}, timeout=120, auth=auth)
-            data = resp.json() if resp.status_code == 200 else {}
-        except Exception as e:
-            logger.error(f"Auto-reply API request failed: {e}")
+            data = chat_api.ask(question)
+        except chat_api.ChatApiUnavailable as e:
+            # Fail over to staff at once instead of leaving the customer without a reply
+            logger.warning(f"Auto-reply API unavailable ({e.reason}): {e}; handing conversation over to staff")
+            hand_over_to_staff(mongo_client, 'facebook', oa_id, customer_platform_id, question, organization_id=organization_id, account_id=account_id_owner, socketio=socketio, notify=True)
             return
 
         answer = data.get('answer') if isinstance(data, dict) else None
@@ -123,10 +133,10 @@ def _auto_reply_worker(mongo_client, integration, oa_id, customer_platform_id, c
                         conv_obj_id = ObjectId(conv.get('_id'))
                     except Exception:
                         conv_obj_id = conv.get('_id')
-                    conv_model.collection.update_one({'_id': conv_obj_id}, {'$set': {'tags': 'bot-failed', 'updated_at': datetime.utcnow()}})
+                    conv_model.set_tags_by_id(conv_obj_id, 'bot-failed')
                     try:
                         conv_model.set_bot_reply_by_id(conv.get('_id'), False, account_id=account_id_owner, organization_id=organization_id)
-                        conv_model.collection.update_one({'_id': conv_obj_id}, {'$set': {'tags': 'bot-failed', 'updated_at': datetime.utcnow()}})
+                        conv_model.set_tags_by_id(conv_obj_id, 'bot-failed')
                     except Exception:
                         pass
                     try:
@@ -149,44 +159,7 @@ def _auto_reply_worker(mongo_client, integration, oa_id, customer_platform_id, c
 
         # If needhelp is requested, after sending the answer we will switch the conversation to bot-failed + bot_reply False
         if needhelp:
-            try:
-                from models.conversation import ConversationModel
-                from utils.support_workflow import add_pending_support
-                conv_model = ConversationModel(mongo_client)
-                conv = conv_model.find_by_oa_and_customer(oa_id, f"facebook:{customer_platform_id}", organization_id=organization_id, account_id=account_id_owner)
-                if conv and conv.get('_id'):
-                    try:
-                        from bson.objectid import ObjectId
-                        conv_obj_id = ObjectId(conv.get('_id'))
-                    except Exception:
-                        conv_obj_id = conv.get('_id')
-                    try:
-                        conv_model.set_bot_reply_by_id(conv.get('_id'), False, account_id=account_id_owner, organization_id=organization_id)
-                    except Exception:
-                        pass
-                    try:
-                        conv_model.collection.update_one({'_id': conv_obj_id}, {'$set': {'tags': 'bot-failed', 'updated_at': datetime.utcnow()}})
-                    except Exception:
-                        pass
-                    try:
-                        add_pending_support(organization_id or conv.get('organizationId'), f"facebook:{oa_id}:{customer_platform_id}")
-                    except Exception:
-                        pass
-                    try:
-                        from utils.support_dispatch import dispatch_support_needed
-                        dispatch_support_needed(
-                            mongo_client,
-                            organization_id or conv.get('organizationId'),
-                            f"facebook:{oa_id}:{customer_platform_id}",
-                            customer_name=(conv.get('customer_info') or {}).get('name') if isinstance(conv, dict) else None,
-                            content=question,
-                            platform='facebook',
-                            socketio=socketio
-                        )
-                    except Exception:
-                        pass
-            except Exception:
-                pass
+            hand_over_to_staff(mongo_client, 'facebook', oa_id, customer_platform_id, question, organization_id=organization_id, account_id=account_id_owner, socketio=socketio)
         try:
             send_resp = _send_message_to_facebook(integration.get('access_token'), customer_platform_id, answer)
         except Exception as e:
@@ -213,6 +186,7 @@ def _auto_reply_worker(mongo_client, integration, oa_id, customer_platform_id, c
                 conversation_id=conversation_id,
                 account_id=account_id_owner,
                 organization_id=organization_id,
+                platform_message_id=remember_sent('facebook', send_resp),
             )
 
             conversation_model.upsert_conversation(
@@ -613,6 +587,30 @@ def webhook_verify():
         return 'verification failed', 403
 
 
+def _fetch_facebook_user_profile(page_token, user_id):
+    """Fetch name/avatar for a Messenger user from the Graph API ({} on failure)."""
+    if not page_token or str(page_token).startswith('mock'):
+        return {}
+    try:
+        resp = requests.get(f"{Config.FB_API_BASE}/{user_id}", params={'fields': 'name,picture{url}', 'access_token': page_token}, timeout=5)
+        if resp.status_code != 200:
+            return {}
+        d = resp.json() or {}
+        name = d.get('name')
+        pic = d.get('picture') or {}
+        avatar = None
+        if isinstance(pic, dict):
+            if isinstance(pic.get('data'), dict):
+                avatar = pic['data'].get('url')
+            else:
+                avatar = pic.get('url')
+        if name or avatar:
+            return {'name': name, 'avatar': avatar}
+    except Exception as e:
+        logger.info(f"Failed to fetch sender profile for {user_id}: {e}")
+    return {}
+
+
 @facebook_bp.route('/webhooks/facebook', methods=['POST'])
 def webhook_event():
     data = request.get_json() or {}
@@ -632,6 +630,7 @@ def webhook_event():
     conversation_model = ConversationModel(current_app.mongo_client)
     message_model = MessageModel(current_app.mongo_client)
 
+    persist_failed = False
     for entry in entries:
         page_id = entry.get('id')
         # messaging events
@@ -668,9 +667,16 @@ def webhook_event():
                 # No message field - skip this event (read receipt, delivery receipt, etc.)
                 continue
 
+            # Drop redeliveries and echoes of messages we already processed/sent (O(1), before any DB work)
+            platform_msg_id = messaging['message'].get('mid')
+            if platform_msg_id:
+                if not claim_for_request('facebook', platform_msg_id):
+                    logger.info(f"Duplicate Facebook webhook for mid={platform_msg_id}; ignoring")
+                    continue
+
             integration = None
             if oa_id:
-                integration = integration_model.find_by_platform_and_oa('facebook', oa_id)
+                integration = integration_model.find_by_platform_and_oa('facebook', oa_id, profile='webhook')
 
             if not integration or not integration.get('is_active'):
                 logger.info('Facebook integration not found or inactive; ignoring message')
@@ -686,22 +692,11 @@ def webhook_event():
             try:
                 page_token = integration.get('access_token')
                 if page_token and customer_platform_id:
-                    try:
-                        resp = requests.get(f"{Config.FB_API_BASE}/{customer_platform_id}", params={'fields': 'name,picture{url}', 'access_token': page_token}, timeout=5)
-                        if resp.status_code == 200:
-                            d = resp.json() or {}
-                            name = d.get('name')
-                            pic = d.get('picture') or {}
-                            avatar = None
-                            if isinstance(pic, dict):
-                                if isinstance(pic.get('data'), dict):
-                                    avatar = pic['data'].get('url')
-                                else:
-                                    avatar = pic.get('url')
-                            if name or avatar:
-                                sender_profile = {'name': name, 'avatar': avatar}
-                    except Exception as e:
-                        logger.info(f"Failed to fetch sender profile for {customer_platform_id}: {e}")
+                    from utils.profile_cache import get_profile
+                    sender_profile = get_profile(
+                        'facebook', customer_platform_id,
+                        lambda token=page_token, uid=customer_platform_id: _fetch_facebook_user_profile(token, uid)
+                    ) or None
             except Exception:
                 sender_profile = None
 
@@ -763,8 +758,10 @@ def webhook_event():
             try:
                 incoming_doc = None
                 if direction == 'out':
-                    # Check for recent similar outgoing message to avoid duplicate from send API + webhook echo
-                    existing = message_model.find_recent_similar(platform='facebook', oa_id=integration.get('oa_id'), sender_id=customer_platform_id, conversation_id=conversation_id, direction='out', text=message_text, within_seconds=10)
+                    # Echoes carrying a mid are de-duplicated by id; text matching is only a fallback
+                    existing = None
+                    if not platform_msg_id:
+                        existing = message_model.find_recent_similar(platform='facebook', oa_id=integration.get('oa_id'), sender_id=customer_platform_id, conversation_id=conversation_id, direction='out', text=message_text, within_seconds=10)
                     if existing:
                         incoming_doc = existing
                         deduped = True
@@ -782,6 +779,7 @@ def webhook_event():
                             conversation_id=conversation_id,
                             account_id=integration.get('accountId'),
                             organization_id=integration.get('organizationId'),
+                            platform_message_id=platform_msg_id,
                         )
                 else:
                     incoming_doc = message_model.add_message(
@@ -796,10 +794,19 @@ def webhook_event():
                         conversation_id=conversation_id,
                         account_id=integration.get('accountId'),
                         organization_id=integration.get('organizationId'),
+                        platform_message_id=platform_msg_id,
                     )
+                if incoming_doc and incoming_doc.get('duplicate'):
+                    deduped = True
+                    logger.info(f"Facebook message {platform_msg_id} already stored; skipping duplicate")
+                settle_claim('facebook', platform_msg_id)
             except Exception as e:
                 logger.error(f"Failed to persist message: {e}")
-                incoming_doc = None
+                # Not stored: skip it and answer 5xx so Facebook redelivers the batch;
+                # messages already stored keep their (settled) claims and are dropped then
+                release_message_id('facebook', platform_msg_id)
+                persist_failed = True
+                continue
 
             # Build conversation ID for frontend (legacy format for compatibility)
             conv_id = f"facebook:{integration.get('oa_id')}:{customer_platform_id}"
@@ -889,18 +896,19 @@ def webhook_event():
                     try:
                         mongo_client = current_app.mongo_client
                         socketio = getattr(current_app, 'socketio', None)
-                        t = threading.Thread(
-                            target=_auto_reply_worker,
-                            args=(mongo_client, integration, integration.get('oa_id'), customer_platform_id, conversation_id, message_text, account_id_owner, integration.get('organizationId'), socketio),
-                            daemon=True
-                        )
-                        t.start()
-                        logger.info(f"Scheduled auto-reply worker for conversation {conversation_id}")
+                        # Quick follow-up messages are combined into one question (utils/reply_debounce.py)
+                        reply_debounce.submit('facebook', conversation_id, message_text, functools.partial(
+                            _auto_reply_worker, mongo_client, integration, integration.get('oa_id'), customer_platform_id, conversation_id,
+                            account_id_owner=account_id_owner, organization_id=integration.get('organizationId'), socketio=socketio,
+                        ))
+                        logger.info(f"Queued auto-reply for conversation {conversation_id}")
                     except Exception as e:
                         logger.error(f"Failed to start auto-reply worker thread: {e}")
             except Exception:
                 pass
 
+    if persist_failed:
+        return jsonify({'success': False, 'message': 'Failed to persist message'}), 500
     return jsonify({'success': True}), 200
 
 
@@ -954,11 +962,11 @@ def list_conversations():
         
         # Get conversations using organizationId for org-level isolation
         if user_org_id:
-            convs = conversation_model.list_by_organization(user_org_id, limit=100)
+            convs = conversation_model.list_by_organization(user_org_id, limit=100, profile='inbox')
             logger.info(f"Found {len(convs)} conversations from organization {user_org_id}")
         else:
             # Fallback to account-based query for backward compat
-            convs = conversation_model.find_by_oa(oa_id, limit=100, account_id=account_id)
+            convs = conversation_model.find_by_oa(oa_id, limit=100, account_id=account_id, profile='inbox')
             logger.info(f"Found {len(convs)} conversations from oa_id {oa_id} with account_id {account_id}")
         if len(convs) == 0:
             # Try legacy method as fallback
@@ -1022,9 +1030,24 @@ def list_conversations():
         page_name = integration.get('name') if integration else None
         avatar_url = integration.get('avatar_url') if integration else None
     except Exception:
+        integration = None
         page_name = None
         avatar_url = None
 
+    # Check integration status
+    is_connected = bool(integration and integration.get('is_active', True))
+    disconnected_at = integration.get('updated_at') if integration and not is_connected else None
+
+    # Conditional GET before the per-row work: rows only change when a conversation version does
+    etag = make_etag(
+        'facebook-conversations', account_id, oa_id,
+        [(c.get('_id'), c.get('version'), c.get('time'), c.get('unreadCount')) for c in convs],
+        is_connected, disconnected_at, page_name, avatar_url,
+    )
+    not_modified = not_modified_or_none(etag, 'facebook_conversations')
+    if not_modified is not None:
+        return not_modified
+
     out = []
     for c in convs:
         # If using new structure, extract data from conversation document
@@ -1079,30 +1102,18 @@ def list_conversations():
             # Legacy format (already converted above)
             out.append(c)
 
-            # Check integration status
-    try:
-        integration = model.find_by_platform_and_oa('facebook', oa_id)
-        is_connected = bool(integration and integration.get('is_active', True))
-        disconnected_at = None
-        if not is_connected and integration:
-            disconnected_at = integration.get('updated_at')
-    except Exception as e:
-        logger.error(f"Error checking integration status: {e}")
-        is_connected = False
-        disconnected_at = None
-
     # Add platform_status to each conversation
     for conv in out:
         conv['platform_status'] = {
             'is_connected': is_connected,
             'disconnected_at': disconnected_at.isoformat() + 'Z' if disconnected_at else None
         }
-    
+
     logger.info(f"Returning {len(out)} conversations for oa_id {oa_id}")
     if len(out) == 0:
         logger.warning(f"No conversations found for oa_id {oa_id}. Check if conversations exist in DB.")
 
-    return jsonify({'success': True, 'data': out, 'page': {'name': page_name, 'avatar': avatar_url}}), 200
+    return with_etag(jsonify({'success': True, 'data': out, 'page': {'name': page_name, 'avatar': avatar_url}}), etag), 200
 
 
 @facebook_bp.route('/api/facebook/conversations/<path:conv_id>/messages', methods=['GET'])
@@ -1171,12 +1182,23 @@ def get_conversation_messages(conv_id):
             except Exception:
                 conversation_id = None
         
+        # Conditional GET: the pane only changes with the conversation version or a new message
+        etag = None
+        if conversation_doc and conversation_id:
+            etag = make_etag(
+                'facebook-messages', account_id, conversation_id, conversation_doc.get('version'),
+                message_model.latest_message_id(conversation_id), limit, skip,
+            )
+            not_modified = not_modified_or_none(etag, 'facebook_messages')
+            if not_modified is not None:
+                return not_modified
+
         # Get messages using conversation_id and organizationId if available
         if user_org_id and conversation_id:
             # Primary: Use organization-based query
             msgs = message_model.get_by_organization_and_conversation(
                 user_org_id, conversation_id,
-                limit=limit, skip=skip
+                limit=limit, skip=skip, profile='pane'
             )
             logger.info(f"Retrieved {len(msgs)} messages using organization context")
         else:
@@ -1185,7 +1207,8 @@ def get_conversation_messages(conv_id):
                 platform, oa_id, sender_id, 
                 limit=limit, skip=skip, 
                 conversation_id=conversation_id,
-                account_id=account_id
+                account_id=account_id,
+                profile='pane'
             )
             logger.info(f"Retrieved {len(msgs)} messages using legacy query")
         logger.info(f"Retrieved {len(msgs)} messages for conversation {conv_id}")
@@ -1193,20 +1216,9 @@ def get_conversation_messages(conv_id):
         logger.error(f"Failed to fetch messages: {e}")
         return jsonify({'success': False, 'message': 'Internal error fetching messages'}), 500
 
-    # Defensive: ensure messages are JSON-serializable before returning
-    payload = {'success': True, 'data': msgs, 'conversation': conversation_doc}
-    try:
-        return jsonify(payload), 200
-    except TypeError as e:
-        logger.warning(f"Messages not JSON serializable, attempting to normalize: {e}")
-        try:
-            import json
-            safe_msgs = json.loads(json.dumps(msgs, default=str))
-            safe_conv = json.loads(json.dumps(conversation_doc, default=str)) if conversation_doc else None
-            return jsonify({'success': True, 'data': safe_msgs, 'conversation': safe_conv}), 200
-        except Exception as e2:
-            logger.error(f"Failed to normalize messages for JSON response: {e2}")
-            return jsonify({'success': False, 'message': 'Internal error formatting messages'}), 500
+    # ObjectId/datetime values are handled by the app JSON provider
+    response = jsonify({'success': True, 'data': msgs, 'conversation': conversation_doc})
+    return (with_etag(response, etag) if etag else response), 200
 
 
 @facebook_bp.route('/api/facebook/conversations/<path:conv_id>/mark-read', methods=['POST'])
@@ -1274,7 +1286,11 @@ def send_conversation_message(conv_id):
 
     data = request.get_json() or {}
     text = data.get('text')
-    image = data.get('image')  # Optional: data URL or remote URL
+    # Optional: data URL, remote URL or an uploaded blob (image_blob_id / blob URL)
+    try:
+        image, stored_image = resolve_image_ref(data)
+    except BlobError as e:
+        return jsonify({'success': False, 'error_code': e.code, 'message': str(e)}), 400
     if not text and not image:
         return jsonify({'success': False, 'message': 'text or image is required'}), 400
 
@@ -1378,7 +1394,7 @@ def send_conversation_message(conv_id):
         page_profile = {'name': integration.get('name'), 'avatar': integration.get('avatar_url')}
         metadata = {'send_response': send_resp, 'page_profile': page_profile}
         if image:
-            metadata['image'] = image
+            metadata['image'] = stored_image
         sent_doc = message_model.add_message(
             platform=platform, 
             oa_id=oa_id, 
@@ -1390,6 +1406,7 @@ def send_conversation_message(conv_id):
             conversation_id=conversation_id,
             account_id=account_id_owner,
             organization_id=integration.get('organizationId'),
+            platform_message_id=remember_sent('facebook', send_resp),
         )
         
         # Build recipient_profile from customer_doc if available
@@ -1658,37 +1675,32 @@ def _send_message_to_facebook(page_access_token, recipient_id, message_text=None
     
 
 # Token refresh helper (attempts to refresh long-lived tokens)
+def _refresh_facebook_token(item):
+    """Re-exchange a Facebook token; falls back to a mock token as before when the exchange fails."""
+    try:
+        # Facebook long-lived tokens refresh flow is limited; attempt to re-exchange using fb_exchange_token
+        token_url = f"{Config.FB_API_BASE}/oauth/access_token"
+        params = {
+            'grant_type': 'fb_exchange_token',
+            'client_id': Config.FB_APP_ID,
+            'client_secret': Config.FB_APP_SECRET,
+            'fb_exchange_token': item.get('refresh_token'),
+        }
+        resp = requests.get(token_url, params=params, timeout=10)
+        data = resp.json()
+        if resp.status_code == 200 and 'access_token' in data:
+            # We don't necessarily get a page token back here; keep access_token for record
+            return {'access_token': data.get('access_token'), 'refresh_token': data.get('access_token'), 'expires_in': data.get('expires_in')}
+        raise Exception('unexpected response')
+    except Exception as e:
+        logger.info(f"Token refresh failed or skipped for {item.get('_id')}: {e}; using mock refresh")
+        return {'access_token': f"mock_fb_access_refresh_{item.get('_id')}", 'expires_in': 60 * 60 * 24 * 30}
+
+
 def refresh_expiring_tokens(mongo_client):
-    integration_model = IntegrationModel(mongo_client)
-    cutoff = datetime.utcnow() + timedelta(seconds=Config.TOKEN_REFRESH_LEAD_SECONDS)
-    expiring = integration_model.collection.find({
-        "platform": "facebook",
-        "expires_at": {"$lt": cutoff},
-        "is_active": True
-    })
-    logger.info(f"Found {len(expiring)} facebook integrations needing refresh")
-    for item in expiring:
-        try:
-            refresh_token = item.get('refresh_token')
-            if not refresh_token:
-                logger.info(f"No refresh token for integration {item.get('_id')}; skipping")
-                continue
-            # Facebook long-lived tokens refresh flow is limited; attempt to re-exchange using fb_exchange_token
-            token_url = f"{Config.FB_API_BASE}/oauth/access_token"
-            params = {
-                'grant_type': 'fb_exchange_token',
-                'client_id': Config.FB_APP_ID,
-                'client_secret': Config.FB_APP_SECRET,
-                'fb_exchange_token': refresh_token,
-            }
-            resp = requests.get(token_url, params=params, timeout=10)
-            data = resp.json()
-            if resp.status_code == 200 and 'access_token' in data:
-                # We don't necessarily get a page token back here; keep access_token for record
-                integration_model.update_tokens(item.get('_id'), access_token=data.get('access_token'), refresh_token=data.get('access_token'), expires_in=data.get('expires_in'))
-                logger.info(f"Refreshed token for integration {item.get('_id')}")
-            else:
-                raise Exception('unexpected response')
-        except Exception as e:
-            logger.info(f"Token refresh failed or skipped for {item.get('_id')}: {e}; using mock refresh")
-            integration_model.update_tokens(item.get('_id'), access_token=f"mock_fb_access_refresh_{item.get('_id')}", expires_in=60 * 60 * 24 * 30)
+    """Scheduler job: refresh expiring Facebook tokens (leased + concurrent, see utils/token_refresh.py)."""
+    from utils.token_refresh import run_token_refresh
+    try:
+        return run_token_refresh(mongo_client, 'facebook', _refresh_facebook_token)
+    except Exception as e:
+        logger.error(f"Critical error in facebook refresh scheduler: {e}")
@@ -1,11 +1,11 @@
-from flask import Blueprint, jsonify, request, send_file, current_app
+from flask import Blueprint, Response, jsonify, request, current_app
 import requests
 import os
 import logging
 from config import Config
-from io import BytesIO
 import json
-from datetime import datetime
+import zlib
+from datetime import datetime, timedelta
 from models.message import MessageModel
 
 file_bp = Blueprint('file', __name__)
@@ -13,6 +13,9 @@ logger = logging.getLogger(__name__)
 
 AI_BASE_API = "https://microtunchat-app-1012095270393.us-central1.run.app"
 
+# Training export is written in chunks of roughly this many characters
+_EXPORT_CHUNK_SIZE = 64 * 1024
+
 USERNAME = Config.AI_API_USERNAME
 PASSWORD = Config.AI_API_PASSWORD
 
@@ -70,71 +73,175 @@ def delete_file(filename):
         return jsonify({"error": str(e)}), 500
 
 
-@file_bp.route("/api/export-training-json", methods=["GET"])
-def export_training_json():
-    try:
-        message_model = MessageModel(current_app.mongo_client)
-
-        # Get messages using raw collection (since model may not have this method)
-        messages = list(
-            message_model.collection.find({
-                "bot_reply": {"$ne": True},
-            }).sort([
-                ("conversation_id", 1),
-                ("created_at", 1)
-            ])
-        )
-
-        # Group by conversation
-        conversations = {}
-        for msg in messages:
-            cid = str(msg.get("conversation_id"))
-
-            if cid not in conversations:
-                conversations[cid] = []
-
-            conversations[cid].append(msg)
-
-        # Build Q&A
-        training_data = []
-
-        for conv_id, msgs in conversations.items():
+def _parse_export_date(value, end_of_day=False):
+    """Parse YYYY-MM-DD or an ISO datetime; a bare end date includes that whole day."""
+    if not value:
+        return None
+    dt = datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    if end_of_day and len(value) == 10:
+        dt += timedelta(days=1)
+    return dt
+
+
+def _iter_training_pairs(cursor):
+    """
+    Yield Q&A pairs from messages grouped by conversation_id, oldest first within each.
+    Only the current conversation's pending question is held in memory.
+    """
+    current_conv = None
+    question = None
+    for m in cursor:
+        conv_id = str(m.get("conversation_id"))
+        if conv_id != current_conv:
+            current_conv = conv_id
             question = None
 
-            for m in msgs:
-                direction = m.get("direction")
-                text = m.get("text")
+        text = m.get("text")
+        if not text:
+            continue
+
+        direction = m.get("direction")
+        if direction == "in":
+            question = text
+        elif direction == "out" and question:
+            yield {
+                "question": question,
+                "answer": text,
+                "conversation_id": conv_id
+            }
+            question = None
 
-                if not text:
-                    continue
 
-                if direction == "in":
-                    question = text
+def _iter_export_chunks(pairs, fmt):
+    """
+    Encode pairs as a JSON array or NDJSON, buffered into ~64KB chunks.
+    If reading pairs fails, NDJSON gets a final {"error": ...} line, the JSON
+    array is left unclosed, and the error is re-raised.
+    """
+    buf = []
+    size = 0
+    first = True
+    if fmt == "json":
+        buf.append("[\n")
+    try:
+        for pair in pairs:
+            line = json.dumps(pair, ensure_ascii=False)
+            if fmt == "json":
+                line = ("  " if first else ",\n  ") + line
+            else:
+                line += "\n"
+            first = False
+            buf.append(line)
+            size += len(line)
+            if size >= _EXPORT_CHUNK_SIZE:
+                yield "".join(buf).encode("utf-8")
+                buf = []
+                size = 0
+    except Exception:
+        if fmt == "ndjson":
+            buf.append(json.dumps({"error": "export failed"}) + "\n")
+        yield "".join(buf).encode("utf-8")
+        raise
+    if fmt == "json":
+        buf.append("\n]\n" if not first else "]\n")
+    if buf:
+        yield "".join(buf).encode("utf-8")
+
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
 
-                elif direction == "out" and question:
-                    training_data.append({
-                        "question": question,
-                        "answer": text,
-                        "conversation_id": conv_id
-                    })
-                    question = None
 
-        # Convert to JSON file
-        json_data = json.dumps(training_data, ensure_ascii=False, indent=2)
+@file_bp.route("/api/export-training-json", methods=["GET"])
+def export_training_json():
+    """
+    Stream Q&A training pairs built from non-bot messages.
+
+    Query params:
+      format          json (default, a JSON array) | ndjson (one pair per line)
+      gzip            1/true to gzip the download
+      organization_id restrict to one organization's messages
+      chatbot_id      restrict to conversations of one chatbot
+      from, to        created_at range (YYYY-MM-DD or ISO datetime, `to` inclusive)
+    """
+    try:
+        fmt = (request.args.get("format") or "json").lower()
+        if fmt not in ("json", "ndjson"):
+            return jsonify({"error": "format must be json or ndjson"}), 400
+        use_gzip = (request.args.get("gzip") or "").lower() in ("1", "true", "yes")
 
-        buffer = BytesIO()
-        buffer.write(json_data.encode("utf-8"))
-        buffer.seek(0)
+        try:
+            date_from = _parse_export_date(request.args.get("from"))
+            date_to = _parse_export_date(request.args.get("to"), end_of_day=True)
+        except ValueError:
+            return jsonify({"error": "from/to must be YYYY-MM-DD or ISO datetimes"}), 400
 
-        filename = f"training_data_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
+        message_model = MessageModel(current_app.mongo_client)
 
-        return send_file(
-            buffer,
-            mimetype="application/json",
-            as_attachment=True,
-            download_name=filename
+        query = {"bot_reply": {"$ne": True}}
+        organization_id = request.args.get("organization_id")
+        if organization_id:
+            query["organizationId"] = organization_id
+        chatbot_id = request.args.get("chatbot_id")
+        if chatbot_id:
+            from models.conversation import ConversationModel
+            conversation_model = ConversationModel(current_app.mongo_client)
+            conv_query = {"chatbot_id": chatbot_id}
+            if organization_id:
+                conv_query["organizationId"] = organization_id
+            # One id per conversation (not per message) is held for the $in filter
+            conv_ids = [d["_id"] for d in conversation_model.collection.find(conv_query, {"_id": 1})]
+            query["conversation_id"] = {"$in": conv_ids}
+        if date_from or date_to:
+            query["created_at"] = {}
+            if date_from:
+                query["created_at"]["$gte"] = date_from
+            if date_to:
+                query["created_at"]["$lt"] = date_to
+
+        # A reverse scan of the (organizationId,) conversation_id 1, created_at -1
+        # indexes, so nothing is sorted in memory; pairing only needs messages
+        # grouped per conversation in time order, not conversations in any order
+        cursor = message_model.collection.find(
+            query,
+            {"conversation_id": 1, "direction": 1, "text": 1, "created_at": 1, "_id": 0},
+            batch_size=1000,
+        ).sort([
+            ("conversation_id", -1),
+            ("created_at", 1)
+        ])
+
+        chunks = _iter_export_chunks(_iter_training_pairs(cursor), fmt)
+        extension = "ndjson" if fmt == "ndjson" else "json"
+        mimetype = "application/x-ndjson" if fmt == "ndjson" else "application/json"
+        filename = f"training_data_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{extension}"
+        if use_gzip:
+            chunks = _gzip_chunks(chunks)
+            mimetype = "application/gzip"
+            filename += ".gz"
+
+        def generate():
+            try:
+                yield from chunks
+            except Exception as e:
+                # The 200 and part of the body are already sent: re-raising drops the
+                # connection before the final chunk, so clients see an incomplete download
+                logger.error(f"Training export failed mid-stream: {e}")
+                raise
+            finally:
+                cursor.close()
+
+        return Response(
+            generate(),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
         )
 
     except Exception as e:
         logger.error(e)
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, current_app
 from models.integration import IntegrationModel
 import logging
+from utils.conditional import make_etag, not_modified_or_none, with_etag
 
 integrations_bp = Blueprint('integrations', __name__, url_prefix='/api/integrations')
 logger = logging.getLogger(__name__)
@@ -234,16 +235,20 @@ def get_all_conversations():
         
         # Get conversations for this organization's chatbots
         enriched_conversations = []
+        # Only this organization's nickname is read from the nicknames map
+        nickname_key = str(user_org_id) if user_org_id else None
+        integration_by_oa = {}
+        row_versions = {}
         for chatbot in account_chatbots:
             chatbot_id = chatbot.get('id')
             # Get conversations using organizationId for org-level isolation
             if user_org_id:
-                conversations = conversation_model.find_by_chatbot_id(chatbot_id, limit=2000, organization_id=user_org_id)
+                conversations = conversation_model.find_by_chatbot_id(chatbot_id, limit=2000, organization_id=user_org_id, profile='inbox', nickname_key=nickname_key)
                 # Fallback to account-based query if no org conversations found (migration period)
                 if not conversations:
-                    conversations = conversation_model.find_by_chatbot_id(chatbot_id, limit=2000, account_id=account_id)
+                    conversations = conversation_model.find_by_chatbot_id(chatbot_id, limit=2000, account_id=account_id, profile='inbox', nickname_key=nickname_key)
             else:
-                conversations = conversation_model.find_by_chatbot_id(chatbot_id, limit=2000, account_id=account_id)
+                conversations = conversation_model.find_by_chatbot_id(chatbot_id, limit=2000, account_id=account_id, profile='inbox', nickname_key=nickname_key)
 
             for conv in conversations:
                 oa_id = conv.get('oa_id')
@@ -261,9 +266,17 @@ def get_all_conversations():
                 
                 # Check integration status to determine if connected
                 # Try to find the integration for this platform and oa_id
-                integration = None
-                for p in ['facebook', 'zalo', 'instagram']:
-                    potential_integration = integration_model.find_by_platform_and_oa(p, oa_id)
+                # (resolved once per oa_id; every conversation of an OA shares it)
+                if oa_id in integration_by_oa:
+                    integration, resolved_platform = integration_by_oa[oa_id]
+                    if resolved_platform:
+                        platform = resolved_platform
+                    p_list = []
+                else:
+                    integration = None
+                    p_list = ['facebook', 'zalo', 'instagram']
+                for p in p_list:
+                    potential_integration = integration_model.find_by_platform_and_oa(p, oa_id, profile='webhook')
                     
                     if potential_integration:
                         # Validate that this integration is accessible to the requester:
@@ -283,6 +296,8 @@ def get_all_conversations():
                             integration = potential_integration
                             platform = p  # Correct platform if needed
                             break
+                if p_list:
+                    integration_by_oa[oa_id] = (integration, platform if integration else None)
                 
                 is_connected = bool(integration)
                 disconnected_at = integration.get('updated_at') if integration and not is_connected else None
@@ -317,17 +332,18 @@ def get_all_conversations():
                     }
                 }
                 enriched_conversations.append(enriched_conv)
+                row_versions[conversation_id] = conv.get('version')
         
         # NEW: Also fetch widget conversations (which don't have chatbot_id)
         # Widget conversations are scoped by oa_id='widget' and organization_id
         try:
             widget_conversations = []
             if user_org_id:
-                widget_conversations = conversation_model.find_by_oa(oa_id='widget', limit=2000, skip=0, account_id=None)
+                widget_conversations = conversation_model.find_by_oa(oa_id='widget', limit=2000, skip=0, account_id=None, profile='inbox', nickname_key=nickname_key, organization_id=user_org_id)
                 # Filter by organizationId to only get conversations for this organization
                 widget_conversations = [c for c in widget_conversations if c.get('organizationId') == str(user_org_id) or c.get('organizationId') == user_org_id]
             else:
-                widget_conversations = conversation_model.find_by_oa(oa_id='widget', limit=2000, skip=0, account_id=account_id)
+                widget_conversations = conversation_model.find_by_oa(oa_id='widget', limit=2000, skip=0, account_id=account_id, profile='inbox', nickname_key=nickname_key)
             
             logger.info(f"Found {len(widget_conversations)} widget conversations for organization {user_org_id}")
             
@@ -373,11 +389,22 @@ def get_all_conversations():
                     }
                 }
                 enriched_conversations.append(enriched_conv)
+                row_versions[conversation_id] = conv.get('version')
         except Exception as e:
             logger.warning(f"Failed to fetch widget conversations: {e}")
         
         # Sort by time descending (most recent first)
         enriched_conversations.sort(key=lambda x: x.get('time') or '', reverse=True)
+
+        # Conditional GET: rows only change when a conversation version (or the
+        # integration status shown on it) does; skip stats and serialization on a match
+        etag = make_etag(
+            'all-conversations', account_id, user_org_id,
+            [(c['id'], row_versions.get(c['id']), c['platform_status']['is_connected']) for c in enriched_conversations],
+        )
+        not_modified = not_modified_or_none(etag, 'all_conversations')
+        if not_modified is not None:
+            return not_modified
         
         # Compute message statistics for the same scope (account or organization)
         stats = {'totalMessages': 0, 'botReplies': 0}
@@ -398,12 +425,151 @@ def get_all_conversations():
             logger.warning(f"Failed to compute message stats: {e}")
         
         logger.info(f"Returning {len(enriched_conversations)} conversations for account {account_id}")
-        return jsonify({'success': True, 'data': enriched_conversations, 'stats': stats}), 200
+        return with_etag(jsonify({'success': True, 'data': enriched_conversations, 'stats': stats}), etag), 200
         
     except Exception as e:
         logger.error(f"Error getting all conversations: {e}", exc_info=True)
         return jsonify({'success': False, 'message': str(e)}), 500
     
+def _parse_cursor(value):
+    """
+    Changes cursor: `<epoch ms>` or `<epoch ms>_<conversation id>_<message id>`
+    (UTC), or an ISO-8601 timestamp. The ids, either of which may be empty, are
+    the last rows already returned at exactly that millisecond.
+    Returns (datetime, conversation_after_id, message_after_id), or None if invalid.
+    """
+    from datetime import datetime, timezone, timedelta
+    from bson.objectid import ObjectId
+    value = (value or '').strip()
+    if not value:
+        return None
+    ms, _, rest = value.partition('_')
+    if ms.isdigit():
+        conv_after, _, msg_after = rest.partition('_')
+        if any(i and not ObjectId.is_valid(i) for i in (conv_after, msg_after)):
+            return None
+        # Integer arithmetic: the cursor is compared for equality with stored (ms precision) times
+        since = datetime(1970, 1, 1) + timedelta(milliseconds=int(ms))
+        return since, conv_after or None, msg_after or None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed, None, None
+
+
+def _format_cursor(dt, conv_after=None, msg_after=None):
+    from datetime import datetime, timedelta
+    ms = str((dt - datetime(1970, 1, 1)) // timedelta(milliseconds=1))
+    if conv_after or msg_after:
+        return f"{ms}_{conv_after or ''}_{msg_after or ''}"
+    return ms
+
+
+def _doc_time(doc, field):
+    value = doc.get(field)
+    if isinstance(value, str):
+        from datetime import datetime
+        try:
+            return datetime.fromisoformat(value.rstrip('Z'))
+        except ValueError:
+            return None
+    return value
+
+
+@integrations_bp.route('/conversations/changes', methods=['GET'])
+def get_conversation_changes():
+    """
+    Conversations and messages changed since `since` (a cursor from a previous
+    call), for dashboards catching up after a reconnect.
+
+    Rows at the cursor boundary may be returned again, so clients should merge
+    by id. When `has_more` is true, call again immediately with `cursor`.
+    `event_seq` is the socket replay position to use for the next `resume`.
+    """
+    account_id = _get_account_id_from_request()
+    if not account_id:
+        return jsonify({'success': False, 'message': 'Account ID required'}), 400
+
+    parsed = _parse_cursor(request.args.get('since'))
+    if parsed is None:
+        return jsonify({'success': False, 'message': 'since must be a cursor (epoch ms) or ISO timestamp'}), 400
+    since, conv_after, msg_after = parsed
+
+    try:
+        from datetime import datetime, timedelta
+        from config import Config
+        from models.conversation import ConversationModel
+        from models.message import MessageModel
+        from models.user import UserModel
+        from utils import socket_replay
+
+        # Read before querying so no event between the query and the reply is skipped on resume
+        event_seq = socket_replay.latest_seq()
+        user_org_id = UserModel(current_app.mongo_client).get_user_organization_id(account_id)
+        scope = {'organization_id': user_org_id} if user_org_id else {'account_id': account_id}
+        limit = max(1, Config.CHANGES_MAX_ROWS)
+
+        conversations = ConversationModel(current_app.mongo_client).find_changed_since(
+            since, limit=limit + 1, after_id=conv_after, **scope)
+        messages = MessageModel(current_app.mongo_client).find_created_since(
+            since, limit=limit + 1, profile='pane', after_id=msg_after, **scope)
+
+        # A full page means more changes remain: advance only to the last row seen
+        # in that stream so the next call continues from there
+        conv_last = msg_last = None
+        if len(conversations) > limit:
+            conversations = conversations[:limit]
+            conv_last = _doc_time(conversations[-1], 'updated_at')
+        if len(messages) > limit:
+            messages = messages[:limit]
+            msg_last = _doc_time(messages[-1], 'created_at')
+        limits = [t for t in (conv_last, msg_last) if t]
+
+        next_conv_after = next_msg_after = None
+        if limits:
+            cursor = max(min(limits), since)
+            # Rows sharing the cursor's millisecond (e.g. one bulk write) are resumed
+            # by _id, so a page that ends inside one timestamp still moves forward
+            if conv_last == cursor:
+                next_conv_after = conversations[-1].get('_id')
+            if msg_last == cursor:
+                next_msg_after = messages[-1].get('_id')
+        else:
+            # Writes stamped just before now may not be visible yet; stay behind them
+            latest = [_doc_time(c, 'updated_at') for c in conversations] + [_doc_time(m, 'created_at') for m in messages]
+            latest = max([t for t in latest if t] or [since])
+            cursor = max(min(latest, datetime.utcnow() - timedelta(seconds=Config.CHANGES_SAFETY_SECONDS)), since)
+        if cursor == since:
+            # Still at the same millisecond: keep the position already reached in each stream
+            next_conv_after = next_conv_after or conv_after
+            next_msg_after = next_msg_after or msg_after
+
+        for conv in conversations:
+            customer_id = conv.get('customer_id') or ''
+            platform, _, sender_id = customer_id.partition(':')
+            if conv.get('oa_id') == 'widget':
+                platform = 'widget'
+            # Same id format the list and message endpoints use
+            conv['conv_id'] = f"{platform}:{conv.get('oa_id')}:{sender_id}"
+
+        return jsonify({
+            'success': True,
+            'data': {
+                'conversations': conversations,
+                'messages': messages,
+                'cursor': _format_cursor(cursor, next_conv_after, next_msg_after),
+                'has_more': bool(limits),
+                'event_seq': event_seq,
+            }
+        }), 200
+    except Exception as e:
+        logger.error(f"Error getting conversation changes: {e}", exc_info=True)
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
 @integrations_bp.route('/conversations/nickname', methods=['POST'])
 def update_conversation_nickname():
     account_id = _get_account_id_from_request()
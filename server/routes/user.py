@@ -4,6 +4,8 @@ from config import Config
 import logging
 import os
 from werkzeug.utils import secure_filename
+from utils.thumbnails import schedule_thumbnails
+from utils.password_hashing import PasswordHasherBusy, busy_response
 from datetime import datetime
 import uuid
 
@@ -107,6 +109,7 @@ def init_user_routes(mongo_client):
             # Save file
             file_path = os.path.join(Config.UPLOAD_FOLDER, unique_filename)
             file.save(file_path)
+            schedule_thumbnails(file_path, unique_filename)
             
             # Store relative URL for serving
             avatar_url = f"/uploads/avatars/{unique_filename}"
@@ -184,6 +187,9 @@ def init_user_routes(mongo_client):
                 'message': 'Password changed successfully'
             }), 200
         
+        except PasswordHasherBusy:
+            logger.warning("Password change rejected: password hashing queue is full")
+            return busy_response()
         except Exception as e:
             logger.error(f"Change password error: {str(e)}")
             return jsonify({'success': False, 'message': 'Password change failed'}), 500
@@ -561,6 +567,9 @@ def init_user_routes(mongo_client):
         
         except ValueError as e:
             return jsonify({'success': False, 'message': str(e)}), 401
+        except PasswordHasherBusy:
+            logger.warning("Admin password check rejected: password hashing queue is full")
+            return busy_response()
         except Exception as e:
             logger.error(f"Verify password error: {str(e)}")
             return jsonify({'success': False, 'message': 'Verification failed'}), 500
@@ -579,18 +588,28 @@ def init_user_routes(mongo_client):
             if not query:
                 return jsonify({'success': False, 'message': 'Search query is required'}), 400
             
+            skip = max(request.args.get('skip', 0, type=int), 0)
+            limit = request.args.get('limit', 20, type=int)
+            if limit < 1 or limit > 100:
+                limit = 20
+
             from models.customer import CustomerModel
             customer_model = CustomerModel(mongo_client)
 
             # Search staff accounts
-            staff_accounts = customer_model.find_by_name_or_phone(
+            staff_accounts, total = customer_model.find_by_name_or_phone(
                 platform='zalo',
-                query=query
+                query=query,
+                skip=skip,
+                limit=limit,
             )
 
             return jsonify({
                 'success': True,
-                'data': staff_accounts
+                'data': staff_accounts,
+                'total': total,
+                'skip': skip,
+                'limit': limit
             }), 200
         
         except Exception as e:
@@ -4,13 +4,16 @@ from models.message import MessageModel
 from utils.request_helpers import get_organization_id_from_request
 from utils.request_helpers import get_account_id_from_request as _get_account_id_from_request
 from utils.request_helpers import get_chatbot_id_from_request
+from utils.blob_store import BlobError, resolve_image_ref
+from utils import reply_debounce, chat_api
+from utils.support_workflow import hand_over_to_staff
 from flask_cors import cross_origin
 from datetime import datetime
 import uuid
+import time
 import logging
-import threading
-import requests
-from routes.facebook import _emit_socket, EXTERNAL_CHAT_API
+import functools
+from routes.facebook import _emit_socket
 from routes.zalo import _send_message_to_zalo
 from config import Config
 
@@ -18,24 +21,106 @@ widget_bp = Blueprint('widget', __name__)
 logger = logging.getLogger(__name__)
 
 
+class _DeltaRelay:
+    """Forwards a streaming auto-reply as `message-delta` events to `conversation:<conv_id>`.
+
+    Only the visitor's widget joins that room (socket `join-conversation`), so
+    other visitors and dashboards see just the final `new-message`.
+
+    Chunks arriving within CHAT_STREAM_EMIT_INTERVAL_MS of the previous emit are
+    batched into the next one. Every event carries `stream_id` and `seq`; the final
+    `new-message` carries the same `stream_id` so the widget can swap its draft for it.
+    """
+
+    def __init__(self, socketio, conversation_id, conv_id):
+        self.stream_id = uuid.uuid4().hex
+        self.socketio = socketio
+        self.conversation_id = conversation_id
+        self.conv_id = conv_id
+        self._pending = []
+        self._seq = 0
+        self._last_emit = 0.0
+        self._finished = False
+
+    def push(self, text):
+        self._pending.append(text)
+        if (time.monotonic() - self._last_emit) * 1000 >= Config.CHAT_STREAM_EMIT_INTERVAL_MS:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            delta = ''.join(self._pending)
+            self._pending = []
+            self._emit(delta=delta)
+
+    def finish(self, aborted=False, message_id=None):
+        """Last event of the stream; `aborted` tells the widget to drop the partial text."""
+        if self._finished:
+            return
+        self._finished = True
+        if aborted:
+            self._pending = []
+        else:
+            self.flush()
+        self._emit(delta='', done=True, aborted=aborted, message_id=message_id)
+
+    def _emit(self, delta, done=False, aborted=False, message_id=None):
+        self._seq += 1
+        self._last_emit = time.monotonic()
+        payload = {
+            'platform': 'widget',
+            'conversation_id': self.conversation_id,
+            'conv_id': self.conv_id,
+            'stream_id': self.stream_id,
+            'seq': self._seq,
+            'delta': delta,
+            'done': done,
+        }
+        if done:
+            payload['aborted'] = aborted
+            payload['message_id'] = message_id
+        if not self.socketio:
+            return
+        try:
+            self.socketio.emit('message-delta', payload, room=f"conversation:{self.conv_id}")
+        except Exception as e:
+            logger.debug(f"Widget auto-reply: message-delta emit failed: {e}")
+
+
 def _auto_reply_worker_widget(mongo_client, oa_id, customer_id, conversation_id, question, organization_id, socketio=None):
     """Background worker: call external chat API and send reply back to widget conversation.
     
     This mirrors the Facebook/Zalo auto-reply workers but sends the answer
     as an outgoing widget message stored in our DB and broadcast via Socket.IO.
+    With CHAT_API_STREAM_URL set, partial text is emitted as `message-delta`
+    events while the answer is generated; the message is still stored once.
     """
+    relay = None
     try:
         if not question:
             logger.debug("Widget auto-reply: empty question, skipping")
             return
 
-        auth = (Config.AI_API_USERNAME, Config.AI_API_PASSWORD)
+        # The message waited out the debounce window: re-read state the webhook saw
+        if not ConversationModel(mongo_client).auto_reply_allowed(conversation_id):
+            logger.info(f"Widget auto-reply: bot turned off or staff took over conversation {conversation_id}, skipping")
+            return
+
+        conv_id_legacy = f"widget:{oa_id}:{customer_id.split(':', 1)[1] if ':' in customer_id else customer_id}"
         # Call external chat API (microtunchat)
         try:
-            resp = requests.post(EXTERNAL_CHAT_API, json={'question': question}, timeout=120, auth=auth)
-            data = resp.json() if resp.status_code == 200 else {}
-        except Exception as e:
-            logger.error(f"Widget auto-reply API request failed: {e}")
+            if chat_api.streaming_enabled():
+                relay = _DeltaRelay(socketio, conversation_id, conv_id_legacy)
+                data = chat_api.ask_stream(question, relay.push)
+                relay.flush()
+            else:
+                data = chat_api.ask(question)
+        except chat_api.ChatApiUnavailable as e:
+            if relay:
+                relay.finish(aborted=True)
+            # Fail over to staff at once instead of leaving the visitor without a reply
+            logger.warning(f"Widget auto-reply API unavailable ({e.reason}): {e}; handing conversation over to staff")
+            hand_over_to_staff(mongo_client, 'widget', oa_id, customer_id.split(':', 1)[-1], question, organization_id=organization_id, conversation_id=conversation_id, socketio=socketio, notify=True)
             return
 
         answer = data.get('answer') if isinstance(data, dict) else None
@@ -52,57 +137,13 @@ def _auto_reply_worker_widget(mongo_client, oa_id, customer_id, conversation_id,
             needhelp = False
         if not answer:
             logger.info(f"Widget auto-reply: no answer from API for question: {question}")
+            if relay:
+                relay.finish(aborted=True)
             return
 
         # If needhelp: after sending the answer, disable bot_reply and tag bot-failed so staff can take over
         if needhelp:
-            try:
-                from models.conversation import ConversationModel
-                from utils.support_workflow import add_pending_support
-                from bson.objectid import ObjectId
-                from utils.support_dispatch import dispatch_support_needed
-
-                conv_model = ConversationModel(mongo_client)
-                # conversation_id is the DB _id (string) for this widget conversation
-                try:
-                    conv_model.set_bot_reply_by_id(conversation_id, False, organization_id=organization_id)
-                except Exception:
-                    pass
-
-                # Ensure tag persists as bot-failed (set_bot_reply_by_id may unset tags when no handler)
-                try:
-                    conv_obj_id = ObjectId(conversation_id)
-                except Exception:
-                    conv_obj_id = conversation_id
-                try:
-                    conv_model.collection.update_one(
-                        {'_id': conv_obj_id},
-                        {'$set': {'tags': 'bot-failed', 'updated_at': datetime.utcnow()}}
-                    )
-                except Exception:
-                    pass
-
-                try:
-                    add_pending_support(
-                        organization_id,
-                        f"widget:{oa_id}:{customer_id.split(':', 1)[1] if ':' in customer_id else customer_id}"
-                    )
-                except Exception:
-                    pass
-                try:
-                    dispatch_support_needed(
-                        mongo_client,
-                        organization_id,
-                        f"widget:{oa_id}:{customer_id.split(':', 1)[1] if ':' in customer_id else customer_id}",
-                        customer_name=None,
-                        content=question,
-                        platform='widget',
-                        socketio=socketio
-                    )
-                except Exception:
-                    pass
-            except Exception:
-                pass
+            hand_over_to_staff(mongo_client, 'widget', oa_id, customer_id.split(':', 1)[-1], question, organization_id=organization_id, conversation_id=conversation_id, socketio=socketio)
         try:
             from models.message import MessageModel
             from models.conversation import ConversationModel
@@ -133,11 +174,12 @@ def _auto_reply_worker_widget(mongo_client, oa_id, customer_id, conversation_id,
             )
         except Exception as e:
             logger.error(f"Widget auto-reply: failed to persist message: {e}")
+            if relay:
+                relay.finish(aborted=True)
             return
 
         # Emit socket events so UI updates in realtime (dashboard + widget)
         try:
-            conv_id_legacy = f"widget:{oa_id}:{customer_id.split(':', 1)[1] if ':' in customer_id else customer_id}"
             payload = {
                 'platform': 'widget',
                 'oa_id': oa_id,
@@ -150,6 +192,8 @@ def _auto_reply_worker_widget(mongo_client, oa_id, customer_id, conversation_id,
                 'sent_at': datetime.utcnow().isoformat() + 'Z',
                 'direction': 'out',
             }
+            if relay:
+                payload['stream_id'] = relay.stream_id
 
             # Also fetch latest conversation state so we can broadcast updated
             # bot_reply/tags in an update-conversation event (for realtime UI).
@@ -205,8 +249,13 @@ def _auto_reply_worker_widget(mongo_client, oa_id, customer_id, conversation_id,
                     _emit_socket('update-conversation', update_payload, account_id=None, organization_id=organization_id)
         except Exception as e:
             logger.debug(f"Widget auto-reply: socket emit failed: {e}")
+        if relay:
+            relay.finish(message_id=(sent_doc or {}).get('_id'))
     except Exception as e:
         logger.error(f"Widget auto-reply worker exception: {e}")
+        if relay:
+            # Close the stream so the visitor's draft does not stay on screen
+            relay.finish(aborted=True)
 
 
 @widget_bp.route('/api/widget/lead', methods=['POST'])
@@ -384,13 +433,12 @@ def submit_lead():
                 try:
                     mongo_client = current_app.mongo_client
                     socketio = getattr(current_app, 'socketio', None)
-                    t = threading.Thread(
-                        target=_auto_reply_worker_widget,
-                        args=(mongo_client, oa_id, customer_id, conversation_id_str, message, org_id, socketio),
-                        daemon=True
-                    )
-                    t.start()
-                    logger.info(f"Scheduled widget auto-reply worker for new conversation {conversation_id_str}")
+                    # Quick follow-up messages are combined into one question (utils/reply_debounce.py)
+                    reply_debounce.submit('widget', conversation_id_str, message, functools.partial(
+                        _auto_reply_worker_widget, mongo_client, oa_id, customer_id, conversation_id_str,
+                        organization_id=org_id, socketio=socketio,
+                    ))
+                    logger.info(f"Queued widget auto-reply for new conversation {conversation_id_str}")
                 except Exception as e:
                     logger.error(f"Failed to start widget auto-reply worker thread: {e}")
         except Exception:
@@ -467,7 +515,7 @@ def get_conversation_messages(conv_id):
             # Primary: Use organization-based query
             msgs = message_model.get_by_organization_and_conversation(
                 org_id, conversation_id,
-                limit=limit, skip=skip
+                limit=limit, skip=skip, profile='pane'
             )
             logger.info(f"Retrieved {len(msgs)} messages using organization context")
         else:
@@ -476,7 +524,8 @@ def get_conversation_messages(conv_id):
                 platform, oa_id, sender_id, 
                 limit=limit, skip=skip, 
                 conversation_id=conversation_id,
-                account_id=account_id
+                account_id=account_id,
+                profile='pane'
             )
             logger.info(f"Retrieved {len(msgs)} messages using legacy query")
         logger.info(f"Retrieved {len(msgs)} messages for conversation {conv_id}")
@@ -566,7 +615,11 @@ def send_conversation_message(conv_id):
     platform, oa_id, sender_id = parts
     data = request.get_json() or {}
     text = data.get('text')
-    image = data.get('image')
+    # Images may reference an uploaded blob (image_blob_id / blob URL) instead of base64
+    try:
+        image, stored_image = resolve_image_ref(data)
+    except BlobError as e:
+        return jsonify({'success': False, 'error_code': e.code, 'message': str(e)}), 400
 
     if not text and not image:
         return jsonify({'success': False, 'message': 'text or image is required'}), 400
@@ -621,7 +674,7 @@ def send_conversation_message(conv_id):
             handler_user = user_model.find_by_account_id(account_id)
             staff_name = handler_user.get('name') or handler_user.get('username') or "Staff"
             metadata = {'source': 'staff', 'type': 'widget', 'staff_name': staff_name}
-            if image: metadata['image'] = image
+            if image: metadata['image'] = stored_image
 
             message_doc = message_model.add_message(
                 platform='widget',
@@ -660,7 +713,7 @@ def send_conversation_message(conv_id):
             # 3. Add Message (Incoming from customer)
             metadata = {'source': 'widget', 'type': 'widget'}
             if image:
-                metadata['image'] = image
+                metadata['image'] = stored_image
             message_doc = message_model.add_message(
                 platform='widget',
                 oa_id=oa_id,
@@ -792,13 +845,11 @@ def send_conversation_message(conv_id):
                 try:
                     mongo_client = current_app.mongo_client
                     socketio = getattr(current_app, 'socketio', None)
-                    t = threading.Thread(
-                        target=_auto_reply_worker_widget,
-                        args=(mongo_client, oa_id, customer_id, conversation_id, text, org_id, socketio),
-                        daemon=True
-                    )
-                    t.start()
-                    logger.info(f"Scheduled widget auto-reply worker for conversation {conversation_id}")
+                    reply_debounce.submit('widget', conversation_id, text, functools.partial(
+                        _auto_reply_worker_widget, mongo_client, oa_id, customer_id, conversation_id,
+                        organization_id=org_id, socketio=socketio,
+                    ))
+                    logger.info(f"Queued widget auto-reply for conversation {conversation_id}")
                 except Exception as e:
                     logger.error(f"Failed to start widget auto-reply worker thread: {e}")
         except Exception:
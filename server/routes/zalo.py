@@ -1,22 +1,25 @@
 from flask import Blueprint, request, jsonify, current_app
 from models.integration import IntegrationModel
 from utils.redis_client import set_key, get_key, del_key
+from utils.message_dedup import claim_for_request, release_message_id, settle_claim, remember_sent
+from utils.zalo_events import normalize_zalo_event
+from utils.blob_store import BlobError, resolve_image_ref
+from utils.conditional import make_etag, not_modified_or_none, with_etag
+from utils import reply_debounce, chat_api
+from utils.support_workflow import hand_over_to_staff
 from config import Config
 import logging
 import secrets
 import base64
 import hashlib
 import requests
+import functools
 import json
 from datetime import datetime, timedelta
-import threading
 
 zalo_bp = Blueprint('zalo', __name__)
 logger = logging.getLogger(__name__)
 
-# External auto-reply chat API (same as Facebook integration)
-EXTERNAL_CHAT_API = 'https://microtunchat-app-1012095270393.us-central1.run.app/chat'
-
 
 def _auto_reply_worker_zalo(mongo_client, integration, oa_id, customer_platform_id, conversation_id, question, account_id_owner, organization_id, socketio=None):
     try:
@@ -24,12 +27,22 @@ def _auto_reply_worker_zalo(mongo_client, integration, oa_id, customer_platform_
             logger.debug('Auto-reply Zalo: empty question, skipping')
             return
 
-        auth = (Config.AI_API_USERNAME, Config.AI_API_PASSWORD)
+        # The message waited out the debounce window: re-read state the webhook saw
+        from models.conversation import ConversationModel
+        if not ConversationModel(mongo_client).auto_reply_allowed(conversation_id):
+            logger.info(f'Auto-reply Zalo: bot turned off or staff took over conversation {conversation_id}, skipping')
+            return
+        integration = IntegrationModel(mongo_client).find_by_platform_and_oa('zalo', oa_id, profile='webhook') or integration
+        if not integration.get('is_active'):
+            logger.info(f'Auto-reply Zalo: integration {oa_id} no longer active, skipping')
+            return
+
         try:
-            resp = requests.post(EXTERNAL_CHAT_API, json={'question': question}, timeout=120, auth=auth)
-            data = resp.json() if resp.status_code == 200 else {}
-        except Exception as e:
-            logger.error(f'Auto-reply Zalo API request failed: {e}')
+            data = chat_api.ask(question)
+        except chat_api.ChatApiUnavailable as e:
+            # Fail over to staff at once instead of leaving the customer without a reply
+            logger.warning(f"Auto-reply Zalo API unavailable ({e.reason}): {e}; handing conversation over to staff")
+            hand_over_to_staff(mongo_client, 'zalo', oa_id, customer_platform_id, question, organization_id=organization_id, account_id=account_id_owner, socketio=socketio, notify=True)
             return
 
         answer = data.get('answer') if isinstance(data, dict) else None
@@ -60,12 +73,12 @@ def _auto_reply_worker_zalo(mongo_client, integration, oa_id, customer_platform_
                     except Exception:
                         conv_obj_id = conv.get('_id')
                     # Set tags to bot-failed for this conversation
-                    conv_model.collection.update_one({'_id': conv_obj_id}, {'$set': {'tags': 'bot-failed', 'updated_at': datetime.utcnow()}})
+                    conv_model.set_tags_by_id(conv_obj_id, 'bot-failed')
                     # Disable bot_reply so subsequent customer messages don't auto-reply
                     try:
                         conv_model.set_bot_reply_by_id(conv.get('_id'), False, account_id=account_id_owner, organization_id=organization_id)
                         # ensure bot-failed tag remains after set_bot_reply_by_id adjusts tags
-                        conv_model.collection.update_one({'_id': conv_obj_id}, {'$set': {'tags': 'bot-failed', 'updated_at': datetime.utcnow()}})
+                        conv_model.set_tags_by_id(conv_obj_id, 'bot-failed')
                     except Exception:
                         pass
                     # Emit update so UI reflects failure
@@ -89,44 +102,7 @@ def _auto_reply_worker_zalo(mongo_client, integration, oa_id, customer_platform_
 
         # If AI indicates needhelp, we still send the answer to customer, then switch to "waiting support"
         if needhelp:
-            try:
-                from models.conversation import ConversationModel
-                conv_model = ConversationModel(mongo_client)
-                conv = conv_model.find_by_oa_and_customer(oa_id, f"zalo:{customer_platform_id}", organization_id=organization_id, account_id=account_id_owner)
-                if conv and conv.get('_id'):
-                    try:
-                        from bson.objectid import ObjectId
-                        conv_obj_id = ObjectId(conv.get('_id'))
-                    except Exception:
-                        conv_obj_id = conv.get('_id')
-                    try:
-                        conv_model.set_bot_reply_by_id(conv.get('_id'), False, account_id=account_id_owner, organization_id=organization_id)
-                    except Exception:
-                        pass
-                    try:
-                        conv_model.collection.update_one({'_id': conv_obj_id}, {'$set': {'tags': 'bot-failed', 'updated_at': datetime.utcnow()}})
-                    except Exception:
-                        pass
-                    try:
-                        from utils.support_workflow import add_pending_support
-                        add_pending_support(organization_id or conv.get('organizationId'), f"zalo:{oa_id}:{customer_platform_id}")
-                    except Exception:
-                        pass
-                    try:
-                        from utils.support_dispatch import dispatch_support_needed
-                        dispatch_support_needed(
-                            mongo_client,
-                            organization_id or conv.get('organizationId'),
-                            f"zalo:{oa_id}:{customer_platform_id}",
-                            customer_name=(conv.get('customer_info') or {}).get('name') if isinstance(conv, dict) else None,
-                            content=question,
-                            platform='zalo',
-                            socketio=socketio
-                        )
-                    except Exception:
-                        pass
-            except Exception:
-                pass
+            hand_over_to_staff(mongo_client, 'zalo', oa_id, customer_platform_id, question, organization_id=organization_id, account_id=account_id_owner, socketio=socketio)
         try:
             send_resp = _send_message_to_zalo(integration.get('access_token'), customer_platform_id, message_text=answer)
         except Exception as e:
@@ -153,6 +129,7 @@ def _auto_reply_worker_zalo(mongo_client, integration, oa_id, customer_platform_
                 conversation_id=conversation_id,
                 account_id=account_id_owner,
                 organization_id=organization_id,
+                platform_message_id=remember_sent('zalo', send_resp),
             )
 
             conversation_model.upsert_conversation(
@@ -569,6 +546,42 @@ def zalo_callback():
     return redirect(target, code=302)
 
 
+def _fetch_zalo_user_profile(access_token, user_id):
+    """Fetch display name/avatar for a Zalo user via the OA user detail API."""
+    if not access_token or str(access_token).startswith("mock"):
+        return {}
+
+    try:
+        url = "https://openapi.zalo.me/v3.0/oa/user/detail"
+        headers = {
+            "access_token": access_token,
+            "Content-Type": "application/json"
+        }
+
+        payload = {
+            "user_id": str(user_id)
+        }
+
+        # IMPORTANT: must use GET with JSON body, not params
+        resp = requests.get(url, headers=headers, json=payload, timeout=8)
+        data = resp.json() or {}
+
+        if data.get("error") != 0:
+            logger.warning(f"Zalo user detail API error for user {user_id}: {data}")
+            return {}
+
+        profile = data.get("data") or {}
+
+        return {
+            "name": profile.get("display_name"),
+            "avatar": profile.get("avatar"),
+        }
+
+    except Exception as e:
+        logger.warning(f"Fetch Zalo profile failed for {user_id}: {e}")
+        return {}
+
+
 @zalo_bp.route('/webhook', methods=['GET'])
 def webhook_verify():
     # Zalo verification - simply check verification token and echo challenge if present
@@ -588,143 +601,30 @@ def webhook_event():
     data = request.get_json() or {}
     logger.info(f"Zalo webhook event received: {data}")
 
-    # Example payloads may differ; try to extract oa_id, event type and sender
-    # Extract OA id from common locations (top-level, recipient, data, or page_id)
-    oa_id = (
-        data.get('oa_id')
-        or data.get('page_id')
-        or (data.get('recipient') or {}).get('id')
-        or (data.get('to') or {}).get('id')
-        or (data.get('data') or {}).get('oa_id')
-    )
-
-    # Determine event type (support event_name variants)
-    event_type = (
-        data.get('event')
-        or data.get('event_name')
-        or (data.get('data') or {}).get('event')
-        or (data.get('data') or {}).get('type')
-    )
-
-    message = None
-    sender_id = None
-    recipient_id = None
-    direction = 'in'  # Default to incoming
-
-    # Attempt to find message contents (support multiple webhook shapes)
-    try:
-        # Case A: nested data payload (common format)
-        d = data.get('data') if isinstance(data.get('data'), dict) else None
-        if d:
-            dtype = d.get('type') or d.get('event') or d.get('event_name')
-            # Incoming from user
-            if dtype and 'user' in dtype and 'send' in dtype:
-                message = d.get('text') or d.get('message')
-                sender_id = (d.get('sender') or {}).get('id') or d.get('sender') or d.get('user_id')
-                recipient_id = (d.get('recipient') or {}).get('id') or d.get('recipient') or (d.get('to') or {}).get('id')
-                event_type = dtype
-                direction = 'in'
-            # Outgoing from OA
-            elif dtype and ('oa' in dtype or 'bot' in dtype) and ('send' in dtype or 'reply' in dtype):
-                message = d.get('text') or d.get('message')
-                recipient_id = (d.get('recipient') or {}).get('id') or d.get('recipient') or d.get('user_id') or (d.get('to') or {}).get('id')
-                sender_id = oa_id or (d.get('sender') or {}).get('id')
-                event_type = dtype
-                direction = 'out'
-            else:
-                # generic handlers
-                message = d.get('text') or d.get('message') or None
-                sender_id = (d.get('sender') or {}).get('id') or d.get('sender') or d.get('user_id') or (d.get('from') or {}).get('id')
-                recipient_id = (d.get('recipient') or {}).get('id') or d.get('recipient') or (d.get('to') or {}).get('id')
-        else:
-            # Case B: top-level event_name style (simple payloads)
-            etop = data.get('event_name') or data.get('event')
-            if etop and etop.startswith('user'):
-                message = (data.get('message') or {}).get('text') or data.get('text')
-                sender_id = (data.get('sender') or {}).get('id') or data.get('sender') or data.get('user_id')
-                recipient_id = (data.get('recipient') or {}).get('id') or (data.get('to') or {}).get('id')
-                event_type = etop
-                direction = 'in'
-            elif etop and (etop.startswith('oa') or etop.startswith('bot')):
-                message = (data.get('message') or {}).get('text') or data.get('text')
-                recipient_id = (data.get('recipient') or {}).get('id') or (data.get('to') or {}).get('id') or data.get('user_id')
-                sender_id = oa_id
-                event_type = etop
-                direction = 'out'
-            else:
-                # Fallback generic top-level
-                message = (data.get('message') or {}).get('text') or data.get('text') or None
-                sender_id = (data.get('sender') or {}).get('id') or data.get('sender') or data.get('user_id') or (data.get('from') or {}).get('id')
-                recipient_id = (data.get('recipient') or {}).get('id') or (data.get('to') or {}).get('id')
-    except Exception as e:
-        logger.warning(f"Failed to extract message fields: {e}")
+    # Normalize the payload (see utils/zalo_events for the supported shapes)
+    evt = normalize_zalo_event(data)
+    oa_id = evt.oa_id
+    event_type = evt.event_name
+    message = evt.text
+    sender_id = evt.sender_id
+    recipient_id = evt.recipient_id
+    direction = evt.direction
+    message_obj = evt.message_obj
+    image_url = evt.image_url
 
     logger.info(f"Parsed Zalo webhook: oa_id={oa_id}, event_type={event_type}, sender={sender_id}, recipient={recipient_id}, direction={direction}, message={message}")
 
-    message_obj = None
-    try:
-        # If nested payload exists, prefer its 'message' sub-object or the nested dict itself
-        d = data.get('data') if isinstance(data.get('data'), dict) else None
-        if d:
-            message_obj = d.get('message') or d
-        elif isinstance(data.get('message'), dict):
-            message_obj = data.get('message')
-        else:
-            message_obj = None
-    except Exception:
-        message_obj = None
-
-    # Try to extract an image URL from the Zalo webhook message payload
-    image_url = None
-    try:
-        obj = message_obj or {}
-
-        # Common Zalo payload shapes put media under "attachments" or "attachment"
-        attachments = []
-        if isinstance(obj.get('attachments'), list):
-            attachments = obj.get('attachments') or []
-        elif isinstance(obj.get('attachment'), dict):
-            attachments = [obj.get('attachment')]
-        elif isinstance(obj.get('attachment'), list):
-            attachments = obj.get('attachment') or []
-
-        for att in attachments:
-            if not isinstance(att, dict):
-                continue
-            payload = att.get('payload') or {}
-            candidate_urls = []
-
-            if isinstance(payload, dict):
-                # Direct image URL
-                direct_url = payload.get('url') or payload.get('href') or payload.get('thumbnail')
-                if direct_url:
-                    candidate_urls.append(direct_url)
-
-                # Template/media style: payload.elements[].media / media_content
-                elements = payload.get('elements') or []
-                for el in elements:
-                    if not isinstance(el, dict):
-                        continue
-                    media = el.get('media') or el.get('media_content') or {}
-                    if isinstance(media, dict):
-                        candidate_urls.append(
-                            media.get('url') or media.get('src') or media.get('thumbnail')
-                        )
-
-            for u in candidate_urls:
-                if u:
-                    image_url = u
-                    break
-            if image_url:
-                break
-    except Exception:
-        image_url = None
+    # Drop redeliveries and echoes of messages we already processed/sent (O(1), before any DB work)
+    platform_msg_id = evt.msg_id
+    if platform_msg_id and not claim_for_request('zalo', platform_msg_id):
+        logger.info(f"Duplicate Zalo webhook for msg_id={platform_msg_id}; ignoring")
+        return jsonify({'success': True, 'duplicate': True}), 200
 
     # Look up integration by oa_id (support fallbacks where oa_id may be stored in meta.profile)
     integration_model = IntegrationModel(current_app.mongo_client)
     integration = None
     if oa_id:
-        integration = integration_model.find_by_platform_and_oa('zalo', oa_id)
+        integration = integration_model.find_by_platform_and_oa('zalo', oa_id, profile='webhook')
         if not integration:
             # Fallback: check meta.profile.oa_id (some integrations may have oa_id only in meta(profile) due to earlier bugs)
             try:
@@ -778,12 +678,15 @@ def webhook_event():
     # IMPORTANT: preserve is_staff flag if this user is a staff Zalo ID
     existing_customer = None
     try:
-        existing_customer = customer_model.find_by_id(customer_id)
+        existing_customer = customer_model.find_cached_by_id(customer_id)
     except Exception:
         existing_customer = None
 
-    # Also figure out if there is a staff user record tied to this Zalo ID
-    staff_user = user_model.find_by_zalo_user_id(customer_platform_id)
+    # Also figure out if there is a staff user record tied to this Zalo ID.
+    # The in-memory staff id set avoids a users lookup for ordinary customers.
+    staff_user = None
+    if user_model.is_staff_zalo_id(customer_platform_id):
+        staff_user = user_model.find_by_zalo_user_id(customer_platform_id)
 
     # Determine if sender should be treated as a staff user.  We primarily
     # look at the customer record (it may have been flagged previously), but we
@@ -927,10 +830,7 @@ def webhook_event():
                         logger.debug(f"Lock attempt result for conv {conv_doc.get('_id')}: {locked}")
                         # record the staff's personal zalo id on the conversation so we can forward later
                         try:
-                            conv_model.collection.update_one(
-                                {'_id': conv_doc.get('_id')},
-                                {'$set': {'current_handler.staff_zalo_id': str(customer_platform_id)}}
-                            )
+                            conv_model.set_handler_staff_zalo_id(conv_doc.get('_id'), customer_platform_id)
                         except Exception:
                             pass
                     except Exception as e:
@@ -938,23 +838,10 @@ def webhook_event():
                 else:
                     # create a pseudo-lock using staff_name and their zalo_id for direct forwarding
                     try:
-                        now = datetime.utcnow()
-                        expires_at = now + timedelta(seconds=300)
-                        conv_model.collection.update_one(
-                            {'_id': conv_doc.get('_id')},
-                            {'$set': {
-                                'current_handler': {
-                                    'accountId': staff_account_id,
-                                    'name': staff_name,
-                                    'started_at': now,
-                                    'staff_zalo_id': str(customer_platform_id),  # Store staff zalo id for forwarding
-                                },
-                                'lock_expires_at': expires_at,
-                                'updated_at': now,
-                                'tags': 'staff-interacting',
-                            }}
+                        locked = conv_model.pseudo_lock(
+                            conv_doc.get('_id'), staff_name, customer_platform_id,
+                            handler_account_id=staff_account_id, ttl_seconds=300,
                         )
-                        locked = conv_model._serialize(conv_model.collection.find_one({'_id': conv_doc.get('_id')}))
                         logger.info("Pseudo-locked conversation for anonymous staff", extra={'conv_id': str(target_conv_id), 'staff_zalo': str(customer_platform_id)})
                     except Exception as e:
                         logger.warning(f"Failed to pseudo-lock conv for anonymous staff: {e}")
@@ -1029,9 +916,9 @@ def webhook_event():
                     conv_id_db = conv_doc.get('_id')
                     # Prefer organization-scoped conversation query for all platforms
                     if org_id and conv_id_db:
-                        recent = msg_model.get_by_organization_and_conversation(org_id, conv_id_db, limit=20, skip=0)
+                        recent = msg_model.get_by_organization_and_conversation(org_id, conv_id_db, limit=20, skip=0, profile='pane')
                     else:
-                        recent = msg_model.get_messages(target_platform, target_oa_id, target_sender_id, limit=20, skip=0, conversation_id=conv_id_db, account_id=None)
+                        recent = msg_model.get_messages(target_platform, target_oa_id, target_sender_id, limit=20, skip=0, conversation_id=conv_id_db, account_id=None, profile='pane')
                     lines = []
 
                     for m in recent[-10:]:  # chỉ lấy 10 tin cuối thôi
@@ -1274,6 +1161,7 @@ def webhook_event():
                     conversation_id=conv_db_id,
                     account_id=owner_account_id,
                     organization_id=org_id,
+                    platform_message_id=remember_sent(target_platform, send_resp) if target_platform in ('facebook', 'zalo') else None,
                 )
                 conv_model.upsert_conversation(
                     oa_id=target_oa_id,
@@ -1337,41 +1225,12 @@ def webhook_event():
         needs_fetch = True
 
     if needs_fetch:
-        def _fetch_zalo_user_profile(access_token, user_id):
-            if not access_token or str(access_token).startswith("mock"):
-                return {}
-
-            try:
-                url = "https://openapi.zalo.me/v3.0/oa/user/detail"
-                headers = {
-                    "access_token": access_token,
-                    "Content-Type": "application/json"
-                }
-
-                payload = {
-                    "user_id": str(user_id)
-                }
-
-                # IMPORTANT: must use GET with JSON body, not params
-                resp = requests.get(url, headers=headers, json=payload, timeout=8)
-                data = resp.json() or {}
-
-                if data.get("error") != 0:
-                    logger.warning(f"Zalo user detail API error for user {user_id}: {data}")
-                    return {}
-
-                profile = data.get("data") or {}
-
-                return {
-                    "name": profile.get("display_name"),
-                    "avatar": profile.get("avatar"),
-                }
-
-            except Exception as e:
-                logger.warning(f"Fetch Zalo profile failed for {user_id}: {e}")
-                return {}
-
-        fetched = _fetch_zalo_user_profile(integration.get('access_token'), customer_platform_id)
+        from utils.profile_cache import get_profile
+        access_token = integration.get('access_token')
+        fetched = get_profile(
+            'zalo', customer_platform_id,
+            lambda: _fetch_zalo_user_profile(access_token, customer_platform_id)
+        )
         if fetched:
             try:
                 # Update customer record with fetched fields
@@ -1405,7 +1264,7 @@ def webhook_event():
             # If existing has no oa_id but we resolved one, patch it so future lookups succeed
             if not existing_conv.get('oa_id') and resolved_oa_id:
                 try:
-                    conversation_model.collection.update_one({'_id': existing_conv.get('_id')}, {'$set': {'oa_id': resolved_oa_id, 'updated_at': datetime.utcnow()}})
+                    conversation_model.set_oa_id(existing_conv.get('_id'), resolved_oa_id)
                     try:
                         logger.info(f"Patched conversation {str(existing_conv.get('_id'))} with oa_id {resolved_oa_id}")
                     except Exception:
@@ -1466,7 +1325,10 @@ def webhook_event():
     try:
         message_doc = None
         if direction == 'out':
-            existing = message_model.find_recent_similar(platform='zalo', oa_id=integration.get('oa_id'), sender_id=customer_platform_id, conversation_id=conversation_id, direction='out', text=message, within_seconds=10)
+            # Echoes carrying a msg_id are de-duplicated by id; text matching is only a fallback
+            existing = None
+            if not platform_msg_id:
+                existing = message_model.find_recent_similar(platform='zalo', oa_id=integration.get('oa_id'), sender_id=customer_platform_id, conversation_id=conversation_id, direction='out', text=message, within_seconds=10)
             if existing:
                 message_doc = existing
                 deduped = True
@@ -1487,6 +1349,7 @@ def webhook_event():
                     conversation_id=conversation_id,
                     account_id=integration.get('accountId'),
                     organization_id=integration.get('organizationId'),
+                    platform_message_id=platform_msg_id,
                 )
         else:
             message_doc = message_model.add_message(
@@ -1504,13 +1367,20 @@ def webhook_event():
                 conversation_id=conversation_id,
                 account_id=integration.get('accountId'),
                 organization_id=integration.get('organizationId'),
+                platform_message_id=platform_msg_id,
             )
+        if message_doc and message_doc.get('duplicate'):
+            deduped = True
+            logger.info(f"Zalo message {platform_msg_id} already stored; skipping duplicate")
+        settle_claim('zalo', platform_msg_id)
     except Exception as e:
         logger.error(f"Failed to persist Zalo message: {e}")
-        message_doc = None
+        # Not stored: let Zalo's retry through instead of dropping it as a duplicate
+        release_message_id('zalo', platform_msg_id)
+        return jsonify({'success': False, 'message': 'Failed to persist message'}), 500
 
     # Forward incoming customer messages (text and/or image) to active staff handler (two-way bridge)
-    if direction == 'in' and (message or image_url) and not is_staff_sender and conversation_id:
+    if direction == 'in' and (message or image_url) and not is_staff_sender and conversation_id and not deduped:
         try:
             from utils.support_dispatch import forward_customer_message_to_staff
             logger.info(
@@ -1589,13 +1459,12 @@ def webhook_event():
                     try:
                         mongo_client = current_app.mongo_client
                         socketio = getattr(current_app, 'socketio', None)
-                        t = threading.Thread(
-                            target=_auto_reply_worker_zalo,
-                            args=(mongo_client, integration, integration.get('oa_id'), customer_platform_id, conversation_id, message, account_id_owner, integration.get('organizationId'), socketio),
-                            daemon=True
-                        )
-                        t.start()
-                        logger.info(f"Scheduled Zalo auto-reply worker for conversation {conversation_id}")
+                        # Quick follow-up messages are combined into one question (utils/reply_debounce.py)
+                        reply_debounce.submit('zalo', conversation_id, message, functools.partial(
+                            _auto_reply_worker_zalo, mongo_client, integration, integration.get('oa_id'), customer_platform_id, conversation_id,
+                            account_id_owner=account_id_owner, organization_id=integration.get('organizationId'), socketio=socketio,
+                        ))
+                        logger.info(f"Queued Zalo auto-reply for conversation {conversation_id}")
                     except Exception as e:
                         logger.error(f"Failed to start Zalo auto-reply worker thread: {e}")
             except Exception:
@@ -1980,11 +1849,11 @@ def list_conversations():
         
         # Get conversations using organizationId for org-level isolation
         if user_org_id:
-            convs = conversation_model.list_by_organization(user_org_id, limit=100)
+            convs = conversation_model.list_by_organization(user_org_id, limit=100, profile='inbox')
             logger.info(f"Found {len(convs)} conversations from organization {user_org_id}")
         else:
             # Fallback to account-based query for backward compat
-            convs = conversation_model.find_by_oa(oa_id, limit=100, account_id=account_id)
+            convs = conversation_model.find_by_oa(oa_id, limit=100, account_id=account_id, profile='inbox')
             logger.info(f"Found {len(convs)} conversations from oa_id {oa_id} with account_id {account_id}")
         if len(convs) == 0:
             logger.info(f"No conversations in new structure, trying legacy method")
@@ -2056,9 +1925,24 @@ def list_conversations():
         page_name = integration.get('name') if integration else None
         avatar_url = integration.get('avatar_url') if integration else None
     except Exception:
+        integration = None
         page_name = None
         avatar_url = None
 
+    # Check integration status
+    is_connected = bool(integration and integration.get('is_active', True))
+    disconnected_at = integration.get('updated_at') if integration and not is_connected else None
+
+    # Conditional GET before the per-row work: rows only change when a conversation version does
+    etag = make_etag(
+        'zalo-conversations', account_id, oa_id,
+        [(c.get('_id'), c.get('version'), c.get('time'), c.get('unreadCount')) for c in convs],
+        is_connected, disconnected_at, page_name, avatar_url,
+    )
+    not_modified = not_modified_or_none(etag, 'zalo_conversations')
+    if not_modified is not None:
+        return not_modified
+
     out = []
     for c in convs:
         if 'customer_id' in c:
@@ -2100,18 +1984,6 @@ def list_conversations():
         else:
             out.append(c)
 
-    # Check integration status
-    try:
-        integration = model.find_by_platform_and_oa('zalo', oa_id)
-        is_connected = bool(integration and integration.get('is_active', True))
-        disconnected_at = None
-        if not is_connected and integration:
-            disconnected_at = integration.get('updated_at')
-    except Exception as e:
-        logger.error(f"Error checking integration status: {e}")
-        is_connected = False
-        disconnected_at = None
-
     # Add platform_status to each conversation
     for conv in out:
         conv['platform_status'] = {
@@ -2123,7 +1995,7 @@ def list_conversations():
     if len(out) == 0:
         logger.warning(f"No conversations found for oa_id {oa_id}. Check if conversations exist in DB.")
 
-    return jsonify({'success': True, 'data': out, 'page': {'name': page_name, 'avatar': avatar_url}}), 200
+    return with_etag(jsonify({'success': True, 'data': out, 'page': {'name': page_name, 'avatar': avatar_url}}), etag), 200
 
 
 @zalo_bp.route('/api/zalo/conversations/<path:conv_id>/messages', methods=['GET'])
@@ -2201,8 +2073,7 @@ def get_conversation_messages(conv_id):
                 # If oa_id in raw is not set but conv_id's oa_id is provided and looks like a real id (not 'null' string), set it
                 try:
                     if (not conversation_doc.get('oa_id')) and oa_id and oa_id.lower() not in ['null', 'none', '']:
-                        conversation_model.collection.update_one({'_id': conversation_doc.get('_id')}, {'$set': {'oa_id': oa_id, 'updated_at': datetime.utcnow()}})
-                        conversation_doc = conversation_model.collection.find_one({'_id': conversation_doc.get('_id')})
+                        conversation_doc = conversation_model.set_oa_id(conversation_doc.get('_id'), oa_id) or conversation_doc
                 except Exception:
                     pass
 
@@ -2213,12 +2084,23 @@ def get_conversation_messages(conv_id):
             except Exception:
                 conversation_id = None
 
+        # Conditional GET: the pane only changes with the conversation version or a new message
+        etag = None
+        if conversation_doc and conversation_id:
+            etag = make_etag(
+                'zalo-messages', account_id, conversation_id, conversation_doc.get('version'),
+                message_model.latest_message_id(conversation_id), limit, skip,
+            )
+            not_modified = not_modified_or_none(etag, 'zalo_messages')
+            if not_modified is not None:
+                return not_modified
+
         # Get messages using conversation_id and organizationId if available
         if user_org_id and conversation_id:
             # Primary: Use organization-based query
             msgs = message_model.get_by_organization_and_conversation(
                 user_org_id, conversation_id,
-                limit=limit, skip=skip
+                limit=limit, skip=skip, profile='pane'
             )
             logger.info(f"Retrieved {len(msgs)} messages using organization context")
         else:
@@ -2227,7 +2109,8 @@ def get_conversation_messages(conv_id):
                 platform, oa_id, sender_id,
                 limit=limit, skip=skip,
                 conversation_id=conversation_id,
-                account_id=account_id
+                account_id=account_id,
+                profile='pane'
             )
             logger.info(f"Retrieved {len(msgs)} messages using legacy query")
         logger.info(f"Retrieved {len(msgs)} messages for conversation {conv_id}")
@@ -2251,19 +2134,9 @@ def get_conversation_messages(conv_id):
     except Exception:
         pass
 
-    payload = {'success': True, 'data': msgs, 'conversation': conversation_doc}
-    try:
-        return jsonify(payload), 200
-    except TypeError as e:
-        logger.warning(f"Messages not JSON serializable, attempting to normalize: {e}")
-        try:
-            import json
-            safe_msgs = json.loads(json.dumps(msgs, default=str))
-            payload['data'] = safe_msgs
-            return jsonify(payload), 200
-        except Exception as e2:
-            logger.error(f"Failed to normalize messages for JSON response: {e2}")
-            return jsonify({'success': False, 'message': 'Internal error formatting messages'}), 500
+    # ObjectId/datetime values are handled by the app JSON provider
+    response = jsonify({'success': True, 'data': msgs, 'conversation': conversation_doc})
+    return (with_etag(response, etag) if etag else response), 200
 
 
 @zalo_bp.route('/api/zalo/conversations/<path:conv_id>/mark-read', methods=['POST'])
@@ -2355,8 +2228,12 @@ def send_conversation_message(conv_id):
 
     data = request.get_json() or {}
     text = data.get('text')
-    image = data.get('image')
-    
+    # Images may reference an uploaded blob (image_blob_id / blob URL) instead of base64
+    try:
+        image, stored_image = resolve_image_ref(data)
+    except BlobError as e:
+        return jsonify({'success': False, 'error_code': e.code, 'message': str(e)}), 400
+
     if not text and not image:
         return jsonify({'success': False, 'message': 'text or image is required'}), 400
 
@@ -2528,7 +2405,7 @@ def send_conversation_message(conv_id):
             'page_profile': page_profile
         }
         if image:
-            metadata['image'] = image
+            metadata['image'] = stored_image
             metadata['has_attachment'] = True
             metadata['attachment_type'] = 'image'
             for resp in send_resp.get('responses', []):
@@ -2547,6 +2424,7 @@ def send_conversation_message(conv_id):
             conversation_id=conversation_id,
             account_id=integration.get('accountId'),
             organization_id=integration.get('organizationId'),
+            platform_message_id=remember_sent('zalo', send_resp),
         )
 
         recipient_profile = {
@@ -2665,48 +2543,39 @@ def send_conversation_message(conv_id):
 
 
 # Token refresh helper (can be used by scheduler)
-def refresh_expiring_tokens(mongo_client):
-    integration_model = IntegrationModel(mongo_client)
-    cutoff = datetime.utcnow() + timedelta(seconds=Config.TOKEN_REFRESH_LEAD_SECONDS)
-    expiring = integration_model.collection.find({
-        "platform": "zalo",
-        "expires_at": {"$lt": cutoff},
-        "is_active": True
-    })
-    for item in expiring:
-        try:
-            refresh_token = item.get('refresh_token')
-            if not refresh_token:
-                continue
+def _refresh_zalo_token(item):
+    """Exchange an integration's one-time Zalo refresh token for a new token pair."""
+    token_url = "https://oauth.zalo.me/v4/oa/access_token"
 
-            token_url = "https://oauth.zalo.me/v4/oa/access_token"
-            
-            headers = {
-                'Content-Type': 'application/x-www-form-urlencoded',
-                'secret_key': Config.ZALO_APP_SECRET
-            }
-            
-            payload = {
-                'refresh_token': refresh_token,
-                'app_id': Config.ZALO_APP_ID,
-                'grant_type': 'refresh_token'
-            }
+    headers = {
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'secret_key': Config.ZALO_APP_SECRET
+    }
 
-            # Gửi request (Sử dụng data= cho x-www-form-urlencoded)
-            resp = requests.post(token_url, data=payload, headers=headers, timeout=15)
-            data = resp.json()
-
-            if resp.status_code == 200 and 'access_token' in data:
-                # LƯU Ý: Phải cập nhật cả refresh_token mới vì nó chỉ dùng được 1 lần
-                integration_model.update_tokens(
-                    item.get('_id'), 
-                    access_token=data.get('access_token'), 
-                    refresh_token=data.get('refresh_token'), 
-                    expires_in=int(data.get('expires_in'))
-                )
-                logger.info(f"Successfully refreshed Zalo token for OA: {item.get('oa_id')}")
-            else:
-                logger.error(f"Zalo V4 Refresh Error: {data}")
-                
-        except Exception as e:
-            logger.error(f"Critical error in refresh scheduler: {e}")
\ No newline at end of file
+    payload = {
+        'refresh_token': item.get('refresh_token'),
+        'app_id': Config.ZALO_APP_ID,
+        'grant_type': 'refresh_token'
+    }
+
+    # Gửi request (Sử dụng data= cho x-www-form-urlencoded)
+    resp = requests.post(token_url, data=payload, headers=headers, timeout=15)
+    data = resp.json()
+
+    if resp.status_code == 200 and 'access_token' in data:
+        # LƯU Ý: Phải cập nhật cả refresh_token mới vì nó chỉ dùng được 1 lần
+        return {
+            'access_token': data.get('access_token'),
+            'refresh_token': data.get('refresh_token'),
+            'expires_in': int(data.get('expires_in')),
+        }
+    raise RuntimeError(f"Zalo V4 Refresh Error: {data}")
+
+
+def refresh_expiring_tokens(mongo_client):
+    """Scheduler job: refresh expiring Zalo tokens (leased + concurrent, see utils/token_refresh.py)."""
+    from utils.token_refresh import run_token_refresh
+    try:
+        return run_token_refresh(mongo_client, 'zalo', _refresh_zalo_token)
+    except Exception as e:
+        logger.error(f"Critical error in refresh scheduler: {e}")
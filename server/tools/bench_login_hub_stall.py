@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Login benchmark: how long does bcrypt stall the eventlet hub?
+
+A ticker greenlet sleeps for --tick-ms in a loop and records how late each
+wake-up is. While it runs, --concurrency greenlets each perform --logins
+password checks, either:
+
+  direct   bcrypt.checkpw on the hub thread (the previous behaviour)
+  pooled   utils.password_hashing.check_password (eventlet.tpool + bounded queue)
+
+With `direct`, every check blocks all greenlets for the full bcrypt cost, so
+the worst tick lateness approaches cost x concurrency. With `pooled`, the hub
+keeps ticking and lateness stays near zero.
+
+Usage:
+    python tools/bench_login_hub_stall.py [--logins 20] [--concurrency 8] [--rounds 10] [--tick-ms 5]
+"""
+
+import eventlet
+eventlet.monkey_patch()
+
+import sys
+import os
+import time
+import argparse
+
+import bcrypt
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.password_hashing import check_password
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))]
+
+
+def run(label, check, hashed, logins, concurrency, tick_ms):
+    lateness = []
+    running = [True]
+
+    def ticker():
+        interval = tick_ms / 1000.0
+        while running[0]:
+            start = time.perf_counter()
+            eventlet.sleep(interval)
+            lateness.append(max(0.0, time.perf_counter() - start - interval) * 1000.0)
+
+    def client():
+        for _ in range(logins):
+            assert check(b'correct horse battery staple', hashed)
+
+    tick = eventlet.spawn(ticker)
+    eventlet.sleep(0)
+    start = time.perf_counter()
+    pool = eventlet.GreenPool(concurrency)
+    for _ in range(concurrency):
+        pool.spawn(client)
+    pool.waitall()
+    elapsed = time.perf_counter() - start
+    running[0] = False
+    tick.wait()
+
+    total = logins * concurrency
+    print(f"  {label:<8} {total / elapsed:>8.1f} logins/s   "
+          f"hub lateness p50 {percentile(lateness, 50):>7.1f} ms  "
+          f"p99 {percentile(lateness, 99):>7.1f} ms  max {max(lateness or [0]):>7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=20, help='checks per client greenlet')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent client greenlets')
+    parser.add_argument('--rounds', type=int, default=10, help='bcrypt cost factor')
+    parser.add_argument('--tick-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    hashed = bcrypt.hashpw(b'correct horse battery staple', bcrypt.gensalt(args.rounds))
+    print(f"bcrypt cost {args.rounds}, {args.concurrency} clients x {args.logins} logins")
+
+    run('direct', bcrypt.checkpw, hashed, args.logins, args.concurrency, args.tick_ms)
+    run('pooled', lambda pw, h: check_password(pw.decode('utf-8'), h), hashed,
+        args.logins, args.concurrency, args.tick_ms)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
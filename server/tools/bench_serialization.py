@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for response serialization (utils/serialization.py).
+
+Builds a conversation list page and a message pane shaped like real Mongo
+documents (ObjectId ids, naive UTC datetimes, nested metadata) and compares:
+
+  legacy     the per-model recursive hasattr/isinstance normalizer that
+             utils.serialization replaced, followed by json.dumps
+  to_jsonable  the type-dispatched converter + json.dumps
+  provider   AppJSONProvider.dumps on the raw documents (orjson when installed)
+
+Usage:
+    python tools/bench_serialization.py [--conversations 50] [--messages 50] [--iterations 200]
+"""
+
+import sys
+import os
+import json
+import argparse
+import timeit
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import serialization
+from utils.serialization import to_jsonable, AppJSONProvider
+
+
+def legacy_normalize(value):
+    """The normalizer previously copied into each model's _serialize."""
+    try:
+        if isinstance(value, ObjectId):
+            return str(value)
+        if hasattr(value, 'isoformat') and callable(getattr(value, 'isoformat')):
+            try:
+                return value.isoformat() + 'Z'
+            except Exception:
+                return str(value)
+        if isinstance(value, dict):
+            return {k: legacy_normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [legacy_normalize(v) for v in value]
+        return value
+    except Exception:
+        return str(value)
+
+
+def make_conversations(n):
+    now = datetime.utcnow()
+    docs = []
+    for i in range(n):
+        docs.append({
+            '_id': ObjectId(),
+            'oa_id': '4318927465019283746',
+            'customer_id': f"zalo:{8000000000000000000 + i}",
+            'platform': 'zalo',
+            'organizationId': ObjectId(),
+            'chatbotId': ObjectId(),
+            'customer_info': {'name': f"Khách hàng {i}", 'avatar': 'https://example.invalid/a.jpg'},
+            'last_message': {'text': 'Xin chào, tôi muốn hỏi về sản phẩm', 'created_at': now - timedelta(minutes=i)},
+            'unread_count': i % 5,
+            'bot_reply': bool(i % 2),
+            'nicknames': {str(ObjectId()): 'Anh A'},
+            'lock': {'locked_by': None, 'locked_at': None},
+            'tags': ['vip', 'new'],
+            'created_at': now - timedelta(days=i),
+            'updated_at': now - timedelta(minutes=i),
+        })
+    return docs
+
+
+def make_messages(n):
+    now = datetime.utcnow()
+    conv_id = ObjectId()
+    docs = []
+    for i in range(n):
+        docs.append({
+            '_id': ObjectId(),
+            'platform': 'facebook',
+            'oa_id': '109283746501928',
+            'sender_id': '7283746501928374',
+            'conversation_id': conv_id,
+            'direction': 'in' if i % 2 else 'out',
+            'text': 'Cảm ơn bạn đã liên hệ, chúng tôi sẽ phản hồi sớm.',
+            'metadata': {
+                'mid': f"m_{i}",
+                'api_response': {'recipient_id': '7283746501928374', 'message_id': f"m_{i}"},
+                'sent_by': {'accountId': ObjectId(), 'name': 'Staff'},
+            },
+            'sender_profile': {'name': 'Nguyễn Văn A', 'avatar': 'https://example.invalid/b.jpg'},
+            'is_read': True,
+            'bot_reply': False,
+            'organizationId': ObjectId(),
+            'created_at': now - timedelta(seconds=i * 30),
+        })
+    return docs
+
+
+def bench(label, func, iterations):
+    seconds = min(timeit.repeat(func, number=iterations, repeat=3))
+    us = seconds / iterations * 1e6
+    print(f"  {label:<34} {us:>10.1f} µs/payload")
+    return us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conversations', type=int, default=50)
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    class _App:
+        # DefaultJSONProvider only needs an object to hold a weakref to
+        pass
+
+    provider = AppJSONProvider(_App())
+    compact = {'separators': (',', ':')}
+    print(f"orjson backend: {'yes' if serialization.orjson is not None else 'no (stdlib json)'}")
+
+    payloads = (
+        ('inbox list', make_conversations(args.conversations)),
+        ('message pane', make_messages(args.messages)),
+    )
+    for name, docs in payloads:
+        print(f"\n{name} ({len(docs)} docs)")
+        bench('legacy normalize', lambda: [legacy_normalize(d) for d in docs], args.iterations)
+        bench('to_jsonable', lambda: [to_jsonable(d) for d in docs], args.iterations)
+        bench('legacy normalize + json.dumps',
+              lambda: json.dumps({'data': [legacy_normalize(d) for d in docs]}, **compact), args.iterations)
+        bench('to_jsonable + json.dumps',
+              lambda: json.dumps({'data': [to_jsonable(d) for d in docs]}, **compact), args.iterations)
+        bench('provider.dumps (raw docs)', lambda: provider.dumps({'data': docs}, **compact), args.iterations)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
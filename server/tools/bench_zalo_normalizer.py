@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the Zalo webhook normalizer (utils/zalo_events.py).
+
+Parses every payload in the recorded corpus repeatedly and reports the
+per-event parse cost.
+
+Usage:
+    python tools/bench_zalo_normalizer.py [--corpus tools/corpus/zalo.jsonl] [--iterations 20000]
+"""
+
+import sys
+import os
+import json
+import argparse
+import timeit
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.zalo_events import normalize_zalo_event
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus', 'zalo.jsonl')
+
+
+def load_corpus(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=DEFAULT_CORPUS)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    payloads = load_corpus(args.corpus)
+    if not payloads:
+        print(f"No payloads in {args.corpus}")
+        return 1
+
+    print(f"{'event':<28} {'direction':<9} {'ns/parse':>10}")
+    print('-' * 50)
+    total_ns = 0.0
+    for payload in payloads:
+        evt = normalize_zalo_event(payload)
+        seconds = min(timeit.repeat(lambda: normalize_zalo_event(payload), number=args.iterations, repeat=3))
+        ns = seconds / args.iterations * 1e9
+        total_ns += ns
+        print(f"{str(evt.event_name):<28} {evt.direction:<9} {ns:>10.0f}")
+    print('-' * 50)
+    print(f"{'mean':<38} {total_ns / len(payloads):>10.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Local debugging SMTP server for the email outbox.
+
+Accepts any AUTH credentials, never relays, and prints each received message
+(optionally saving it as an .eml file). Point the app at it with:
+
+    SMTP_SERVER=127.0.0.1 SMTP_PORT=1025 SMTP_STARTTLS=false
+
+Use --fail-every N to answer every Nth message with a 451 temporary failure,
+which exercises the outbox retry/backoff path, and --delay to simulate a slow
+relay. The number of connections opened is logged, so reuse of the outbox's
+SMTP session is visible.
+
+Usage:
+    python tools/debug_smtp_server.py [--host 127.0.0.1] [--port 1025] [--out DIR] [--fail-every 0] [--delay 0]
+"""
+
+import os
+import sys
+import time
+import argparse
+import itertools
+import threading
+import socketserver
+from email import message_from_bytes, policy
+
+_connections = itertools.count(1)
+_messages = itertools.count(1)
+_lock = threading.Lock()
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write((line + '\r\n').encode('ascii'))
+
+    def handle(self):
+        conn_no = next(_connections)
+        print(f"[conn {conn_no}] opened from {self.client_address[0]}:{self.client_address[1]}")
+        self.reply('220 debug-smtp ready')
+        mail_from, rcpt_to = None, []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                break
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            verb = line.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                if verb == 'EHLO':
+                    self.reply('250-debug-smtp')
+                    self.reply('250-AUTH PLAIN LOGIN')
+                    self.reply('250 8BITMIME')
+                else:
+                    self.reply('250 debug-smtp')
+            elif verb == 'AUTH':
+                parts = line.split()
+                if len(parts) > 1 and parts[1].upper() == 'LOGIN':
+                    # username and password prompts
+                    self.reply('334 VXNlcm5hbWU6')
+                    self.rfile.readline()
+                    self.reply('334 UGFzc3dvcmQ6')
+                    self.rfile.readline()
+                elif len(parts) == 2:
+                    self.reply('334 ')
+                    self.rfile.readline()
+                self.reply('235 2.7.0 Authentication successful')
+            elif verb == 'MAIL':
+                mail_from, rcpt_to = line[10:].strip(), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                rcpt_to.append(line[8:].strip())
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b'.\r\n', b'.\n'):
+                        break
+                    data.append(chunk[1:] if chunk.startswith(b'..') else chunk)
+                self.reply(self.server.deliver(conn_no, mail_from, rcpt_to, b''.join(data)))
+                mail_from, rcpt_to = None, []
+            elif verb == 'RSET':
+                mail_from, rcpt_to = None, []
+                self.reply('250 OK')
+            elif verb == 'NOOP':
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                break
+            else:
+                self.reply('502 Command not implemented')
+        print(f"[conn {conn_no}] closed")
+
+
+class DebugSMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, out_dir=None, fail_every=0, delay=0.0):
+        super().__init__(address, SMTPHandler)
+        self.out_dir = out_dir
+        self.fail_every = fail_every
+        self.delay = delay
+
+    def deliver(self, conn_no, mail_from, rcpt_to, data):
+        with _lock:
+            msg_no = next(_messages)
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail_every and msg_no % self.fail_every == 0:
+            print(f"[conn {conn_no}] message {msg_no}: answering 451 (simulated failure)")
+            return '451 4.3.0 Simulated temporary failure'
+        message = message_from_bytes(data, policy=policy.default)
+        print(f"[conn {conn_no}] message {msg_no}: {mail_from} -> {', '.join(rcpt_to)} | {message.get('Subject')}")
+        if self.out_dir:
+            path = os.path.join(self.out_dir, f"{int(time.time() * 1000)}-{msg_no}.eml")
+            with open(path, 'wb') as f:
+                f.write(data)
+        return '250 OK: queued'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1025)
+    parser.add_argument('--out', help='directory to save received messages as .eml')
+    parser.add_argument('--fail-every', type=int, default=0, help='answer every Nth message with 451')
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds to wait before accepting each message')
+    args = parser.parse_args()
+
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+    server = DebugSMTPServer((args.host, args.port), out_dir=args.out, fail_every=args.fail_every, delay=args.delay)
+    print(f"Debug SMTP server listening on {args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
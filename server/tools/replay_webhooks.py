@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Replay recorded Zalo/Facebook/widget webhooks against the Flask app and report
+per-platform latency percentiles and MongoDB round-trips.
+
+Usage:
+    python tools/replay_webhooks.py [corpus.jsonl ...] [--mode client|http] [--base-url URL]
+                                    [--count 500] [--rate 50] [--concurrency 8]
+                                    [--mongo-uri mongodb://localhost:27017/|mongomock://] [--with-bot]
+                                    [--allow-network]
+
+Corpus files are JSON lines. Each line is either a recorded request
+({"platform", "path", "headers", "body"}, as written by utils/webhook_recorder.py
+when WEBHOOK_RECORD_DIR is set) or a bare webhook body, in which case the
+platform is taken from the file name (zalo.jsonl, facebook.jsonl).
+Defaults to every file under tools/corpus/.
+
+client mode (default) builds the app in-process with create_app() against
+--mongo-uri. Point it at a throwaway local mongod (the models write to test_db),
+or pass --mongo-uri mongomock:// to run against an in-memory mongomock server
+(optional package; DB round-trips are then not counted). Every OA/page id found
+in the corpus is seeded as an active integration with a "mock" access token, so
+outbound platform calls take the existing mock path, and any other outbound
+HTTP(S) request to a non-local host is refused unless --allow-network is given,
+so replays are hermetic. Auto-replies are disabled unless --with-bot is given
+(they call EXTERNAL_CHAT_API).
+
+http mode posts to a running server at --base-url. DB round-trips are only
+measured in client mode.
+"""
+
+import sys
+import os
+import json
+import copy
+import glob
+import math
+import time
+import queue
+import logging
+import argparse
+import threading
+
+from pymongo import monitoring
+
+# Add parent directory to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+DEFAULT_PATHS = {
+    'zalo': '/webhook',
+    'facebook': '/webhooks/facebook',
+}
+REPLAY_ACCOUNT_ID = 'replay-account'
+REPLAY_ORG_ID = 'replay-org'
+REPLAY_CHATBOT_ID = '000000000000000000000001'
+REPLAY_ACCESS_TOKEN = 'mock-replay-token'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('corpus', nargs='*', help='JSON-lines corpus files (default: tools/corpus/*.jsonl)')
+    parser.add_argument('--mode', choices=('client', 'http'), default='client')
+    parser.add_argument('--base-url', default='http://127.0.0.1:5002')
+    parser.add_argument('--count', type=int, default=0, help='total requests (default: one pass over the corpus)')
+    parser.add_argument('--rate', type=float, default=0, help='target requests/second (0 = as fast as possible)')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/')
+    parser.add_argument('--with-bot', action='store_true', help='leave USE_BOT auto-replies enabled')
+    parser.add_argument('--allow-network', action='store_true', help='let the app make outbound calls to non-local hosts (client mode)')
+    parser.add_argument('--verbose', action='store_true', help='keep application INFO logging')
+    return parser.parse_args()
+
+
+def load_records(paths):
+    records = []
+    for path in paths:
+        default_platform = os.path.splitext(os.path.basename(path))[0]
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                obj = json.loads(line)
+                if isinstance(obj, dict) and 'body' in obj and 'path' in obj:
+                    records.append(obj)
+                elif default_platform in DEFAULT_PATHS:
+                    records.append({
+                        'platform': default_platform,
+                        'path': DEFAULT_PATHS[default_platform],
+                        'headers': {},
+                        'body': obj,
+                    })
+    return records
+
+
+def uniquify(value, suffix):
+    """Make platform message ids unique per replay so de-duplication doesn't drop repeats."""
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            if k in ('msg_id', 'mid') and isinstance(v, str):
+                out[k] = f"{v}-{suffix}"
+            else:
+                out[k] = uniquify(v, suffix)
+        return out
+    if isinstance(value, list):
+        return [uniquify(v, suffix) for v in value]
+    return value
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # nearest-rank
+    idx = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[idx]
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts MongoDB commands per (green)thread."""
+
+    def __init__(self):
+        self.counts = {}
+
+    def started(self, event):
+        ident = threading.get_ident()
+        self.counts[ident] = self.counts.get(ident, 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+    def current(self):
+        return self.counts.get(threading.get_ident(), 0)
+
+
+def seed_integrations(mongo_client, records):
+    """Create active mock-token integrations for every OA/page in the corpus."""
+    from bson.objectid import ObjectId
+    from models.integration import IntegrationModel
+    from models.chatbot import ChatbotModel
+    from utils.zalo_events import normalize_zalo_event
+
+    ChatbotModel(mongo_client).collection.update_one(
+        {'_id': ObjectId(REPLAY_CHATBOT_ID)},
+        {'$set': {'name': 'Replay bot', 'accountId': REPLAY_ACCOUNT_ID, 'organizationId': REPLAY_ORG_ID}},
+        upsert=True,
+    )
+
+    targets = set()
+    for rec in records:
+        body = rec.get('body') or {}
+        if rec['platform'] == 'zalo':
+            oa_id = normalize_zalo_event(body).oa_id
+            if oa_id:
+                targets.add(('zalo', str(oa_id)))
+        elif rec['platform'] == 'facebook':
+            for entry in body.get('entry') or []:
+                if entry.get('id'):
+                    targets.add(('facebook', str(entry.get('id'))))
+
+    model = IntegrationModel(mongo_client)
+    for platform, oa_id in sorted(targets):
+        model.create_or_update(
+            account_id=REPLAY_ACCOUNT_ID,
+            platform=platform,
+            oa_id=oa_id,
+            access_token=REPLAY_ACCESS_TOKEN,
+            is_active=True,
+            name=f"Replay {platform} {oa_id}",
+            chatbot_id=REPLAY_CHATBOT_ID,
+            organization_id=REPLAY_ORG_ID,
+        )
+    return targets
+
+
+def use_mongomock():
+    """Make create_app() connect to one shared in-memory mongomock server."""
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit('--mongo-uri mongomock:// needs the optional mongomock package (pip install mongomock)')
+    import app as app_module
+    server = mongomock.MongoClient()
+    app_module.MongoClient = lambda *args, **kwargs: server
+
+
+def block_outbound_requests():
+    """Refuse requests-based calls to non-local hosts; returns the list of refused URLs."""
+    from urllib.parse import urlsplit
+    import requests
+
+    refused = []
+    original = requests.Session.request
+
+    def guarded(self, method, url, *args, **kwargs):
+        host = urlsplit(url).hostname or ''
+        if host not in ('localhost', '127.0.0.1', '::1'):
+            refused.append(f"{method} {url.split('?', 1)[0]}")
+            raise requests.ConnectionError(f"replay_webhooks: outbound call to {host} blocked (use --allow-network)")
+        return original(self, method, url, *args, **kwargs)
+
+    requests.Session.request = guarded
+    return refused
+
+
+def make_client_sender(args, records):
+    os.environ['MONGODB_URI'] = args.mongo_uri
+    os.environ.setdefault('SMTP_PORT', '587')
+    if not args.with_bot:
+        os.environ['USE_BOT'] = 'false'
+
+    counter = CommandCounter()
+    monitoring.register(counter)
+
+    in_memory = args.mongo_uri.startswith('mongomock')
+    if in_memory:
+        use_mongomock()
+    refused = None if args.allow_network else block_outbound_requests()
+
+    from app import create_app
+    app, mongo_client = create_app('development')
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+
+    seeded = seed_integrations(mongo_client, records)
+    print(f"Seeded {len(seeded)} mock integrations")
+    client = app.test_client()
+
+    def send(rec, body):
+        headers = {k: v for k, v in (rec.get('headers') or {}).items() if k.lower() != 'content-type'}
+        before = counter.current()
+        start = time.perf_counter()
+        resp = client.post(rec['path'], json=body, headers=headers)
+        elapsed = (time.perf_counter() - start) * 1000.0
+        # mongomock bypasses pymongo's command monitoring, so there is nothing to count
+        return resp.status_code, elapsed, None if in_memory else counter.current() - before
+
+    send.refused = refused
+    return send
+
+
+def make_http_sender(args):
+    import requests
+    session = requests.Session()
+    base = args.base_url.rstrip('/')
+
+    def send(rec, body):
+        headers = {k: v for k, v in (rec.get('headers') or {}).items() if k.lower() != 'content-type'}
+        start = time.perf_counter()
+        try:
+            resp = session.post(base + rec['path'], json=body, headers=headers, timeout=30)
+            status = resp.status_code
+        except Exception:
+            status = 0
+        elapsed = (time.perf_counter() - start) * 1000.0
+        return status, elapsed, None
+
+    return send
+
+
+def run(send, records, total, rate, concurrency):
+    work = queue.Queue()
+    for i in range(total):
+        work.put(i)
+    results = []
+    results_lock = threading.Lock()
+    t0 = time.perf_counter()
+
+    def worker():
+        while True:
+            try:
+                i = work.get_nowait()
+            except queue.Empty:
+                return
+            if rate > 0:
+                delay = t0 + i / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            rec = records[i % len(records)]
+            body = uniquify(copy.deepcopy(rec.get('body')), f"r{i}")
+            status, elapsed, round_trips = send(rec, body)
+            with results_lock:
+                results.append((rec['platform'], status, elapsed, round_trips))
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, concurrency))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - t0
+
+
+def report(results, wall_seconds):
+    by_platform = {}
+    for platform, status, elapsed, round_trips in results:
+        by_platform.setdefault(platform, []).append((status, elapsed, round_trips))
+
+    print()
+    print(f"{'platform':<10} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'db rt/req':>10}")
+    print('-' * 64)
+    for platform in sorted(by_platform):
+        rows = by_platform[platform]
+        latencies = sorted(r[1] for r in rows)
+        errors = sum(1 for r in rows if not r[0] or r[0] >= 400)
+        trips = [r[2] for r in rows if r[2] is not None]
+        rt = f"{sum(trips) / len(trips):.1f}" if trips else 'n/a'
+        print(f"{platform:<10} {len(rows):>6} {errors:>6} {percentile(latencies, 50):>9.1f} "
+              f"{percentile(latencies, 95):>9.1f} {percentile(latencies, 99):>9.1f} {rt:>10}")
+    print('-' * 64)
+    print(f"{len(results)} requests in {wall_seconds:.2f}s ({len(results) / wall_seconds if wall_seconds else 0:.1f} req/s)")
+
+
+def main():
+    args = parse_args()
+    paths = args.corpus or sorted(glob.glob(os.path.join(CORPUS_DIR, '*.jsonl')))
+    records = load_records(paths)
+    if not records:
+        print('No records to replay')
+        return 1
+
+    if args.mode == 'client':
+        send = make_client_sender(args, records)
+    else:
+        send = make_http_sender(args)
+
+    total = args.count or len(records)
+    results, wall = run(send, records, total, args.rate, args.concurrency)
+    report(results, wall)
+    refused = getattr(send, 'refused', None)
+    if refused:
+        print(f"{len(refused)} outbound call(s) blocked, e.g. {refused[0]}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the external auto-reply chat API.
+
+Serves both variants the workers understand:
+
+    POST /chat          {"question": ...} -> {"answer": ..., "needhelp": ...}
+    POST /chat/stream   the same answer streamed word by word, as SSE
+                        (`data: {"delta": ...}` ... final `data: {"answer": ..., "needhelp": ...}`)
+                        or as NDJSON when the client asks for application/x-ndjson
+
+The answer echoes the question. Point the app at it with:
+
+    CHAT_API_URL=http://127.0.0.1:8090/chat CHAT_API_STREAM_URL=http://127.0.0.1:8090/chat/stream
+
+--token-delay sets the pause between streamed words, --delay holds every
+request before answering (set it above CHAT_API_DEADLINE_SECONDS to see the
+deadline fire), and --fail-every N answers every Nth request with a 503 so
+the circuit breaker can be exercised. --needhelp marks every answer as
+needing staff.
+
+Usage:
+    python tools/stub_chat_api.py [--host 127.0.0.1] [--port 8090] [--token-delay 0.05] [--delay 0] [--fail-every 0] [--needhelp]
+"""
+
+import sys
+import json
+import time
+import argparse
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_requests = itertools.count(1)
+_lock = threading.Lock()
+
+
+class ChatHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _read_question(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            body = {}
+        return str(body.get('question') or '')
+
+    def _send_json(self, status, obj):
+        data = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0].rstrip('/')
+        if path not in ('/chat', '/chat/stream'):
+            self._send_json(404, {'error': 'not found'})
+            return
+        question = self._read_question()
+        with _lock:
+            request_no = next(_requests)
+        opts = self.server.opts
+        if opts.delay:
+            time.sleep(opts.delay)
+        if opts.fail_every and request_no % opts.fail_every == 0:
+            print(f"[req {request_no}] {path}: answering 503 (simulated failure)")
+            self._send_json(503, {'error': 'simulated failure'})
+            return
+
+        answer = f"Stub answer to: {question}" if question else ''
+        final = {'answer': answer, 'needhelp': opts.needhelp}
+        print(f"[req {request_no}] {path}: {question!r}")
+        if path == '/chat':
+            self._send_json(200, final)
+            return
+
+        ndjson = 'application/x-ndjson' in (self.headers.get('Accept') or '') and 'text/event-stream' not in (self.headers.get('Accept') or '')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson' if ndjson else 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def event(obj):
+            line = json.dumps(obj, ensure_ascii=False)
+            return (line + '\n' if ndjson else f"data: {line}\n\n").encode('utf-8')
+
+        words = answer.split(' ')
+        for i, word in enumerate(words):
+            self._write_chunk(event({'delta': word if i == 0 else ' ' + word}))
+            if opts.token_delay:
+                time.sleep(opts.token_delay)
+        self._write_chunk(event(final))
+        if not ndjson:
+            self._write_chunk(b'data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--token-delay', type=float, default=0.05, help='seconds between streamed words')
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds to wait before answering each request')
+    parser.add_argument('--fail-every', type=int, default=0, help='answer every Nth request with 503')
+    parser.add_argument('--needhelp', action='store_true', help='set needhelp on every answer')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), ChatHandler)
+    server.daemon_threads = True
+    server.opts = args
+    print(f"Stub chat API listening on http://{args.host}:{args.port} (/chat, /chat/stream)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+import os
+import base64
+import hashlib
+import logging
+import tempfile
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+BLOB_URL_PATH = '/api/blobs/'
+
+# Accepted image types, detected from the file header rather than the client's claim
+_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+class BlobError(ValueError):
+    """Raised when data cannot be stored (too large, unsupported type)."""
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+
+def sniff_content_type(header):
+    for signature, content_type in _SIGNATURES:
+        if header.startswith(signature):
+            return content_type
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def is_blob_id(value):
+    return isinstance(value, str) and len(value) == 64 and all(c in '0123456789abcdef' for c in value)
+
+
+def blob_path(blob_id):
+    # Two-level fan-out keeps directories small
+    return os.path.join(Config.BLOB_STORE_DIR, blob_id[:2], blob_id)
+
+
+def put_blob(data):
+    """
+    Store bytes under their SHA-256 and return (blob_id, content_type).
+    Identical content is stored once. Raises BlobError for oversize or non-image data.
+    """
+    if len(data) > Config.BLOB_MAX_BYTES:
+        raise BlobError(f"Blob size {len(data)} exceeds limit {Config.BLOB_MAX_BYTES}", 'BLOB_TOO_LARGE')
+    content_type = sniff_content_type(data[:16])
+    if not content_type:
+        raise BlobError('Unsupported file type', 'UNSUPPORTED_TYPE')
+
+    blob_id = hashlib.sha256(data).hexdigest()
+    path = blob_path(blob_id)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+    return blob_id, content_type
+
+
+def blob_info(blob_id):
+    """Return {'path', 'size', 'content_type'} for a stored blob, or None."""
+    if not is_blob_id(blob_id):
+        return None
+    path = blob_path(blob_id)
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(16)
+        size = os.path.getsize(path)
+    except OSError:
+        return None
+    return {'path': path, 'size': size, 'content_type': sniff_content_type(header) or 'application/octet-stream'}
+
+
+def blob_url(blob_id):
+    """
+    Absolute URL for a blob: the request's host inside a request, PUBLIC_BASE_URL
+    elsewhere (workers, scheduler), and the bare path if neither is known.
+    """
+    path = BLOB_URL_PATH + blob_id
+    try:
+        from flask import has_request_context, request
+        if has_request_context():
+            return request.host_url.rstrip('/') + path
+    except Exception:
+        pass
+    if Config.PUBLIC_BASE_URL:
+        return Config.PUBLIC_BASE_URL.rstrip('/') + path
+    return path
+
+
+def blob_id_from_url(value):
+    """Extract the blob id from a URL/path produced by blob_url, else None."""
+    if not isinstance(value, str) or BLOB_URL_PATH not in value:
+        return None
+    candidate = value.split(BLOB_URL_PATH, 1)[1].split('?', 1)[0].strip('/')
+    return candidate if is_blob_id(candidate) else None
+
+
+def resolve_image_ref(data):
+    """
+    Resolve the image fields of a send request.
+
+    Clients may send `image_blob_id` (or an `image` URL pointing at /api/blobs/)
+    instead of base64. Returns (send_value, stored_value): the data URL handed to
+    the platform upload helpers and the blob URL kept on the message.
+    Non-blob images are returned unchanged for both. Raises BlobError if the
+    referenced blob does not exist.
+    """
+    image = data.get('image')
+    blob_id = data.get('image_blob_id') or blob_id_from_url(image)
+    if not blob_id:
+        return image, image
+    info = blob_info(blob_id)
+    if not info:
+        raise BlobError('Image not found', 'BLOB_NOT_FOUND')
+    with open(info['path'], 'rb') as f:
+        encoded = base64.b64encode(f.read()).decode('ascii')
+    return f"data:{info['content_type']};base64,{encoded}", blob_url(blob_id)
@@ -0,0 +1,186 @@
+import json
+import time
+import logging
+import contextlib
+import requests
+from config import Config
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from utils.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# External auto-reply chat API (microtunchat), shared by the Zalo, Facebook and widget workers
+EXTERNAL_CHAT_API = Config.CHAT_API_URL
+
+chat_api_calls_total = Counter(
+    'chat_api_calls_total', 'Chat API calls by outcome (ok, client_error, error, timeout, rejected)',
+    ('outcome',),
+)
+chat_api_duration = Histogram(
+    'chat_api_duration_seconds', 'Chat API call latency by outcome',
+    ('outcome',),
+    buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0),
+)
+chat_api_first_token = Histogram(
+    'chat_api_first_token_seconds', 'Time from a streaming chat API call to its first partial answer',
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0),
+)
+
+breaker = CircuitBreaker(
+    'chat_api',
+    failure_rate=Config.CHAT_API_BREAKER_FAILURE_RATE,
+    window_seconds=Config.CHAT_API_BREAKER_WINDOW_SECONDS,
+    min_calls=Config.CHAT_API_BREAKER_MIN_CALLS,
+    open_seconds=Config.CHAT_API_BREAKER_OPEN_SECONDS,
+)
+
+
+class ChatApiUnavailable(RuntimeError):
+    """The chat API could not answer: `reason` is 'open' (breaker), 'timeout' or 'error'."""
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+
+class _DeadlineExceeded(Exception):
+    pass
+
+
+def _deadline(seconds):
+    """
+    Whole-call deadline. requests' read timeout applies per socket read, so a
+    slowly trickling response could otherwise outlive it; under eventlet the
+    green Timeout interrupts the call wherever it is blocked.
+    """
+    try:
+        import eventlet
+        from eventlet import patcher
+        if patcher.is_monkey_patched('socket'):
+            return eventlet.Timeout(seconds, _DeadlineExceeded)
+    except ImportError:
+        pass
+    return contextlib.nullcontext()
+
+
+def _finish(outcome, start):
+    chat_api_calls_total.inc((outcome,))
+    chat_api_duration.observe(time.perf_counter() - start, (outcome,))
+
+
+def streaming_enabled():
+    return bool(Config.CHAT_API_STREAM_URL)
+
+
+def _guarded(request_fn):
+    """
+    Run `request_fn()` -> (status_code, data) under the breaker and the deadline.
+
+    Raises ChatApiUnavailable without calling out while the breaker is open,
+    and when the call times out (CHAT_API_DEADLINE_SECONDS), fails to connect,
+    or returns 429/5xx or unparsable JSON; those failures feed the breaker.
+    """
+    try:
+        breaker.before_call()
+    except CircuitOpenError as e:
+        chat_api_calls_total.inc(('rejected',))
+        raise ChatApiUnavailable(str(e), 'open') from e
+
+    start = time.perf_counter()
+    try:
+        with _deadline(Config.CHAT_API_DEADLINE_SECONDS):
+            status, data = request_fn()
+    except (requests.Timeout, _DeadlineExceeded) as e:
+        breaker.record_failure()
+        _finish('timeout', start)
+        raise ChatApiUnavailable(f"chat API timed out after {Config.CHAT_API_DEADLINE_SECONDS}s", 'timeout') from e
+    except ChatApiUnavailable:
+        breaker.record_failure()
+        _finish('error', start)
+        raise
+    except Exception as e:
+        breaker.record_failure()
+        _finish('error', start)
+        raise ChatApiUnavailable(f"chat API request failed: {e}", 'error') from e
+
+    breaker.record_success()
+    _finish('ok' if status == 200 else 'client_error', start)
+    return data if isinstance(data, dict) else {}
+
+
+def _check_status(resp):
+    if resp.status_code == 429 or resp.status_code >= 500:
+        raise ChatApiUnavailable(f"chat API returned HTTP {resp.status_code}", 'error')
+
+
+def _post(url, **kwargs):
+    auth = (Config.AI_API_USERNAME, Config.AI_API_PASSWORD)
+    timeout = (Config.CHAT_API_CONNECT_TIMEOUT, Config.CHAT_API_DEADLINE_SECONDS)
+    return requests.post(url, auth=auth, timeout=timeout, **kwargs)
+
+
+def ask(question):
+    """Ask the chat API and return its JSON body (a dict; {} for 4xx replies, as before)."""
+    def request_fn():
+        resp = _post(EXTERNAL_CHAT_API, json={'question': question})
+        _check_status(resp)
+        return resp.status_code, (resp.json() if resp.status_code == 200 else {})
+
+    return _guarded(request_fn)
+
+
+def _stream_events(resp):
+    """JSON objects from an SSE (`data: {...}`) or newline-delimited JSON response body."""
+    for raw in resp.iter_lines(decode_unicode=True):
+        line = (raw or '').strip()
+        if not line or line.startswith(':'):
+            continue
+        if line.startswith('data:'):
+            line = line[5:].strip()
+        elif line.startswith(('event:', 'id:', 'retry:')):
+            continue
+        if line == '[DONE]':
+            return
+        yield json.loads(line)
+
+
+def ask_stream(question, on_delta):
+    """
+    Ask the streaming chat endpoint (CHAT_API_STREAM_URL), calling `on_delta(text)`
+    for each partial chunk as it arrives, and return the same dict as ask().
+
+    Events are `{"delta": "..."}` chunks followed by an optional final
+    `{"answer": ..., "needhelp": ...}`; without a final answer the deltas are
+    joined. Same breaker, deadline and failure rules as ask().
+    """
+    def request_fn():
+        start = time.perf_counter()
+        resp = _post(
+            Config.CHAT_API_STREAM_URL, json={'question': question, 'stream': True},
+            headers={'Accept': 'text/event-stream, application/x-ndjson'}, stream=True,
+        )
+        with resp:
+            _check_status(resp)
+            if resp.status_code != 200:
+                return resp.status_code, {}
+            # SSE is always UTF-8; requests would assume ISO-8859-1 for text/* without a charset
+            resp.encoding = 'utf-8'
+            parts = []
+            final = {}
+            for event in _stream_events(resp):
+                if not isinstance(event, dict):
+                    continue
+                delta = event.get('delta')
+                if delta:
+                    if not parts:
+                        chat_api_first_token.observe(time.perf_counter() - start)
+                    parts.append(delta)
+                    on_delta(delta)
+                if 'answer' in event or 'needhelp' in event:
+                    final = event
+            data = dict(final)
+            if not data.get('answer'):
+                data['answer'] = ''.join(parts)
+            return resp.status_code, data
+
+    return _guarded(request_fn)
@@ -0,0 +1,110 @@
+import time
+import logging
+import threading
+from collections import deque
+from utils.metrics import Gauge, Counter
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+_STATE_VALUES = {CLOSED: 0, OPEN: 1, HALF_OPEN: 2}
+
+circuit_breaker_state = Gauge(
+    'circuit_breaker_state', 'Breaker state (0 closed, 1 open, 2 half-open)',
+    ('breaker',),
+)
+circuit_breaker_transitions_total = Counter(
+    'circuit_breaker_transitions_total', 'Breaker state changes by new state',
+    ('breaker', 'state'),
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised by CircuitBreaker.before_call() while calls are being short-circuited."""
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker.
+
+    Closed: calls go through and outcomes are kept for `window_seconds`; once at
+    least `min_calls` are in the window and the failure share reaches
+    `failure_rate`, the breaker opens. Open: calls fail fast for `open_seconds`.
+    Half-open: up to `half_open_probes` calls go through; one success closes
+    the breaker, one failure reopens it.
+    """
+
+    def __init__(self, name, failure_rate=0.5, window_seconds=60, min_calls=5, open_seconds=30, half_open_probes=1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.window_seconds = window_seconds
+        self.min_calls = max(1, min_calls)
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self._lock = threading.Lock()
+        self._outcomes = deque()  # (monotonic time, ok)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        circuit_breaker_state.set(_STATE_VALUES[CLOSED], (name,))
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def _transition(self, state):
+        self._state = state
+        self._probes = 0
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        circuit_breaker_state.set(_STATE_VALUES[state], (self.name,))
+        circuit_breaker_transitions_total.inc((self.name, state))
+        log = logger.warning if state == OPEN else logger.info
+        log(f"Circuit breaker '{self.name}' is now {state}")
+
+    def before_call(self):
+        """Reserve a call slot, or raise CircuitOpenError if the call must not be made."""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == OPEN:
+                raise CircuitOpenError(f"{self.name} circuit is open")
+            if state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    raise CircuitOpenError(f"{self.name} circuit is half-open and a probe is in flight")
+                self._probes += 1
+
+    def record_success(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._transition(CLOSED)
+                return
+            self._record(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._transition(OPEN)
+                return
+            if self._state == OPEN:
+                return
+            self._record(False)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._transition(OPEN)
+
+    def _record(self, ok):
+        now = time.monotonic()
+        self._outcomes.append((now, ok))
+        cutoff = now - self.window_seconds
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            self._outcomes.popleft()
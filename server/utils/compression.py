@@ -0,0 +1,166 @@
+import zlib
+import logging
+from config import Config
+from utils.metrics import Counter
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+compressed_responses_total = Counter(
+    'http_compressed_responses_total', 'Responses compressed by encoding and mode (buffered, streamed)',
+    ('encoding', 'mode'),
+)
+compression_bytes_total = Counter(
+    'http_compression_bytes_total', 'Bytes before (in) and after (out) response compression',
+    ('encoding', 'direction'),
+)
+
+_COMPRESSIBLE_TYPES = (
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+)
+
+# Bodies are fed to the compressor in slices of this size
+_CHUNK_SIZE = 64 * 1024
+
+
+def _is_compressible(mimetype):
+    return bool(mimetype) and (mimetype.startswith('text/') or mimetype in _COMPRESSIBLE_TYPES)
+
+
+def _choose_encoding(accept_encodings):
+    """'br' or 'gzip' per the client's Accept-Encoding (brotli preferred when installed), else None."""
+    if brotli is not None and accept_encodings.quality('br') > 0:
+        return 'br'
+    if accept_encodings.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+class _Compressor:
+    """compress()/flush() over gzip (zlib) or brotli."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._obj = brotli.Compressor(quality=Config.COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._obj = zlib.compressobj(Config.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._obj.process(data)
+        return self._obj.compress(data)
+
+    def flush(self):
+        if self.encoding == 'br':
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+def _stream(chunks, encoding, close=None):
+    """Compress an iterable of byte chunks lazily, so the full output is never held at once."""
+    compressor = _Compressor(encoding)
+    size_in = size_out = 0
+    try:
+        for chunk in chunks:
+            size_in += len(chunk)
+            data = compressor.compress(chunk)
+            if data:
+                size_out += len(data)
+                yield data
+        data = compressor.flush()
+        size_out += len(data)
+        yield data
+    finally:
+        if close is not None:
+            close()
+        compression_bytes_total.inc((encoding, 'in'), size_in)
+        compression_bytes_total.inc((encoding, 'out'), size_out)
+
+
+def _slices(body):
+    view = memoryview(body)
+    for start in range(0, len(view), _CHUNK_SIZE):
+        yield view[start:start + _CHUNK_SIZE]
+
+
+def compress_response(response, accept_encodings):
+    """
+    Compress `response` in place for the negotiated encoding.
+
+    Skipped for non-compressible types, already-encoded bodies (e.g. the .gz
+    training export), file passthroughs, bodies under COMPRESSION_MIN_BYTES and
+    `Cache-Control: no-transform`. Bodies over COMPRESSION_STREAM_MIN_BYTES and
+    streamed responses are compressed chunk by chunk as they are sent instead
+    of building a second full-size copy.
+    """
+    if not Config.COMPRESSION_ENABLED:
+        return response
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return response
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    if not _is_compressible(response.mimetype):
+        return response
+    if 'no-transform' in (response.headers.get('Cache-Control') or ''):
+        return response
+
+    # The body depends on Accept-Encoding from here on, whether or not this one is compressed
+    response.vary.add('Accept-Encoding')
+
+    encoding = _choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        source = response.response
+        response.response = _stream(response.iter_encoded(), encoding, getattr(source, 'close', None))
+        response.headers.pop('Content-Length', None)
+        mode = 'streamed'
+    else:
+        body = response.get_data()
+        if len(body) < Config.COMPRESSION_MIN_BYTES:
+            return response
+        if len(body) >= Config.COMPRESSION_STREAM_MIN_BYTES:
+            response.response = _stream(_slices(body), encoding)
+            response.headers.pop('Content-Length', None)
+            mode = 'streamed'
+        else:
+            compressor = _Compressor(encoding)
+            data = compressor.compress(body) + compressor.flush()
+            response.set_data(data)
+            compression_bytes_total.inc((encoding, 'in'), len(body))
+            compression_bytes_total.inc((encoding, 'out'), len(data))
+            mode = 'buffered'
+
+    response.headers['Content-Encoding'] = encoding
+    # Weak ETags (utils/conditional.py) stay valid across encodings; strong ones would not
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    compressed_responses_total.inc((encoding, mode))
+    return response
+
+
+def init_compression(app):
+    """Register the after_request hook that compresses JSON/text responses."""
+    from flask import request
+
+    @app.after_request
+    def _compress(response):
+        try:
+            return compress_response(response, request.accept_encodings)
+        except Exception as e:
+            logger.warning(f"Response compression skipped: {e}")
+            return response
+
+    if brotli is None:
+        logger.info("brotli not installed; responses are compressed with gzip only")
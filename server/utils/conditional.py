@@ -0,0 +1,60 @@
+import hashlib
+import logging
+from flask import request, Response
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+conditional_requests_total = Counter(
+    'conditional_requests_total', 'ETag-enabled GETs by endpoint and result (not_modified, modified)',
+    ('endpoint', 'result'),
+)
+
+
+def make_etag(*parts):
+    """
+    Weak ETag over the values that determine a response (scope, page params,
+    conversation ids/versions, ...). Weak, because the same content may be sent
+    with different encodings (e.g. gzip).
+    """
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _opaque(tag):
+    tag = tag.strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    return tag
+
+
+def etag_matches(etag):
+    """True when the request's If-None-Match lists `etag` (weak comparison) or '*'."""
+    header = request.headers.get('If-None-Match')
+    if not header or not etag:
+        return False
+    if header.strip() == '*':
+        return True
+    wanted = _opaque(etag)
+    return any(_opaque(tag) == wanted for tag in header.split(','))
+
+
+def _cache_headers(response, etag):
+    response.headers['ETag'] = etag
+    # Let browsers keep the body but always revalidate it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def not_modified_or_none(etag, endpoint):
+    """A 304 response if the client already has `etag`, else None (and the caller builds the body)."""
+    if etag_matches(etag):
+        conditional_requests_total.inc((endpoint, 'not_modified'))
+        return _cache_headers(Response(status=304), etag)
+    conditional_requests_total.inc((endpoint, 'modified'))
+    return None
+
+
+def with_etag(response, etag):
+    """Attach `etag` to a full (200) response."""
+    return _cache_headers(response, etag)
@@ -0,0 +1,183 @@
+import os
+import time
+import socket
+import smtplib
+import logging
+import threading
+from datetime import datetime, timedelta
+from config import Config
+from utils.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+email_outbox_depth = Gauge('email_outbox_depth', 'Emails waiting in the outbox')
+emails_sent_total = Counter(
+    'emails_sent_total', 'Outbox send attempts by outcome (sent, retry, failed)',
+    ('outcome',),
+)
+email_send_duration = Histogram(
+    'email_send_duration_seconds', 'SMTP send latency per email (including reconnects)',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+# Identifies this process as the holder of outbox claims
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+_sender = None
+
+
+class SmtpSession:
+    """One authenticated SMTP connection, opened lazily and reused across sends."""
+
+    def __init__(self):
+        self._server = None
+        self.last_used = 0.0
+
+    def _connect(self):
+        server = smtplib.SMTP(Config.SMTP_SERVER, Config.SMTP_PORT, timeout=Config.SMTP_TIMEOUT)
+        try:
+            if Config.SMTP_STARTTLS:
+                server.starttls()
+            if Config.SMTP_PASSWORD:
+                server.login(Config.SMTP_EMAIL, Config.SMTP_PASSWORD)
+        except Exception:
+            server.close()
+            raise
+        logger.info(f"SMTP session opened to {Config.SMTP_SERVER}:{Config.SMTP_PORT}")
+        return server
+
+    def send(self, message):
+        """Send over the open session; a dropped connection is reopened once."""
+        if self._server is None:
+            self._server = self._connect()
+        try:
+            self._server.send_message(message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout):
+            self.close()
+            self._server = self._connect()
+            self._server.send_message(message)
+        self.last_used = time.monotonic()
+
+    def close(self):
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except Exception:
+            try:
+                self._server.close()
+            except Exception:
+                pass
+        self._server = None
+
+    @property
+    def is_open(self):
+        return self._server is not None
+
+
+def _is_permanent(error):
+    """5xx replies and refused recipients will not succeed on retry."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    code = getattr(error, 'smtp_code', None)
+    return isinstance(code, int) and 500 <= code < 600
+
+
+def _backoff_seconds(attempts):
+    return min(30 * (2 ** max(attempts - 1, 0)), Config.EMAIL_OUTBOX_MAX_BACKOFF_SECONDS)
+
+
+class EmailOutboxSender:
+    """Background thread that drains the email outbox over a persistent SMTP session."""
+
+    def __init__(self, mongo_client):
+        from models.email_outbox import EmailOutboxModel
+        self.model = EmailOutboxModel(mongo_client)
+        self.session = SmtpSession()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def enqueue(self, recipient, subject, plain_text, html=None, kind=None):
+        outbox_id = self.model.enqueue(recipient, subject, plain_text, html=html, kind=kind)
+        email_outbox_depth.inc()
+        self._wake.set()
+        return outbox_id
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.drain()
+                email_outbox_depth.set(self.model.depth())
+            except Exception as e:
+                logger.error(f"Email outbox drain failed: {e}")
+            if self.session.is_open and time.monotonic() - self.session.last_used > Config.EMAIL_SMTP_IDLE_SECONDS:
+                self.session.close()
+            self._wake.wait(Config.EMAIL_OUTBOX_POLL_SECONDS)
+            self._wake.clear()
+        self.session.close()
+
+    def drain(self):
+        """Send due emails in batches of EMAIL_OUTBOX_BATCH_SIZE until none are due. Returns the count sent."""
+        from utils.email_service import EmailService
+
+        sent = 0
+        while not self._stopped.is_set():
+            batch = []
+            for _ in range(max(1, Config.EMAIL_OUTBOX_BATCH_SIZE)):
+                doc = self.model.claim(Config.EMAIL_OUTBOX_LEASE_SECONDS, _OWNER)
+                if not doc:
+                    break
+                batch.append(doc)
+            if not batch:
+                return sent
+            for doc in batch:
+                start = time.perf_counter()
+                try:
+                    message = EmailService._build_message(doc['subject'], doc['to'], doc['plain_text'], doc.get('html'))
+                    self.session.send(message)
+                except Exception as e:
+                    email_send_duration.observe(time.perf_counter() - start)
+                    self._record_failure(doc, e)
+                    continue
+                email_send_duration.observe(time.perf_counter() - start)
+                self.model.mark_sent(doc['_id'])
+                emails_sent_total.inc(('sent',))
+                sent += 1
+                logger.info(f"Email '{doc.get('kind') or doc['subject']}' sent to {doc['to']}")
+        return sent
+
+    def _record_failure(self, doc, error):
+        attempts = doc.get('attempts') or 1
+        if _is_permanent(error) or attempts >= Config.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            self.model.mark_failed(doc['_id'], error)
+            emails_sent_total.inc(('failed',))
+            logger.error(f"Email to {doc['to']} failed permanently after {attempts} attempt(s): {error}")
+            return
+        # The session may be in an unknown state after an error
+        self.session.close()
+        retry_at = datetime.utcnow() + timedelta(seconds=_backoff_seconds(attempts))
+        self.model.mark_retry(doc['_id'], error, retry_at)
+        emails_sent_total.inc(('retry',))
+        logger.warning(f"Email to {doc['to']} failed (attempt {attempts}): {error}; retry after {retry_at}")
+
+
+def init_email_outbox(mongo_client):
+    """Start the process-wide outbox sender; EmailService queues through it from then on."""
+    global _sender
+    if _sender is None:
+        _sender = EmailOutboxSender(mongo_client).start()
+    return _sender
+
+
+def get_email_outbox():
+    return _sender
@@ -2,6 +2,7 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from config import Config
+from utils.email_outbox import get_email_outbox
 import logging
 
 logger = logging.getLogger(__name__)
@@ -9,7 +10,6 @@ logger = logging.getLogger(__name__)
 class EmailService:
     """Email service for sending verification emails"""
     
-    @staticmethod
     @staticmethod
     def _build_message(subject, recipient_email, plain_text, html_content):
         message = MIMEMultipart('alternative')
@@ -17,16 +17,29 @@ class EmailService:
         message['From'] = Config.SMTP_EMAIL
         message['To'] = recipient_email
         message.attach(MIMEText(plain_text, 'plain'))
-        message.attach(MIMEText(html_content, 'html'))
+        if html_content:
+            message.attach(MIMEText(html_content, 'html'))
         return message
 
     @staticmethod
     def _send_message(message):
-        with smtplib.SMTP(Config.SMTP_SERVER, Config.SMTP_PORT) as server:
-            server.starttls()
-            server.login(Config.SMTP_EMAIL, Config.SMTP_PASSWORD)
+        with smtplib.SMTP(Config.SMTP_SERVER, Config.SMTP_PORT, timeout=Config.SMTP_TIMEOUT) as server:
+            if Config.SMTP_STARTTLS:
+                server.starttls()
+            if Config.SMTP_PASSWORD:
+                server.login(Config.SMTP_EMAIL, Config.SMTP_PASSWORD)
             server.send_message(message)
 
+    @staticmethod
+    def _deliver(kind, subject, recipient_email, plain_text, html_content):
+        """Queue the email on the outbox when the sender is running, else send it inline."""
+        outbox = get_email_outbox()
+        if outbox is not None:
+            outbox.enqueue(recipient_email, subject, plain_text, html=html_content, kind=kind)
+            return
+        msg = EmailService._build_message(subject, recipient_email, plain_text, html_content)
+        EmailService._send_message(msg)
+
     @staticmethod
     def send_verification_email(recipient_email, verification_link):
         """Send verification email to user (DRY implementation)."""
@@ -63,9 +76,8 @@ Test Team
 </html>
         """
         try:
-            msg = EmailService._build_message(subject, recipient_email, plain_text, html)
-            EmailService._send_message(msg)
-            logger.info(f"Verification email sent to {recipient_email}")
+            EmailService._deliver('verification', subject, recipient_email, plain_text, html)
+            logger.info(f"Verification email queued for {recipient_email}")
             return True
         except Exception as e:
             logger.error(f"Failed to send email to {recipient_email}: {str(e)}")
@@ -114,9 +126,8 @@ Test Team
 </html>
         """
         try:
-            msg = EmailService._build_message(subject, recipient_email, plain_text, html)
-            EmailService._send_message(msg)
-            logger.info(f"Password reset email sent to {recipient_email}")
+            EmailService._deliver('reset_password', subject, recipient_email, plain_text, html)
+            logger.info(f"Password reset email queued for {recipient_email}")
             return True
         except Exception as e:
             logger.error(f"Failed to send password reset email to {recipient_email}: {str(e)}")
@@ -0,0 +1,111 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from config import Config
+from utils.metrics import Counter
+from utils.redis_client import get_key, incr_key
+
+logger = logging.getLogger(__name__)
+
+# Process-local copy of each organization's inbox rows (the 'inbox' projection
+# of its conversations), keyed by conversation _id. Every write through
+# ConversationModel bumps a per-organization version in Redis: the writing
+# process patches its copy in place, other processes see a newer version on
+# their next read and reload. Without Redis the version lives in-process,
+# which is correct for a single process.
+
+inbox_cache_requests = Counter(
+    'inbox_cache_requests_total', 'Inbox cache lookups by result (hit, miss, uncacheable)',
+    ('result',),
+)
+
+_entries = OrderedDict()
+_lock = threading.Lock()
+
+
+class _Entry:
+    __slots__ = ('rows', 'version', 'loaded_at', '_ordered')
+
+    def __init__(self, rows, version):
+        self.rows = {row.get('_id'): row for row in rows}
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self._ordered = list(rows)
+
+    def ordered(self):
+        if self._ordered is None:
+            self._ordered = sorted(self.rows.values(), key=lambda r: r.get('updated_at') or '', reverse=True)
+        return self._ordered
+
+    def put(self, row):
+        self.rows[row.get('_id')] = row
+        self._ordered = None
+
+
+def _version_key(organization_id):
+    return f"inbox:ver:{organization_id}"
+
+
+def _current_version(organization_id):
+    try:
+        return int(get_key(_version_key(organization_id)) or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def get_rows(organization_id, loader):
+    """
+    Return the organization's inbox rows, newest first, as shallow copies.
+
+    `loader()` is called on a miss and returns (rows, complete); incomplete
+    loads (more than INBOX_CACHE_MAX_ROWS conversations) are not cached.
+    Returns (rows, complete).
+    """
+    org = str(organization_id)
+    version = _current_version(org)
+    with _lock:
+        entry = _entries.get(org)
+        if entry and entry.version == version and time.monotonic() - entry.loaded_at < Config.INBOX_CACHE_TTL_SECONDS:
+            _entries.move_to_end(org)
+            rows = [dict(r) for r in entry.ordered()]
+            inbox_cache_requests.inc(('hit',))
+            return rows, True
+
+    # Read the version before loading: a write racing with the load bumps it
+    # again, so this entry is simply refreshed on the next read
+    rows, complete = loader()
+    if not complete:
+        inbox_cache_requests.inc(('uncacheable',))
+        return rows, False
+    inbox_cache_requests.inc(('miss',))
+    with _lock:
+        _entries[org] = _Entry(rows, version)
+        _entries.move_to_end(org)
+        while len(_entries) > Config.INBOX_CACHE_MAX_ORGS:
+            _entries.popitem(last=False)
+    return [dict(r) for r in rows], True
+
+
+def apply(organization_id, row):
+    """Record a write to one conversation; patches the local copy when it is current."""
+    org = str(organization_id)
+    new_version = incr_key(_version_key(org))
+    with _lock:
+        entry = _entries.get(org)
+        if entry is None:
+            return
+        if new_version is not None and entry.version == new_version - 1:
+            entry.put(row)
+            entry.version = new_version
+        else:
+            # Missed another process's write (or Redis failed): reload on next read
+            _entries.pop(org, None)
+
+
+def invalidate(organization_id):
+    """Drop the organization's inbox everywhere (bulk or out-of-band writes)."""
+    org = str(organization_id)
+    incr_key(_version_key(org))
+    with _lock:
+        _entries.pop(org, None)
@@ -0,0 +1,134 @@
+import os
+import time
+import atexit
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from config import Config
+from utils.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+scheduler_is_leader = Gauge(
+    'scheduler_is_leader', '1 while this process holds the scheduler lease',
+)
+scheduler_job_runs_total = Counter(
+    'scheduler_job_runs_total', 'Scheduled job runs by job and outcome (success, error, skipped = not leader)',
+    ('job', 'outcome'),
+)
+scheduler_job_duration = Histogram(
+    'scheduler_job_duration_seconds', 'Duration of scheduled job runs on the leader',
+    ('job',),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+
+
+class LeaderElector:
+    """
+    Mongo lease-based leader election (collection `scheduler_leases`).
+
+    One document per lease name holds {owner, lease_until}. Every process tries to
+    take or renew it every lease/3 seconds; the holder stays leader while it keeps
+    renewing, and if it dies another process takes over once lease_until passes.
+    """
+
+    def __init__(self, mongo_client, name='scheduler', lease_seconds=None):
+        self.collection = mongo_client.test_db.scheduler_leases
+        self.name = name
+        self.lease_seconds = lease_seconds or Config.SCHEDULER_LEASE_SECONDS
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lease_until = 0.0  # local monotonic deadline of our lease
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def is_leader(self):
+        # Checked against the local deadline too, so a stalled renewer stops leading in time
+        return time.monotonic() < self._lease_until
+
+    def try_acquire(self):
+        """Take or renew the lease. Returns True if this process is the leader."""
+        now = datetime.utcnow()
+        started = time.monotonic()
+        try:
+            self.collection.find_one_and_update(
+                {'_id': self.name, '$or': [{'owner': self.owner}, {'lease_until': {'$lt': now}}]},
+                {'$set': {
+                    'owner': self.owner,
+                    'lease_until': now + timedelta(seconds=self.lease_seconds),
+                    'renewed_at': now,
+                }},
+                upsert=True,
+            )
+            acquired = True
+        except DuplicateKeyError:
+            # Lease exists and is held by someone else
+            acquired = False
+        except Exception as e:
+            logger.warning(f"Scheduler lease renewal failed: {e}")
+            acquired = False
+
+        was_leader = self.is_leader()
+        if acquired:
+            self._lease_until = started + self.lease_seconds
+            if not was_leader:
+                logger.info(f"Acquired '{self.name}' lease as {self.owner}")
+        else:
+            if was_leader:
+                logger.warning(f"Lost '{self.name}' lease ({self.owner})")
+            self._lease_until = 0.0
+        scheduler_is_leader.set(1 if acquired else 0)
+        return acquired
+
+    def release(self):
+        try:
+            self.collection.update_one(
+                {'_id': self.name, 'owner': self.owner},
+                {'$set': {'lease_until': datetime.utcnow()}},
+            )
+        except Exception:
+            pass
+        self._lease_until = 0.0
+
+    def _run(self):
+        interval = max(1.0, self.lease_seconds / 3.0)
+        while not self._stopped.is_set():
+            self.try_acquire()
+            self._stopped.wait(interval)
+
+    def start(self):
+        if self._thread:
+            return self
+        self.try_acquire()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self.release()
+
+
+def leader_job(name, func, elector=None):
+    """
+    Wrap a scheduler job so it only runs on the leader, recording run metrics.
+    With no elector (leader election disabled) the job always runs.
+    """
+    def run(*args, **kwargs):
+        if elector is not None and not elector.is_leader():
+            scheduler_job_runs_total.inc((name, 'skipped'))
+            return None
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            scheduler_job_runs_total.inc((name, 'error'))
+            scheduler_job_duration.observe(time.perf_counter() - start, (name,))
+            raise
+        scheduler_job_runs_total.inc((name, 'success'))
+        scheduler_job_duration.observe(time.perf_counter() - start, (name,))
+        return result
+    run.__name__ = getattr(func, '__name__', name)
+    return run
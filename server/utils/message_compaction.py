@@ -0,0 +1,112 @@
+import base64
+import binascii
+import logging
+from config import Config
+from utils.blob_store import BlobError, put_blob, blob_url
+from utils.message_dedup import sent_message_ids
+
+logger = logging.getLogger(__name__)
+
+# Platform/API responses kept on messages only as delivery status + ids
+_RESPONSE_KEYS = ('api_response', 'send_response')
+_ERROR_TEXT_MAX = 200
+
+
+def _response_ok(resp):
+    if 'success' in resp:
+        return bool(resp.get('success'))
+    if resp.get('status') == 'mocked':
+        return True
+    err = resp.get('error')
+    # Zalo reports error=0 on success; Graph API returns an error object on failure
+    return err in (None, 0, False, '0')
+
+
+def compact_response(resp):
+    """
+    Reduce a send/API response to {'ok', 'message_ids', 'attachment_ids', 'error'}.
+    Already-compact values are returned unchanged.
+    """
+    if not isinstance(resp, dict):
+        if isinstance(resp, str) and len(resp) > _ERROR_TEXT_MAX:
+            return resp[:_ERROR_TEXT_MAX]
+        return resp
+    if 'ok' in resp and set(resp) <= {'ok', 'message_ids', 'attachment_ids', 'error'}:
+        return resp
+
+    out = {'ok': _response_ok(resp)}
+    ids = sent_message_ids(resp)
+    if ids:
+        out['message_ids'] = ids
+    attachment_ids = [str(r.get('attachment_id')) for r in resp.get('responses') or []
+                      if isinstance(r, dict) and r.get('attachment_id')]
+    if resp.get('attachment_id'):
+        attachment_ids.append(str(resp.get('attachment_id')))
+    if attachment_ids:
+        out['attachment_ids'] = attachment_ids
+    if not out['ok']:
+        err = resp.get('error')
+        message = err.get('message') if isinstance(err, dict) else (resp.get('message') or err)
+        if message not in (None, True):
+            out['error'] = str(message)[:_ERROR_TEXT_MAX]
+    return out
+
+
+def _split_data_url(value):
+    """Return (content_type, bytes) for a base64 data URL, or None."""
+    if not isinstance(value, str) or not value.startswith('data:'):
+        return None
+    try:
+        header, encoded = value.split(',', 1)
+        if ';base64' not in header:
+            return None
+        content_type = header[5:].split(';', 1)[0] or 'application/octet-stream'
+        return content_type, base64.b64decode(encoded)
+    except (ValueError, binascii.Error):
+        return None
+
+
+def _store_blob(data):
+    """Write to the blob store; None (image stays inline) for oversize or non-image data."""
+    try:
+        return put_blob(data)[0]
+    except BlobError as e:
+        logger.info(f"Inline image kept on message: {e}")
+    except Exception as e:
+        logger.error(f"Failed to store inline image as blob: {e}")
+    return None
+
+
+def compact_metadata(metadata, store_blob=_store_blob):
+    """
+    Return a compact copy of message metadata:
+    - api_response / send_response trimmed to delivery status and ids
+    - a data URL in `image` larger than MESSAGE_INLINE_IMAGE_MAX_BYTES written to
+      the blob store (utils/blob_store.py) and replaced by `image_blob_id`
+    `store_blob(data)` returns the blob id, or None to keep the image inline.
+    """
+    if not isinstance(metadata, dict) or not metadata:
+        return metadata
+    out = dict(metadata)
+    for key in _RESPONSE_KEYS:
+        if key in out:
+            out[key] = compact_response(out[key])
+
+    image = out.get('image')
+    if isinstance(image, str) and len(image) > Config.MESSAGE_INLINE_IMAGE_MAX_BYTES:
+        parsed = _split_data_url(image)
+        if parsed:
+            blob_id = store_blob(parsed[1])
+            if blob_id:
+                out.pop('image')
+                out['image_blob_id'] = blob_id
+    return out
+
+
+def expand_blob_refs(metadata):
+    """Turn `image_blob_id` back into an absolute `image` URL for API/socket output."""
+    if not isinstance(metadata, dict) or not metadata.get('image_blob_id') or metadata.get('image'):
+        return metadata
+    out = dict(metadata)
+    out['image'] = blob_url(metadata['image_blob_id'])
+    return out
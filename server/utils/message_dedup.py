@@ -0,0 +1,87 @@
+import logging
+from config import Config
+from utils.redis_client import set_key_nx, del_key
+
+logger = logging.getLogger(__name__)
+
+
+def _seen_key(platform, message_id):
+    return f"webhook:seen:{platform}:{message_id}"
+
+
+def claim_message_id(platform, message_id):
+    """
+    Record a platform message id as seen.
+    Returns True the first time an id is claimed within the TTL, False for
+    redeliveries/echoes that should be dropped. Missing ids always pass.
+    """
+    if not message_id:
+        return True
+    return set_key_nx(_seen_key(platform, message_id), '1', ex=Config.MESSAGE_DEDUP_TTL_SECONDS)
+
+
+def release_message_id(platform, message_id):
+    """Forget a claim so a redelivery of `message_id` is processed again."""
+    if message_id:
+        del_key(_seen_key(platform, message_id))
+
+
+def claim_for_request(platform, message_id):
+    """
+    claim_message_id for an inbound webhook message. Until settle_claim() is
+    called (once the message is stored), the claim is released if the request
+    ends in a 5xx, so the platform's retry is not dropped as a duplicate.
+    """
+    claimed = claim_message_id(platform, message_id)
+    if claimed and message_id:
+        from flask import g
+        g.setdefault('_dedup_claims', set()).add((platform, str(message_id)))
+    return claimed
+
+
+def settle_claim(platform, message_id):
+    """The message is persisted: keep its claim whatever happens later in the request."""
+    if message_id:
+        from flask import g
+        g.get('_dedup_claims', set()).discard((platform, str(message_id)))
+
+
+def init_message_dedup(app):
+    """Release unsettled webhook claims of requests that fail (5xx, including unhandled exceptions)."""
+    from flask import g
+
+    @app.after_request
+    def _release_unsettled_claims(response):
+        claims = g.pop('_dedup_claims', None)
+        if claims and response.status_code >= 500:
+            for platform, message_id in claims:
+                release_message_id(platform, message_id)
+                logger.info(f"Released dedup claim for {platform} message {message_id} after HTTP {response.status_code}")
+        return response
+
+
+def sent_message_ids(send_response):
+    """Extract platform message ids from a Zalo/Facebook send API response."""
+    ids = []
+    if not isinstance(send_response, dict):
+        return ids
+    if send_response.get('message_id'):
+        ids.append(str(send_response.get('message_id')))
+    data = send_response.get('data')
+    if isinstance(data, dict) and data.get('message_id'):
+        ids.append(str(data.get('message_id')))
+    for r in send_response.get('responses') or []:
+        if isinstance(r, dict):
+            ids.extend(sent_message_ids(r.get('response')))
+    return ids
+
+
+def remember_sent(platform, send_response):
+    """
+    Mark ids returned by a send API as seen so the webhook echo is dropped.
+    Returns the first id (to store on the outgoing message) or None.
+    """
+    ids = sent_message_ids(send_response)
+    for mid in ids:
+        claim_message_id(platform, mid)
+    return ids[0] if ids else None
@@ -0,0 +1,161 @@
+import bisect
+import threading
+
+# Minimal in-process metrics registry rendered in the Prometheus text format.
+# Kept dependency-free so the request hot path is a dict lookup plus a few
+# integer increments under a lock.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+    def set(self, value, labels=()):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value, labels=()):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # per-bucket (non-cumulative) counts + overflow, sum, count
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][idx] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = self._header()
+        with self._lock:
+            items = [(labels, (list(e[0]), e[1], e[2])) for labels, e in self._values.items()]
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                le = _format_labels(self.labelnames, labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = _format_labels(self.labelnames, labels, 'le="+Inf"')
+            plain = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{plain} {total}")
+            lines.append(f"{self.name}_count{plain} {count}")
+        return lines
+
+
+def render_prometheus():
+    """Render every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in list(_registry):
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ---- HTTP / Socket.IO metrics ----
+
+http_request_duration = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by blueprint/endpoint',
+    ('blueprint', 'endpoint', 'method'),
+)
+http_requests_total = Counter(
+    'http_requests_total', 'HTTP requests by blueprint/endpoint and status code',
+    ('blueprint', 'endpoint', 'method', 'status'),
+)
+http_requests_in_flight = Gauge(
+    'http_requests_in_flight', 'HTTP requests currently being served',
+)
+socketio_events_total = Counter(
+    'socketio_events_total', 'Socket.IO events by name and direction (in = received, out = emitted)',
+    ('event', 'direction'),
+)
+
+
+def instrument_socketio(socketio):
+    """Count Socket.IO events received (via .on handlers) and emitted (via .emit)."""
+    import functools
+
+    original_emit = socketio.emit
+    original_on = socketio.on
+
+    def emit(event, *args, **kwargs):
+        socketio_events_total.inc((event, 'out'))
+        return original_emit(event, *args, **kwargs)
+
+    def on(message, namespace=None):
+        register = original_on(message, namespace=namespace)
+
+        def decorator(handler):
+            @functools.wraps(handler)
+            def counted(*args, **kwargs):
+                socketio_events_total.inc((message, 'in'))
+                return handler(*args, **kwargs)
+            register(counted)
+            return handler
+        return decorator
+
+    socketio.emit = emit
+    socketio.on = on
+    return socketio
@@ -0,0 +1,141 @@
+import logging
+import threading
+from contextlib import contextmanager
+from pymongo import monitoring
+from config import Config
+from utils.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Per-(green)thread label for work outside a Flask request (scheduler jobs, workers)
+_context = threading.local()
+
+mongo_commands_total = Counter(
+    'mongo_commands_total', 'MongoDB commands by route/job, collection and command',
+    ('route', 'collection', 'command'),
+)
+mongo_command_duration = Histogram(
+    'mongo_command_duration_seconds', 'MongoDB command latency by route/job, collection and command',
+    ('route', 'collection', 'command'),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+mongo_command_failures_total = Counter(
+    'mongo_command_failures_total', 'Failed MongoDB commands by route/job, collection and command',
+    ('route', 'collection', 'command'),
+)
+
+# Where each command keeps its filter document
+_FILTER_FIELDS = {
+    'find': 'filter',
+    'count': 'query',
+    'distinct': 'query',
+    'findAndModify': 'query',
+}
+
+
+@contextmanager
+def job_context(name):
+    """Attribute MongoDB commands issued inside the block to a background job name."""
+    previous = getattr(_context, 'label', None)
+    _context.label = f"job:{name}"
+    try:
+        yield
+    finally:
+        _context.label = previous
+
+
+def with_job_context(name, func):
+    """Wrap a scheduler job callable so its queries are attributed to `name`."""
+    def run(*args, **kwargs):
+        with job_context(name):
+            return func(*args, **kwargs)
+    run.__name__ = getattr(func, '__name__', name)
+    return run
+
+
+def _current_label():
+    label = getattr(_context, 'label', None)
+    if label:
+        return label
+    try:
+        from flask import has_request_context, request
+        if has_request_context():
+            return request.endpoint or 'unmatched'
+    except Exception:
+        pass
+    return 'background'
+
+
+def _shape(value, depth=0):
+    """Replace literal values with their type names, keeping keys and operators."""
+    if depth > 6:
+        return '...'
+    if isinstance(value, dict):
+        return {k: _shape(v, depth + 1) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_shape(value[0], depth + 1)] if value else []
+    return type(value).__name__
+
+
+def _collection_and_filter(command_name, command):
+    collection = command.get(command_name)
+    if command_name == 'getMore':
+        collection = command.get('collection')
+    if not isinstance(collection, str):
+        collection = '-'
+
+    flt = None
+    field = _FILTER_FIELDS.get(command_name)
+    if field:
+        flt = command.get(field)
+    elif command_name in ('update', 'delete'):
+        ops = command.get('updates' if command_name == 'update' else 'deletes') or []
+        if ops:
+            flt = ops[0].get('q')
+    elif command_name == 'aggregate':
+        pipeline = command.get('pipeline') or []
+        if pipeline and isinstance(pipeline[0], dict):
+            flt = pipeline[0].get('$match')
+    return collection, flt
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Aggregates command count/latency per (route, collection, command) and logs slow queries."""
+
+    def __init__(self, slow_ms=None):
+        self.slow_ms = Config.MONGO_SLOW_QUERY_MS if slow_ms is None else slow_ms
+        self._pending = {}
+
+    def started(self, event):
+        try:
+            collection, flt = _collection_and_filter(event.command_name, event.command)
+            self._pending[(event.connection_id, event.request_id)] = (_current_label(), collection, flt)
+        except Exception:
+            pass
+
+    def _finish(self, event):
+        return self._pending.pop((event.connection_id, event.request_id), None)
+
+    def succeeded(self, event):
+        info = self._finish(event)
+        if not info:
+            return
+        label, collection, flt = info
+        labels = (label, collection, event.command_name)
+        seconds = event.duration_micros / 1e6
+        mongo_commands_total.inc(labels)
+        mongo_command_duration.observe(seconds, labels)
+        if self.slow_ms and seconds * 1000.0 >= self.slow_ms:
+            logger.warning(
+                f"Slow Mongo {event.command_name} on {collection} took {seconds * 1000.0:.1f} ms "
+                f"(route={label}, filter={_shape(flt) if flt is not None else None})"
+            )
+
+    def failed(self, event):
+        info = self._finish(event)
+        if not info:
+            return
+        label, collection, _ = info
+        labels = (label, collection, event.command_name)
+        mongo_commands_total.inc(labels)
+        mongo_command_failures_total.inc(labels)
@@ -0,0 +1,73 @@
+import math
+import time
+import logging
+import threading
+import bcrypt
+from config import Config
+from utils.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+# bcrypt is pure CPU for ~100 ms per call. Under eventlet.monkey_patch() a direct
+# call freezes every greenlet in the process, so calls are handed to eventlet's
+# native thread pool (tpool) and only the calling greenlet waits. The semaphore
+# bounds how many hashes can be queued or running at once.
+_pending = threading.BoundedSemaphore(max(1, Config.PASSWORD_HASH_MAX_PENDING))
+
+password_hash_seconds = Histogram(
+    'password_hash_seconds', 'Wall time of bcrypt hash/check calls including queueing',
+    ('op',),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+password_hash_rejected_total = Counter(
+    'password_hash_rejected_total', 'bcrypt calls rejected because the queue was full',
+)
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Raised when the hashing queue stays full for PASSWORD_HASH_QUEUE_TIMEOUT seconds."""
+
+
+def busy_response():
+    """503 JSON response (with Retry-After) for a request rejected with PasswordHasherBusy."""
+    from flask import jsonify
+    response = jsonify({'success': False, 'message': 'Server is busy, please try again'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(max(1, math.ceil(Config.PASSWORD_HASH_QUEUE_TIMEOUT)))
+    return response
+
+
+def _eventlet_active():
+    try:
+        from eventlet import patcher
+        return patcher.is_monkey_patched('thread')
+    except ImportError:
+        return False
+
+
+def _execute(op, func, *args):
+    start = time.perf_counter()
+    if not _pending.acquire(timeout=Config.PASSWORD_HASH_QUEUE_TIMEOUT):
+        password_hash_rejected_total.inc()
+        logger.warning(f"bcrypt {op} rejected after waiting {Config.PASSWORD_HASH_QUEUE_TIMEOUT}s for a slot")
+        raise PasswordHasherBusy('Password hashing queue is full')
+    try:
+        if _eventlet_active():
+            from eventlet import tpool
+            return tpool.execute(func, *args)
+        return func(*args)
+    finally:
+        _pending.release()
+        password_hash_seconds.observe(time.perf_counter() - start, (op,))
+
+
+def hash_password(password):
+    """Return the bcrypt hash (bytes) of a plain-text password."""
+    return _execute('hash', lambda pw: bcrypt.hashpw(pw, bcrypt.gensalt(Config.BCRYPT_ROUNDS)), password.encode('utf-8'))
+
+
+def check_password(password, hashed):
+    """Constant-time check of a plain-text password against a bcrypt hash."""
+    if isinstance(hashed, str):
+        hashed = hashed.encode('utf-8')
+    return _execute('check', bcrypt.checkpw, password.encode('utf-8'), hashed)
@@ -0,0 +1,118 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Process-local cache of platform user profiles keyed by "platform:user_id".
+# Entries are served directly while fresh, served stale (with a background
+# refresh) until PROFILE_CACHE_STALE_SECONDS, and failed fetches are cached
+# as empty profiles for PROFILE_CACHE_NEGATIVE_TTL_SECONDS so a broken token
+# or unknown user does not cost a slow API call on every message. A failed
+# refresh keeps the last good profile instead of blanking it.
+_cache = OrderedDict()
+_lock = threading.Lock()
+# key -> Event set when the fetch in flight for that key (miss or refresh) finishes
+_refreshing = {}
+
+# How long a concurrent miss waits for the fetch already in flight
+_MISS_WAIT_SECONDS = 10
+
+
+def _store(key, profile, ttl=None):
+    if ttl is None:
+        ttl = Config.PROFILE_CACHE_TTL_SECONDS if profile else Config.PROFILE_CACHE_NEGATIVE_TTL_SECONDS
+    with _lock:
+        _cache[key] = (profile or {}, time.time(), ttl)
+        _cache.move_to_end(key)
+        while len(_cache) > Config.PROFILE_CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+
+def _fetch(key, fetch_fn, previous=None):
+    try:
+        profile = fetch_fn() or {}
+    except Exception as e:
+        logger.warning(f"Profile fetch failed for {key}: {e}")
+        profile = {}
+    if not profile and previous:
+        # Transient failure: keep serving the last good profile, retry after the negative TTL
+        _store(key, previous, Config.PROFILE_CACHE_NEGATIVE_TTL_SECONDS)
+        return previous
+    _store(key, profile)
+    return profile
+
+
+def _claim(key):
+    """(event, owner): owner is True if the caller must fetch `key` and then call _release."""
+    with _lock:
+        event = _refreshing.get(key)
+        if event is not None:
+            return event, False
+        event = _refreshing[key] = threading.Event()
+        return event, True
+
+
+def _release(key, event):
+    with _lock:
+        _refreshing.pop(key, None)
+    event.set()
+
+
+def _refresh_in_background(key, fetch_fn, previous):
+    event, owner = _claim(key)
+    if not owner:
+        return
+
+    def _run():
+        try:
+            _fetch(key, fetch_fn, previous)
+        finally:
+            _release(key, event)
+
+    threading.Thread(target=_run, daemon=True).start()
+
+
+def get_profile(platform, user_id, fetch_fn):
+    """
+    Return the cached profile dict for platform/user_id, calling fetch_fn()
+    only on a miss. fetch_fn must return a dict ({} on failure). Concurrent
+    misses for the same user share one fetch.
+    """
+    if not user_id:
+        return {}
+    key = f"{platform}:{user_id}"
+    now = time.time()
+    with _lock:
+        entry = _cache.get(key)
+        if entry:
+            _cache.move_to_end(key)
+
+    previous = None
+    if entry:
+        profile, fetched_at, ttl = entry
+        age = now - fetched_at
+        if age <= ttl:
+            return dict(profile)
+        if profile and age <= Config.PROFILE_CACHE_STALE_SECONDS:
+            _refresh_in_background(key, fetch_fn, profile)
+            return dict(profile)
+        previous = profile
+
+    event, owner = _claim(key)
+    if not owner:
+        event.wait(_MISS_WAIT_SECONDS)
+        with _lock:
+            entry = _cache.get(key)
+        return dict(entry[0]) if entry else dict(previous or {})
+    try:
+        return dict(_fetch(key, fetch_fn, previous))
+    finally:
+        _release(key, event)
+
+
+def invalidate_profile(platform, user_id):
+    with _lock:
+        _cache.pop(f"{platform}:{user_id}", None)
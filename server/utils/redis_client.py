@@ -8,11 +8,14 @@ class InMemoryStore:
     def __init__(self):
         self._data = {}
 
-    def set(self, key, value, ex=None):
+    def set(self, key, value, ex=None, nx=False):
+        if nx and self.get(key) is not None:
+            return None
         expire_at = None
         if ex:
             expire_at = time.time() + ex
         self._data[key] = (value, expire_at)
+        return True
 
     def get(self, key):
         val = self._data.get(key)
@@ -28,6 +31,18 @@ class InMemoryStore:
         if key in self._data:
             del self._data[key]
 
+    def incr(self, key):
+        value = int(self.get(key) or 0) + 1
+        expire_at = self._data.get(key, (None, None))[1]
+        self._data[key] = (value, expire_at)
+        return value
+
+    def expire(self, key, ex):
+        if self.get(key) is not None:
+            self._data[key] = (self._data[key][0], time.time() + ex)
+            return True
+        return False
+
 
 try:
     import redis
@@ -56,6 +71,31 @@ def set_key(key, value, ex=None):
         return False
 
 
+def set_key_nx(key, value, ex=None):
+    """Set key only if it does not exist. Returns True if this call set it."""
+    try:
+        return bool(redis_client.set(key, value, ex=ex, nx=True))
+    except Exception as e:
+        logger.error(f"Redis set nx error: {e}")
+        # Fail open: treat as newly set so callers don't drop work
+        return True
+
+
+def incr_key(key, ex=None):
+    """Atomically increment an integer key; returns the new value or None on error.
+
+    `ex` (seconds) resets the key's expiry on every increment.
+    """
+    try:
+        value = int(redis_client.incr(key))
+        if ex:
+            redis_client.expire(key, int(ex))
+        return value
+    except Exception as e:
+        logger.error(f"Redis incr error: {e}")
+        return None
+
+
 def get_key(key):
     try:
         if hasattr(redis_client, 'get'):
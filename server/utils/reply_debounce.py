@@ -0,0 +1,122 @@
+import time
+import logging
+import threading
+from config import Config
+from utils.metrics import Counter, Gauge, Histogram
+from utils.redis_client import get_key, set_key, set_key_nx, incr_key, del_key
+
+logger = logging.getLogger(__name__)
+
+# Customers often type one question as several quick messages. Inbound text is
+# held per conversation until it has been quiet for AUTO_REPLY_DEBOUNCE_SECONDS
+# (each fragment restarts the wait, capped at AUTO_REPLY_DEBOUNCE_MAX_SECONDS
+# from the first one), then a single auto-reply runs on the combined question.
+# Webhooks for one conversation may land on different workers, so the window
+# lives in Redis: every fragment takes the next generation from a counter
+# keyed by conversation and stores its text under that generation. Only the
+# worker holding the latest generation answers when its local timer expires,
+# with every fragment since the previous answer.
+
+# Upper bound on fragments read back for one answer (and the counter's lifetime margin)
+_MAX_FRAGMENTS = 20
+_KEY_MARGIN_SECONDS = 60
+
+auto_reply_fragments_total = Counter(
+    'auto_reply_fragments_total', 'Inbound messages queued for auto-reply by platform',
+    ('platform',),
+)
+auto_reply_batch_fragments = Histogram(
+    'auto_reply_batch_fragments', 'Inbound messages combined into one auto-reply call',
+    ('platform',),
+    buckets=(1, 2, 3, 4, 6, 10),
+)
+auto_reply_pending = Gauge('auto_reply_pending', 'Conversations waiting out the auto-reply debounce window')
+
+_lock = threading.Lock()
+_pending = {}
+
+
+class _Pending:
+    __slots__ = ('generation', 'callback', 'timer')
+
+    def __init__(self):
+        self.generation = 0
+        self.callback = None
+        self.timer = None
+
+
+def _store_key(key, part):
+    return f"auto_reply:{key}:{part}"
+
+
+def submit(platform, conversation_id, text, callback):
+    """
+    Queue an inbound `text` for the conversation's next auto-reply.
+
+    `callback(question=...)` runs once on a background thread with all fragments
+    received during the window joined by newlines. The callback passed with the
+    latest fragment is used; since it runs seconds later, callbacks must re-check
+    conversation state (bot_reply, handler) and re-read tokens themselves.
+    """
+    key = f"{platform}:{conversation_id}"
+    auto_reply_fragments_total.inc((platform,))
+    ttl = int(Config.AUTO_REPLY_DEBOUNCE_MAX_SECONDS) + _KEY_MARGIN_SECONDS
+    generation = incr_key(_store_key(key, 'gen'), ex=ttl)
+    if generation is None:
+        # Store unavailable: answer this message on its own rather than drop it
+        threading.Thread(target=_run, args=(key, callback, text), daemon=True).start()
+        return
+    set_key(_store_key(key, f'frag:{generation}'), text, ex=ttl)
+    set_key_nx(_store_key(key, 'started'), str(time.time()), ex=ttl)
+    try:
+        started = float(get_key(_store_key(key, 'started')) or time.time())
+    except ValueError:
+        started = time.time()
+    remaining = Config.AUTO_REPLY_DEBOUNCE_MAX_SECONDS - (time.time() - started)
+    delay = max(0.0, min(Config.AUTO_REPLY_DEBOUNCE_SECONDS, remaining))
+    with _lock:
+        entry = _pending.get(key)
+        if entry is None:
+            entry = _pending[key] = _Pending()
+            auto_reply_pending.set(len(_pending))
+        elif entry.timer is not None:
+            entry.timer.cancel()
+        entry.callback = callback
+        entry.generation = generation
+        entry.timer = threading.Timer(delay, _fire, args=(platform, key, entry, generation))
+        entry.timer.daemon = True
+        entry.timer.start()
+
+
+def _fire(platform, key, entry, generation):
+    with _lock:
+        # A later fragment restarted the wait (cancel() can lose the race with a timer already running)
+        if _pending.get(key) is not entry or entry.generation != generation:
+            return
+        del _pending[key]
+        auto_reply_pending.set(len(_pending))
+    latest = get_key(_store_key(key, 'gen'))
+    if latest is not None and int(latest) != generation:
+        # A later fragment reached another worker, whose timer answers the whole batch
+        return
+    ttl = int(Config.AUTO_REPLY_DEBOUNCE_MAX_SECONDS) + _KEY_MARGIN_SECONDS
+    answered = int(get_key(_store_key(key, 'answered')) or 0)
+    set_key(_store_key(key, 'answered'), str(generation), ex=ttl)
+    del_key(_store_key(key, 'started'))
+    fragments = []
+    for g in range(max(answered + 1, generation - _MAX_FRAGMENTS + 1), generation + 1):
+        text = get_key(_store_key(key, f'frag:{g}'))
+        del_key(_store_key(key, f'frag:{g}'))
+        if text:
+            fragments.append(text)
+    auto_reply_batch_fragments.observe(max(len(fragments), 1), (platform,))
+    if len(fragments) > 1:
+        logger.info(f"Auto-reply for {key}: combined {len(fragments)} messages into one question")
+    _run(key, entry.callback, '\n'.join(fragments))
+
+
+def _run(key, callback, question):
+    try:
+        callback(question=question)
+    except Exception as e:
+        logger.error(f"Auto-reply for {key} failed: {e}")
@@ -0,0 +1,115 @@
+import re
+import unicodedata
+
+# Search keys are stored on each searchable document under `search`:
+#   search.tokens     folded name/username words, matched by anchored prefix
+#   search.phone      digits-only phone in national form (84xxx -> 0xxx)
+#   search.phone_rev  the same digits reversed, so "last N digits" is a prefix too
+# Anchored, case-sensitive regexes on these fields are index range scans,
+# unlike the unanchored case-insensitive `$regex` they replace.
+
+_TOKEN_SPLIT = re.compile(r'[^0-9a-z]+')
+_NON_DIGIT = re.compile(r'\D+')
+
+# Letters NFKD does not decompose into base + combining mark
+_EXTRA_FOLDS = str.maketrans({'đ': 'd', 'Đ': 'd', 'ð': 'd', 'ø': 'o', 'ł': 'l', 'ß': 'ss', 'æ': 'ae', 'œ': 'oe'})
+
+MAX_QUERY_TOKENS = 5
+MIN_PHONE_DIGITS = 3
+
+# Relative weight of each kind of hit when ranking candidates
+_SCORE_TOKEN_EXACT = 3
+_SCORE_TOKEN_PREFIX = 2
+_SCORE_PHONE_EXACT = 6
+_SCORE_PHONE_PREFIX = 4
+_SCORE_PHONE_SUFFIX = 3
+
+
+def fold(text):
+    """Lowercase and strip diacritics: 'Nguyễn Văn Đức' -> 'nguyen van duc'."""
+    if not text:
+        return ''
+    text = str(text).translate(_EXTRA_FOLDS)
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(*texts):
+    """Distinct folded word tokens across `texts`, in first-seen order."""
+    tokens = []
+    for text in texts:
+        for tok in _TOKEN_SPLIT.split(fold(text)):
+            if tok and tok not in tokens:
+                tokens.append(tok)
+    return tokens
+
+
+def normalize_phone(phone):
+    """Digits-only national form of a phone number, or '' if it has no digits."""
+    digits = _NON_DIGIT.sub('', str(phone or ''))
+    if digits.startswith('84') and len(digits) >= 11:
+        digits = '0' + digits[2:]
+    return digits
+
+
+def name_keys(*texts):
+    """`$set` fields for the name tokens of a document."""
+    return {'search.tokens': tokenize(*texts)}
+
+
+def phone_keys(phone):
+    """`$set` fields for the phone keys of a document."""
+    digits = normalize_phone(phone)
+    return {
+        'search.phone': digits or None,
+        'search.phone_rev': digits[::-1] or None,
+    }
+
+
+def build_query(query, phone=True):
+    """
+    Mongo filter matching `query` against stored search keys, or None when the
+    query has nothing searchable. Every query word must prefix a stored token;
+    a run of MIN_PHONE_DIGITS+ digits also matches a phone prefix or suffix.
+    """
+    tokens = tokenize(query)[:MAX_QUERY_TOKENS]
+    clauses = []
+    if tokens:
+        clauses.append({'search.tokens': {'$all': [re.compile('^' + re.escape(t)) for t in tokens]}})
+    digits = normalize_phone(query) if phone else ''
+    if len(digits) >= MIN_PHONE_DIGITS:
+        clauses.append({'search.phone': {'$regex': '^' + digits}})
+        clauses.append({'search.phone_rev': {'$regex': '^' + digits[::-1]}})
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {'$or': clauses}
+
+
+def score(doc, query):
+    """Relevance of `doc` (with a `search` subdocument) for `query`; higher is better."""
+    keys = doc.get('search') or {}
+    doc_tokens = keys.get('tokens') or []
+    total = 0
+    for tok in tokenize(query)[:MAX_QUERY_TOKENS]:
+        if tok in doc_tokens:
+            total += _SCORE_TOKEN_EXACT
+        elif any(t.startswith(tok) for t in doc_tokens):
+            total += _SCORE_TOKEN_PREFIX
+    digits = normalize_phone(query)
+    stored = keys.get('phone') or ''
+    if stored and len(digits) >= MIN_PHONE_DIGITS:
+        if stored == digits:
+            total += _SCORE_PHONE_EXACT
+        elif stored.startswith(digits):
+            total += _SCORE_PHONE_PREFIX
+        elif stored.endswith(digits):
+            total += _SCORE_PHONE_SUFFIX
+    return total
+
+
+def rank(docs, query, label_field='name'):
+    """Sort candidates by score, then by shorter / alphabetical label."""
+    return sorted(
+        docs,
+        key=lambda d: (-score(d, query), len(d.get(label_field) or ''), fold(d.get(label_field))),
+    )
@@ -0,0 +1,99 @@
+import json
+from datetime import datetime, date
+from bson.objectid import ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except Exception:  # optional fast backend
+    orjson = None
+
+
+def _iso_z(value):
+    return value.isoformat() + 'Z'
+
+
+# Exact-type dispatch: one dict lookup per value instead of hasattr probing.
+_PASSTHROUGH = frozenset((str, int, float, bool, type(None)))
+_CONVERTERS = {
+    ObjectId: str,
+    datetime: _iso_z,
+    date: date.isoformat,  # calendar dates carry no time zone, so no 'Z' (matches orjson)
+}
+
+
+def to_jsonable(value):
+    """
+    Return a JSON-safe copy of a Mongo value: ObjectId -> str, datetime -> ISO 'Z'
+    string, date -> 'YYYY-MM-DD', recursing into dicts and lists. Unknown types are returned unchanged.
+    """
+    t = type(value)
+    if t in _PASSTHROUGH:
+        return value
+    if t is dict:
+        return {k: to_jsonable(v) for k, v in value.items()}
+    if t is list or t is tuple:
+        return [to_jsonable(v) for v in value]
+    converter = _CONVERTERS.get(t)
+    if converter is not None:
+        return converter(value)
+    # Subclasses (SON, bson datetime subclasses, ...) take the slow path
+    if isinstance(value, dict):
+        return {k: to_jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return _iso_z(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    if hasattr(value, 'isoformat') and callable(getattr(value, 'isoformat')):
+        try:
+            return value.isoformat() + 'Z'
+        except Exception:
+            return str(value)
+    return value
+
+
+def serialize_doc(doc):
+    """Serialize a Mongo document for API/socket output (None for empty docs)."""
+    if not doc:
+        return None
+    return to_jsonable(doc)
+
+
+def json_default(value):
+    """`default` hook for json/orjson: handles the BSON types left in a payload."""
+    converter = _CONVERTERS.get(type(value))
+    if converter is not None:
+        return converter(value)
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return DefaultJSONProvider.default(value)
+
+
+class AppJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that understands ObjectId/datetime and uses orjson when installed."""
+
+    default = staticmethod(json_default)
+
+    def dumps(self, obj, **kwargs):
+        # Flask's response() only passes indent (debug) or compact separators
+        if orjson is not None and set(kwargs) <= {'indent', 'separators'}:
+            option = orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            if kwargs.get('indent'):
+                option |= orjson.OPT_INDENT_2
+            try:
+                return orjson.dumps(obj, default=json_default, option=option).decode('utf-8')
+            except TypeError:
+                # e.g. integers beyond 64 bits; fall back to the stdlib encoder
+                pass
+        kwargs.setdefault('default', json_default)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        return json.dumps(obj, **kwargs)
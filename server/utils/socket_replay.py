@@ -0,0 +1,124 @@
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict, deque
+from config import Config
+from utils.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Events a reconnecting dashboard needs to catch up on
+REPLAYED_EVENTS = ('new-message', 'update-conversation')
+
+socket_resume_total = Counter(
+    'socket_resume_total', 'Socket.IO resume requests by result (replayed, gap)',
+    ('result',),
+)
+
+# Sequence numbers restart with the process; the epoch tells a client that
+# its last_seq belongs to another process lifetime (so it must resync).
+EPOCH = uuid.uuid4().hex[:8]
+
+_buffers = OrderedDict()  # organization_id -> _OrgBuffer
+_lock = threading.Lock()
+_seq = 0
+# Highest sequence number held by an organization buffer that was dropped to
+# respect SOCKET_REPLAY_MAX_ORGS; unknown organizations cannot replay past it
+_dropped_upto = 0
+
+
+class _OrgBuffer:
+    __slots__ = ('events', 'evicted_upto')
+
+    def __init__(self):
+        self.events = deque()  # (seq, monotonic time, event, payload)
+        self.evicted_upto = 0
+
+    def prune(self, now):
+        cutoff = now - Config.SOCKET_REPLAY_MAX_AGE_SECONDS
+        while self.events and (len(self.events) > Config.SOCKET_REPLAY_BUFFER_SIZE or self.events[0][1] < cutoff):
+            self.evicted_upto = self.events.popleft()[0]
+
+
+def _format_seq(n):
+    return f"{EPOCH}-{n}"
+
+
+def _parse_seq(value):
+    try:
+        epoch, n = str(value).rsplit('-', 1)
+        return epoch, int(n)
+    except (TypeError, ValueError):
+        return None, None
+
+
+def record(organization_id, event, payload):
+    """Append an org-room event to its ring buffer; returns the sequence string stamped on it."""
+    global _seq, _dropped_upto
+    now = time.monotonic()
+    with _lock:
+        _seq += 1
+        buf = _buffers.get(organization_id)
+        if buf is None:
+            buf = _buffers[organization_id] = _OrgBuffer()
+        buf.events.append((_seq, now, event, payload))
+        buf.prune(now)
+        _buffers.move_to_end(organization_id)
+        while len(_buffers) > Config.SOCKET_REPLAY_MAX_ORGS:
+            _, dropped = _buffers.popitem(last=False)
+            if dropped.events:
+                _dropped_upto = max(_dropped_upto, dropped.events[-1][0])
+        return _format_seq(_seq)
+
+
+def latest_seq():
+    with _lock:
+        return _format_seq(_seq)
+
+
+def events_since(organization_id, last_seq):
+    """
+    Events for `organization_id` after `last_seq` as (event, payload) pairs,
+    oldest first, or None when some may be missing: the sequence is from
+    another process lifetime, or events after it were evicted (buffer size,
+    SOCKET_REPLAY_MAX_AGE_SECONDS, or the organization buffer was dropped).
+    """
+    epoch, n = _parse_seq(last_seq)
+    if epoch != EPOCH or n is None:
+        return None
+    with _lock:
+        if n > _seq:
+            return None
+        buf = _buffers.get(organization_id)
+        if buf is None:
+            return [] if n >= _dropped_upto else None
+        buf.prune(time.monotonic())
+        if n < buf.evicted_upto:
+            return None
+        return [(event, payload) for seq, _, event, payload in buf.events if seq > n]
+
+
+def install(socketio):
+    """
+    Record org-room new-message / update-conversation emits for replay and stamp
+    them with an `event_seq` the client echoes back in `resume`.
+    Returns the unwrapped emit, used to replay without re-recording.
+    """
+    original_emit = socketio.emit
+
+    def emit(event, *args, **kwargs):
+        room = kwargs.get('room') or kwargs.get('to')
+        if event in REPLAYED_EVENTS and isinstance(room, str) and room.startswith('organization:') and args:
+            payload = args[0]
+            if isinstance(payload, dict):
+                payload = dict(payload)
+                try:
+                    payload['event_seq'] = record(room.split(':', 1)[1], event, payload)
+                except Exception as e:
+                    logger.warning(f"Failed to record {event} for replay: {e}")
+                args = (payload,) + tuple(args[1:])
+        return original_emit(event, *args, **kwargs)
+
+    socketio.emit = emit
+    return original_emit
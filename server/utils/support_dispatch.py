@@ -106,6 +106,7 @@ def _build_pending_message(mongo_client, organization_id, conv_id, index):
                 skip=0,
                 conversation_id=conv.get('_id'),
                 account_id=None,
+                profile='pane',
             )
             if recent_msgs:
                 # recent_msgs is sorted from oldest -> newest (see MessageModel.get_messages),
@@ -155,3 +155,79 @@ def remove_pending_support(organization_id: str, conv_id: str):
     set_pending_support_list(organization_id, items, ex=DEFAULT_PENDING_TTL_SECONDS)
     return items
 
+
+
+def hand_over_to_staff(mongo_client, platform, oa_id, customer_platform_id, question,
+                       organization_id=None, account_id=None, conversation_id=None,
+                       socketio=None, notify=False):
+    """Turn the bot off for a conversation, tag it bot-failed, queue it for support and alert staff.
+
+    Shared by the Zalo, Facebook and widget auto-reply workers. The conversation
+    is looked up by oa_id + customer unless `conversation_id` is given. `notify`
+    also emits update-conversation, for callers that send no reply of their own.
+    """
+    try:
+        from bson.objectid import ObjectId
+        from models.conversation import ConversationModel
+        from utils.support_dispatch import dispatch_support_needed
+
+        conv_model = ConversationModel(mongo_client)
+        customer_id = f"{platform}:{customer_platform_id}"
+        conv_id = f"{platform}:{oa_id}:{customer_platform_id}"
+        if conversation_id:
+            conv = {'_id': str(conversation_id)}
+        else:
+            conv = conv_model.find_by_oa_and_customer(oa_id, customer_id, organization_id=organization_id, account_id=account_id)
+        if not conv or not conv.get('_id'):
+            return
+        org_id = organization_id or conv.get('organizationId')
+
+        try:
+            conv_model.set_bot_reply_by_id(conv.get('_id'), False, account_id=account_id, organization_id=organization_id)
+        except Exception:
+            pass
+        # After set_bot_reply_by_id, which unsets tags on conversations without a handler
+        try:
+            try:
+                conv_obj_id = ObjectId(conv.get('_id'))
+            except Exception:
+                conv_obj_id = conv.get('_id')
+            conv_model.set_tags_by_id(conv_obj_id, 'bot-failed')
+        except Exception:
+            pass
+        try:
+            add_pending_support(org_id, conv_id)
+        except Exception:
+            pass
+        try:
+            dispatch_support_needed(
+                mongo_client,
+                org_id,
+                conv_id,
+                customer_name=(conv.get('customer_info') or {}).get('name'),
+                content=question,
+                platform=platform,
+                socketio=socketio
+            )
+        except Exception:
+            pass
+
+        if notify and socketio:
+            payload = {
+                'conversation_id': conv.get('_id'),
+                'conv_id': conv_id,
+                'oa_id': oa_id,
+                'customer_id': customer_id,
+                'tags': 'bot-failed',
+                'bot_reply': False,
+                'platform': platform,
+            }
+            rooms = [f"account:{account_id}" if account_id else None, f"organization:{org_id}" if org_id else None]
+            for room in rooms:
+                if room:
+                    try:
+                        socketio.emit('update-conversation', payload, room=room)
+                    except Exception as e:
+                        logger.debug(f"update-conversation emit to {room} failed: {e}")
+    except Exception as e:
+        logger.error(f"Failed to hand {platform} conversation over to staff: {e}")
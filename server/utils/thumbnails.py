@@ -0,0 +1,119 @@
+import os
+import logging
+import tempfile
+import threading
+from config import Config
+
+try:
+    from PIL import Image, ImageOps
+except Exception:  # optional dependency; originals are served without it
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Square thumbnail edge length (px) per `size` query value
+SIZES = {
+    'sm': 64,
+    'md': 128,
+    'lg': 256,
+}
+FORMATS = {
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+
+# Bounds how many images are decoded/resized at once
+_slots = threading.BoundedSemaphore(max(1, Config.THUMBNAIL_WORKERS))
+
+
+def available():
+    return Image is not None
+
+
+def pick_format(requested, accept_header):
+    """Explicit ?format= wins; otherwise WebP for clients that accept it, else JPEG."""
+    if requested in FORMATS:
+        return requested
+    if accept_header and 'image/webp' in accept_header:
+        return 'webp'
+    return 'jpeg'
+
+
+def thumbnail_path(key, size, fmt):
+    return os.path.join(Config.THUMBNAIL_DIR, size, f"{key}.{fmt}")
+
+
+def _offload(func, *args):
+    """Run CPU-bound work on a real OS thread so the eventlet hub keeps serving."""
+    try:
+        from eventlet import tpool
+        return tpool.execute(func, *args)
+    except ImportError:
+        return func(*args)
+
+
+def _render(src_path, dest_path, edge, fmt):
+    with Image.open(src_path) as img:
+        img = ImageOps.exif_transpose(img)
+        if fmt == 'jpeg' and img.mode not in ('RGB', 'L'):
+            # JPEG has no alpha: flatten onto white
+            img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1])
+            img = background
+        elif img.mode not in ('RGB', 'RGBA', 'L'):
+            img = img.convert('RGBA')
+        thumb = ImageOps.fit(img, (edge, edge), Image.LANCZOS)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest_path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if fmt == 'webp':
+                    thumb.save(f, 'WEBP', quality=Config.THUMBNAIL_JPEG_QUALITY, method=4)
+                else:
+                    thumb.save(f, 'JPEG', quality=Config.THUMBNAIL_JPEG_QUALITY, optimize=True, progressive=True)
+            os.replace(tmp_path, dest_path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+def ensure_thumbnail(src_path, key, size, fmt):
+    """
+    Return the path of the cached `size`/`fmt` thumbnail for `key`, rendering it
+    from `src_path` if needed. Returns None when it cannot be produced (no Pillow,
+    unknown size, unreadable source) so callers can fall back to the original.
+    """
+    if Image is None or size not in SIZES or fmt not in FORMATS:
+        return None
+    dest = thumbnail_path(key, size, fmt)
+    if os.path.exists(dest):
+        return dest
+    if not os.path.exists(src_path):
+        return None
+    with _slots:
+        if os.path.exists(dest):
+            return dest
+        try:
+            _offload(_render, src_path, dest, SIZES[size], fmt)
+        except Exception as e:
+            logger.warning(f"Thumbnail {size}/{fmt} for {key} failed: {e}")
+            return None
+    return dest
+
+
+def _generate_all(src_path, key):
+    for size in SIZES:
+        for fmt in FORMATS:
+            ensure_thumbnail(src_path, key, size, fmt)
+
+
+def schedule_thumbnails(src_path, key):
+    """Pre-render every size/format in the background after an upload."""
+    if Image is None:
+        return
+    threading.Thread(target=_generate_all, args=(src_path, key), daemon=True).start()
+
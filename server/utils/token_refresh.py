@@ -0,0 +1,125 @@
+import os
+import time
+import random
+import socket
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from config import Config
+from utils.metrics import Counter, Histogram
+from utils.mongo_monitor import job_context
+
+logger = logging.getLogger(__name__)
+
+token_refresh_total = Counter(
+    'token_refresh_total', 'Integration token refreshes by platform and outcome',
+    ('platform', 'outcome'),
+)
+token_refresh_duration = Histogram(
+    'token_refresh_duration_seconds', 'Latency of platform token refresh calls',
+    ('platform',),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0),
+)
+
+# Identifies this process as the holder of refresh leases
+_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _backoff_seconds(consecutive_failures):
+    return min(60 * (2 ** consecutive_failures), Config.TOKEN_REFRESH_MAX_BACKOFF_SECONDS)
+
+
+def _refresh_one(integration_model, platform, item, refresh_fn):
+    integration_id = item.get('_id')
+    if Config.TOKEN_REFRESH_JITTER_SECONDS > 0:
+        # Spread provider calls so a batch of integrations doesn't burst at once
+        time.sleep(random.uniform(0, Config.TOKEN_REFRESH_JITTER_SECONDS))
+
+    start = time.perf_counter()
+    try:
+        result = refresh_fn(item)
+        if not result or not result.get('access_token'):
+            raise RuntimeError(f"refresh returned no access_token: {result}")
+    except Exception as e:
+        elapsed = time.perf_counter() - start
+        failures = ((item.get('token_refresh') or {}).get('consecutive_failures') or 0) + 1
+        retry_at = datetime.utcnow() + timedelta(seconds=_backoff_seconds(failures))
+        token_refresh_duration.observe(elapsed, (platform,))
+        token_refresh_total.inc((platform, 'failure'))
+        integration_model.record_refresh_failure(integration_id, e, latency_ms=round(elapsed * 1000.0, 1), retry_at=retry_at)
+        logger.error(f"{platform} token refresh failed for {item.get('oa_id')} ({integration_id}): {e}; retry after {retry_at}")
+        return False
+
+    elapsed = time.perf_counter() - start
+    token_refresh_duration.observe(elapsed, (platform,))
+    token_refresh_total.inc((platform, 'success'))
+    integration_model.record_refresh_success(
+        integration_id,
+        access_token=result.get('access_token'),
+        refresh_token=result.get('refresh_token'),
+        expires_in=result.get('expires_in'),
+        latency_ms=round(elapsed * 1000.0, 1),
+    )
+    logger.info(f"Refreshed {platform} token for {item.get('oa_id')} ({integration_id}) in {elapsed * 1000.0:.0f} ms")
+    return True
+
+
+def run_token_refresh(mongo_client, platform, refresh_fn):
+    """
+    Refresh every expiring integration of `platform` that this process can lease.
+
+    `refresh_fn(integration_doc)` performs the provider call and returns
+    {'access_token', 'refresh_token' (optional), 'expires_in' (optional)} or raises.
+    Integrations are claimed one at a time with a `refresh_lock_until` lease, so
+    concurrent schedulers (other processes) never refresh the same integration;
+    failures keep the lease until an exponential backoff elapses.
+    Returns (succeeded, failed) counts.
+    """
+    from models.integration import IntegrationModel
+
+    integration_model = IntegrationModel(mongo_client)
+    cutoff = datetime.utcnow() + timedelta(seconds=Config.TOKEN_REFRESH_LEAD_SECONDS)
+
+    handled = set()
+    handled_lock = threading.Lock()
+
+    def claim():
+        with handled_lock:
+            exclude = list(handled)
+        item = integration_model.claim_for_refresh(
+            platform, cutoff, Config.TOKEN_REFRESH_LEASE_SECONDS, _OWNER, exclude_ids=exclude,
+        )
+        if item:
+            # A token that comes back with a short expiry must not be re-claimed in this run
+            with handled_lock:
+                handled.add(item['_id'])
+        return item
+
+    def worker():
+        # Each worker keeps claiming until nothing is due, so concurrency stays bounded
+        ok = failed = 0
+        with job_context(f"{platform}_token_refresh"):
+            while True:
+                try:
+                    item = claim()
+                except Exception as e:
+                    logger.error(f"Failed to claim {platform} integration for refresh: {e}")
+                    break
+                if not item:
+                    break
+                if _refresh_one(integration_model, platform, item, refresh_fn):
+                    ok += 1
+                else:
+                    failed += 1
+        return ok, failed
+
+    workers = max(1, Config.TOKEN_REFRESH_CONCURRENCY)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = [f.result() for f in [pool.submit(worker) for _ in range(workers)]]
+
+    succeeded = sum(r[0] for r in results)
+    failed = sum(r[1] for r in results)
+    if succeeded or failed:
+        logger.info(f"{platform} token refresh: {succeeded} refreshed, {failed} failed")
+    return succeeded, failed
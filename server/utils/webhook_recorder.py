@@ -0,0 +1,74 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Keys whose values identify people/pages and are replaced by stable pseudonyms,
+# so a recorded corpus keeps the relationships between events (same sender,
+# same OA) without carrying real ids.
+_ID_KEYS = {
+    'id', 'oa_id', 'page_id', 'user_id', 'user_id_by_app', 'app_id', 'sender', 'recipient',
+    'msg_id', 'mid', 'message_id', 'attachment_id', 'sticker_id', 'organizationId',
+}
+_TEXT_KEYS = {'text', 'message', 'name', 'display_name', 'phone', 'title', 'description'}
+_URL_RE = re.compile(r'https?://\S+')
+_WIDGET_CONV_RE = re.compile(r'(widget:[^:/]+:)([^/]+)')
+_RECORD_HEADERS = ('Content-Type', 'X-Organization-ID', 'X-Chatbot-ID')
+_write_lock = threading.Lock()
+
+
+def _pseudonym(value):
+    digest = hashlib.sha256(f"{Config.SECRET_KEY}:{value}".encode('utf-8')).hexdigest()
+    # Keep ids numeric-looking (Zalo/Facebook ids are digit strings)
+    return str(int(digest[:15], 16))
+
+
+def sanitize_payload(value, key=None):
+    """Return a copy of a webhook body with ids pseudonymized and free text masked."""
+    if isinstance(value, dict):
+        return {k: sanitize_payload(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [sanitize_payload(v, key) for v in value]
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and key in _ID_KEYS:
+        return int(_pseudonym(value))
+    if not isinstance(value, str):
+        return value
+    if key in _ID_KEYS:
+        return _pseudonym(value)
+    if _URL_RE.match(value):
+        return 'https://example.invalid/' + _pseudonym(value)
+    if key in _TEXT_KEYS:
+        # Preserve length so payload sizes stay realistic
+        return 'x' * len(value)
+    return value
+
+
+def record_webhook(platform, path, headers, body):
+    """
+    Append a sanitized webhook request to WEBHOOK_RECORD_DIR/<platform>.jsonl.
+    No-op unless WEBHOOK_RECORD_DIR is configured.
+    """
+    record_dir = Config.WEBHOOK_RECORD_DIR
+    if not record_dir or body is None:
+        return
+    try:
+        path = _WIDGET_CONV_RE.sub(lambda m: m.group(1) + _pseudonym(m.group(2)), path or '')
+        entry = {
+            'platform': platform,
+            'path': path,
+            'headers': {h: sanitize_payload(headers.get(h), 'id' if h != 'Content-Type' else None)
+                        for h in _RECORD_HEADERS if headers.get(h)},
+            'body': sanitize_payload(body),
+        }
+        os.makedirs(record_dir, exist_ok=True)
+        line = json.dumps(entry, ensure_ascii=False)
+        with _write_lock:
+            with open(os.path.join(record_dir, f"{platform}.jsonl"), 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+    except Exception as e:
+        logger.warning(f"Failed to record {platform} webhook: {e}")
@@ -0,0 +1,231 @@
+"""
+Zalo OA webhook payload normalizer.
+
+Zalo delivers several payload shapes (top-level ``event_name`` events and an
+older nested ``data`` envelope). Instead of probing every shape with chained
+``.get()`` calls on each request, known event names are mapped once to an
+extractor, and every payload is turned into a small ``ZaloEvent`` object.
+
+This module has no Flask/Mongo dependencies so it can be reused by the
+replay/benchmark tooling under ``tools/``.
+"""
+
+USER_SEND_EVENTS = (
+    'user_send_text', 'user_send_image', 'user_send_link', 'user_send_audio',
+    'user_send_video', 'user_send_sticker', 'user_send_location', 'user_send_file',
+    'user_send_gif', 'user_send_business_card',
+)
+
+OA_SEND_EVENTS = (
+    'oa_send_text', 'oa_send_image', 'oa_send_list', 'oa_send_gif',
+    'oa_send_file', 'oa_send_sticker', 'oa_send_template',
+)
+
+
+class ZaloEvent:
+    """Normalized view of one Zalo webhook payload."""
+
+    __slots__ = (
+        'event_name', 'oa_id', 'sender_id', 'recipient_id', 'direction',
+        'text', 'msg_id', 'message_obj', 'image_url', 'timestamp',
+    )
+
+    def __init__(self, event_name=None, oa_id=None, sender_id=None, recipient_id=None,
+                 direction='in', text=None, msg_id=None, message_obj=None,
+                 image_url=None, timestamp=None):
+        self.event_name = event_name
+        self.oa_id = oa_id
+        self.sender_id = sender_id
+        self.recipient_id = recipient_id
+        self.direction = direction
+        self.text = text
+        self.msg_id = msg_id
+        self.message_obj = message_obj
+        self.image_url = image_url
+        self.timestamp = timestamp
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __repr__(self):
+        return (f"ZaloEvent(event_name={self.event_name!r}, oa_id={self.oa_id!r}, "
+                f"sender_id={self.sender_id!r}, recipient_id={self.recipient_id!r}, "
+                f"direction={self.direction!r}, msg_id={self.msg_id!r})")
+
+
+def _dict(value):
+    return value if isinstance(value, dict) else {}
+
+
+def _id_or_value(value):
+    """Zalo sends either {'id': ...} or a bare id for sender/recipient."""
+    if isinstance(value, dict):
+        return value.get('id')
+    return value
+
+
+def _oa_id(data):
+    return (
+        data.get('oa_id')
+        or data.get('page_id')
+        or _dict(data.get('recipient')).get('id')
+        or _dict(data.get('to')).get('id')
+        or _dict(data.get('data')).get('oa_id')
+    )
+
+
+def _image_url(message_obj):
+    """Return the first media URL found in the message attachments, if any."""
+    if not message_obj:
+        return None
+    attachments = message_obj.get('attachments')
+    if not isinstance(attachments, list):
+        att = message_obj.get('attachment')
+        if isinstance(att, dict):
+            attachments = [att]
+        elif isinstance(att, list):
+            attachments = att
+        else:
+            return None
+
+    for att in attachments:
+        if not isinstance(att, dict):
+            continue
+        payload = att.get('payload')
+        if not isinstance(payload, dict):
+            continue
+        url = payload.get('url') or payload.get('href') or payload.get('thumbnail')
+        if url:
+            return url
+        for el in payload.get('elements') or []:
+            if not isinstance(el, dict):
+                continue
+            media = el.get('media') or el.get('media_content')
+            if isinstance(media, dict):
+                url = media.get('url') or media.get('src') or media.get('thumbnail')
+                if url:
+                    return url
+    return None
+
+
+# ---- top-level (event_name) extractors ----
+
+def _top_level_event(data, event_name, oa_id):
+    message = data.get('message')
+    message_obj = message if isinstance(message, dict) else None
+    return ZaloEvent(
+        event_name=event_name,
+        oa_id=oa_id,
+        text=_dict(message).get('text') or data.get('text'),
+        msg_id=_dict(message).get('msg_id'),
+        message_obj=message_obj,
+        image_url=_image_url(message_obj),
+        timestamp=data.get('timestamp'),
+    )
+
+
+def _extract_user_send(data, event_name, oa_id):
+    evt = _top_level_event(data, event_name, oa_id)
+    evt.sender_id = _id_or_value(data.get('sender')) or data.get('user_id')
+    evt.recipient_id = _dict(data.get('recipient')).get('id') or _dict(data.get('to')).get('id')
+    evt.direction = 'in'
+    return evt
+
+
+def _extract_oa_send(data, event_name, oa_id):
+    evt = _top_level_event(data, event_name, oa_id)
+    evt.recipient_id = (
+        _dict(data.get('recipient')).get('id')
+        or _dict(data.get('to')).get('id')
+        or data.get('user_id')
+    )
+    evt.sender_id = oa_id
+    evt.direction = 'out'
+    return evt
+
+
+def _extract_generic(data, event_name, oa_id):
+    evt = _top_level_event(data, event_name, oa_id)
+    evt.sender_id = (
+        _id_or_value(data.get('sender'))
+        or data.get('user_id')
+        or _dict(data.get('from')).get('id')
+    )
+    evt.recipient_id = _dict(data.get('recipient')).get('id') or _dict(data.get('to')).get('id')
+    return evt
+
+
+_EXTRACTORS = {}
+_EXTRACTORS.update({name: _extract_user_send for name in USER_SEND_EVENTS})
+_EXTRACTORS.update({name: _extract_oa_send for name in OA_SEND_EVENTS})
+_MAX_EXTRACTORS = 256
+
+
+def _resolve_extractor(event_name):
+    """Pick an extractor for an event name, memoizing unknown names by prefix."""
+    extractor = _EXTRACTORS.get(event_name)
+    if extractor is not None:
+        return extractor
+    if event_name.startswith('user'):
+        extractor = _extract_user_send
+    elif event_name.startswith('oa') or event_name.startswith('bot'):
+        extractor = _extract_oa_send
+    else:
+        extractor = _extract_generic
+    if len(_EXTRACTORS) < _MAX_EXTRACTORS:
+        _EXTRACTORS[event_name] = extractor
+    return extractor
+
+
+# ---- nested (data envelope) extractor ----
+
+def _extract_nested(data, d, oa_id):
+    dtype = d.get('type') or d.get('event') or d.get('event_name')
+    message_obj = d.get('message') or d
+    if not isinstance(message_obj, dict):
+        message_obj = d
+    evt = ZaloEvent(
+        event_name=data.get('event') or data.get('event_name') or d.get('event') or d.get('type'),
+        oa_id=oa_id,
+        text=d.get('text') or d.get('message'),
+        msg_id=message_obj.get('msg_id'),
+        message_obj=message_obj,
+        image_url=_image_url(message_obj),
+        timestamp=data.get('timestamp') or d.get('timestamp'),
+    )
+    if dtype and 'user' in dtype and 'send' in dtype:
+        evt.event_name = dtype
+        evt.sender_id = _id_or_value(d.get('sender')) or d.get('user_id')
+        evt.recipient_id = _id_or_value(d.get('recipient')) or _dict(d.get('to')).get('id')
+        evt.direction = 'in'
+    elif dtype and ('oa' in dtype or 'bot' in dtype) and ('send' in dtype or 'reply' in dtype):
+        evt.event_name = dtype
+        evt.recipient_id = (
+            _id_or_value(d.get('recipient'))
+            or d.get('user_id')
+            or _dict(d.get('to')).get('id')
+        )
+        evt.sender_id = oa_id or _dict(d.get('sender')).get('id')
+        evt.direction = 'out'
+    else:
+        evt.sender_id = (
+            _id_or_value(d.get('sender'))
+            or d.get('user_id')
+            or _dict(d.get('from')).get('id')
+        )
+        evt.recipient_id = _id_or_value(d.get('recipient')) or _dict(d.get('to')).get('id')
+    return evt
+
+
+def normalize_zalo_event(data):
+    """Normalize a raw Zalo webhook body into a ZaloEvent."""
+    if not isinstance(data, dict):
+        return ZaloEvent()
+    oa_id = _oa_id(data)
+    d = data.get('data')
+    if isinstance(d, dict):
+        return _extract_nested(data, d, oa_id)
+    event_name = data.get('event_name') or data.get('event')
+    if not event_name or not isinstance(event_name, str):
+        return _extract_generic(data, event_name, oa_id)
+    return _resolve_extractor(event_name)(data, event_name, oa_id)